@@ -1,18 +1,31 @@
 import sys
 import argparse
-import pandas
 import ctypes
+import contextlib
+import io
 import subprocess
+import shutil
+import tempfile
+import threading
+import time
 from pathlib import Path
-from colorama import init, Fore
+from colorama import init, Fore, AnsiToWin32
 from datetime import datetime
 from zipfile import ZipFile
-import pyfiglet
 import tarfile
 import csv
-from search.search import write_csv, find_hits
-
-init(autoreset=True)
+import os
+import re
+from collections import Counter, namedtuple
+from functools import partial
+from artifacts.extract import extract_tar, extract_zip, safe_extract, select_names
+from artifacts.index import ArtifactIndex
+from runner.cache import ToolCache, MAX_GB
+from runner.manifest import RunManifest, unfinished
+from runner.metrics import Metrics
+from runner.tools import ToolProgress, ToolTimeouts, PROGRESS, RATES, input_size, run_streamed, tool_key
+from runner.scheduler import Scheduler, Stage
+from runner.watch import IntakeWatcher, STATUS
 
 example_text = '''
 Examples:
@@ -23,16 +36,86 @@ python PackageParser.py -s \\path\\to\\archives -o \\path\\to\\out -p <password>
 Extract and process an individual package and search output:
 python PackageParser.py -s \\path\\to\\archive.7z -o \\path\\to\\out -p <password> --search
 
+Search the text files in a package without extracting or parsing it:
+python PackageParser.py -s \\path\\to\\archive.7z -o \\path\\to\\out -p <password> --search-only
+
+Keep running and process packages as they are copied to an intake directory:
+python PackageParser.py -s \\path\\to\\intake -o \\path\\to\\out -p <password> --watch --jobs 2
+
 '''
 
 
+class PackageError(Exception):
+    """a package can't be processed (e.g. extraction failed). other packages in a batch carry on"""
+
+
+# folder in the package output that stages split per artifact instance write to before their output is merged
+INSTANCES = 'Instances'
+
+
+class Job(namedtuple('Job', ['tool', 'switch', 'target', 'out_path', 'artifact', 'inputs', 'extra', 'resource'],
+                     defaults=[(), None])):
+    """
+    One EZ tool run on one instance of an artifact: a file (-f) or a folder (-d).
+    resource: Scheduler resource class when the run gets its own stage. None uses the parse stage's
+    """
+
+    def command(self):
+        return [str(self.tool), self.switch, '"' + str(self.target) + '"', '--csv', str(self.out_path), *self.extra]
+
+    def folder(self):
+        """:return: folder the instance was found in"""
+        return Path(self.target) if self.switch == '-d' else Path(self.target).parent
+
+
+def instance_label(folder, package):
+    """:return: name for an artifact instance from its folder in the package, e.g. VSS1_C_Windows_Prefetch"""
+    try:
+        parts = Path(folder).relative_to(package).parts
+    except ValueError:
+        parts = Path(folder).parts[-2:]
+    return re.sub(r'[^\w.$-]+', '_', '_'.join(parts)) or 'root'
+
+
+def by_folder(paths):
+    """:return: {folder: files in it}, in the order folders are first seen"""
+    folders = {}
+    for path in paths:
+        folders.setdefault(path.parent, []).append(path)
+    return folders
+
+
 class PackageParser:
     toolPath = Path.cwd() / 'tools'
-
-    def __init__(self, source, out_dir, password=None, search=None):
-        self.source = source
+    # most EZ tools running at once per resource class. MFT and event logs are the big ones
+    resource_limits = {'heavy': 1}
+    # stages whose work happens in python, profiled with --profile
+    python_stages = ('convert_csv', 'parquet_export', 'compress_output')
+
+    def __init__(self, source, out_dir, password=None, search=None, workers=1, structured=False, tool_workers=1,
+                 resume=False, cache=None, cache_size=MAX_GB, only_artifacts=False,
+                 profile=False, search_index=False, tool_path=None, hit_summary=False, parquet=False, stack=False,
+                 compress=None, search_only=False):
+        self.source = Path(source)
+        if tool_path is not None:
+            self.toolPath = Path(tool_path)
         self.password = password
         self.search = search
+        self.workers = workers
+        self.structured = structured
+        self.search_index = search_index
+        self.hit_summary = hit_summary
+        self.parquet = parquet
+        self.stack = stack
+        self.compress = compress
+        self.search_only = search_only
+        self.tool_workers = tool_workers
+        self.resume = resume
+        self.only_artifacts = only_artifacts
+        self.cache = ToolCache(cache, int(cache_size * 2 ** 30)) if cache else None
+        self.errors = 0
+        self._local = threading.local()
+        self._tools_lock = threading.Lock()
 
         if self.source.suffix == '.7z':
             self.package = Path(str(self.source)[:str(self.source).index('.7z')])
@@ -42,161 +125,364 @@ class PackageParser:
             self.package = Path(str(self.source)[:str(self.source).index('.tar')])
 
         self.out_dir = Path(out_dir) / self.package.name
+        self.index = None
 
         if not self.out_dir.exists():
             self.out_dir.mkdir(parents=True, exist_ok=True)
+        self.manifest = RunManifest.open(self.out_dir, resume)
+        self.metrics = Metrics(self.package.name, self.out_dir / 'Profiles' if profile else None)
+        self.timeouts = ToolTimeouts(Path(out_dir) / RATES)
+        self.progress = ToolProgress(self.out_dir / PROGRESS)
 
         if self.search:
             self.rgx_dict = {}
             self.str_dict = {}
+            self.col_dict = {}
             self.rgx_file = Path.cwd() / 'search' / self.search
 
         print(Fore.LIGHTGREEN_EX + f'\nCreating PackageParser object for package: '
                                    f'' + Fore.LIGHTWHITE_EX + f'{self.source.name}\n')
 
-    def searcher(self):
-        """search parsed output for regex/strings"""
+    def load_rules(self):
+        """
+        read the rules file into rgx_dict, str_dict and col_dict
+        :return: True if the rules file exists
+        """
         if not self.rgx_file.is_file():
             print(Fore.LIGHTRED_EX + f'\nCan\'t find {self.rgx_file.name}. '
                                      f'This file should be placed in the search folder')
-        else:
-            with self.rgx_file.open() as csvfile:
-                reader = csv.reader(csvfile, delimiter=';')
-                try:
-                    for row in reader:
-                        if any(row):  # we want non blank rows
-                            if row[0] == '1':  # regex
-                                self.rgx_dict[row[1]] = row[2]  # {regex: description}
-                            elif row[0] == '0':  # string
-                                self.str_dict[row[1]] = row[2]  # {string: description}
-                except Exception as e:
-                    print(Fore.YELLOW + f'\nFormatting issue with row in {self.rgx_file.name}: ' +
-                          Fore.LIGHTWHITE_EX + f'{e}')
-                    print(Fore.YELLOW + 'Please inspect: ' + Fore.LIGHTWHITE_EX + f'{row}')
+            return False
+        with self.rgx_file.open() as csvfile:
+            reader = csv.reader(csvfile, delimiter=';')
+            try:
+                for row in reader:
+                    if any(row):  # we want non blank rows
+                        if row[0] == '1':  # regex
+                            self.rgx_dict[row[1]] = row[2]  # {regex: description}
+                        elif row[0] == '0':  # string
+                            self.str_dict[row[1]] = row[2]  # {string: description}
+                        if len(row) > 3 and row[3] and row[0] in ('0', '1'):
+                            # {('regex' or 'string', regex/string): columns}
+                            self.col_dict[('regex' if row[0] == '1' else 'string', row[1])] = row[3]
+            except Exception as e:
+                print(Fore.YELLOW + f'\nFormatting issue with row in {self.rgx_file.name}: ' +
+                      Fore.LIGHTWHITE_EX + f'{e}')
+                print(Fore.YELLOW + 'Please inspect: ' + Fore.LIGHTWHITE_EX + f'{row}')
+        return True
 
-            files = [i for i in sorted(self.out_dir.rglob('*.csv'), key=lambda j: j.name) if
-                     'SearchResults' not in i.name]
+    def searcher(self):
+        """
+        search parsed output for regex/strings
+        :return: number of CSV files searched
+        """
+        if self.load_rules():
+            from search.compressed import csv_files
+            from search.writer import is_report
+
+            files = [i for i in sorted(csv_files(self.out_dir), key=lambda j: j.name) if not is_report(i)]
+            if self.structured:
+                from search.structured import prefer_parquet
+                files = prefer_parquet(files, self.out_dir)
 
             if len(files) > 0:
                 print(Fore.LIGHTWHITE_EX + f'\nSearch options selected. Using {self.rgx_file.name} as input file.')
-                hit_list, rgx_errors = find_hits(files, self.rgx_dict, self.str_dict)
+                from search.search import stream_hits
+
+                hits, rgx_errors = stream_hits(files, self.rgx_dict, self.str_dict, self.out_dir, self.workers,
+                                               self.col_dict, self.structured,
+                                               self.out_dir if self.search_index else None, self.hit_summary)
 
                 rgx_errors = list(set(rgx_errors))
                 if len(rgx_errors) > 0:
                     for i in rgx_errors:
                         print(Fore.LIGHTRED_EX + f'[x] ERROR compiling regex: {i}')
 
-                if len(hit_list) > 0:
-                    write_csv(hit_list, self.out_dir)
-                else:
+                if hits == 0:
                     print(Fore.YELLOW + '\nNo matches found.')
             else:
                 print(Fore.YELLOW + f'\nNo CSV files found in {self.out_dir}')
+            return len(files)
+
+    def archive_searcher(self):
+        """
+        search the text files in the package archive (QueryResults, logs, CSVs...) for regex/strings without
+        extracting it or running any tools. the archive is left where it is
+        """
+        if not self.load_rules():
+            return
+        from search.search import stream_archive_hits
+
+        print(Fore.LIGHTWHITE_EX + f'\nSearching {self.source.name} in place. Using {self.rgx_file.name} as input file.')
+        hits, rgx_errors, archive_errors = stream_archive_hits([self.source], self.rgx_dict, self.str_dict,
+                                                               self.out_dir, self.workers, self.password,
+                                                               self.hit_summary, self.toolPath / 'sevenZip/7za.exe')
+        for i in set(rgx_errors):
+            print(Fore.LIGHTRED_EX + f'[x] ERROR compiling regex: {i}')
+        for _, error in archive_errors:
+            self.logger('ERROR', f'Can\'t search {self.source.name}: {error}')
+        if hits == 0:
+            print(Fore.YELLOW + '\nNo matches found.')
+
+    def discover(self):
+        """index every artifact in the extracted package with one directory walk"""
+        index_file = self.out_dir / 'ArtifactIndex.json'
+        if self.resume and self.manifest.get('indexed') and index_file.is_file():
+            self.index = ArtifactIndex.load(index_file)
+        else:
+            self.index = ArtifactIndex.build(self.package)
+            self.index.save(index_file)
+            self.manifest.update(indexed=str(self.index.built))
+        found = ', '.join(f'{len(v)} {k}' for k, v in self.index.buckets.items() if v)
+        self.logger('INFO', f'Indexed {self.index.files} files in {self.package.name}: {found or "no artifacts"}')
+
+    def artifacts(self, bucket):
+        """:return: paths in an ArtifactIndex bucket. builds the index on first use"""
+        if self.index is None:
+            self.discover()
+        self.track('inputs', self.index.get(bucket))
+        return self.index.get(bucket)
+
+    def track(self, kind, paths):
+        """record artifacts (inputs) or output folders (output_dirs) of the running stage in the manifest"""
+        stage = getattr(self._local, 'stage', None)
+        if stage is not None:
+            root = self.package if kind == 'inputs' else self.out_dir
+            self.manifest.add(stage, kind, paths, root)
 
     def logger(self, lev, msg):
         line = str(datetime.now().replace(microsecond=0)) + ' | ' + lev + ': ' + msg
-        log_path = self.out_dir / 'PackageParser.log'
 
         if lev == 'SUCCESS':
             print(Fore.LIGHTGREEN_EX + line)
         elif lev == 'NOTICE':
             print(Fore.LIGHTYELLOW_EX + line)
         elif lev == 'ERROR':
+            self.errors += 1
+            self._local.errors = getattr(self._local, 'errors', 0) + 1
             print(Fore.LIGHTRED_EX + line)
         elif lev == 'INFO':
             print(Fore.LIGHTMAGENTA_EX + line)
         elif lev == 'DONE':
             print(Fore.LIGHTCYAN_EX + line)
+
+        lines = getattr(self._local, 'lines', None)
+        if lines is not None:  # inside a scheduled stage. written in stage order by run_all
+            lines.append(line)
+        else:
+            self.write_log([line])
+
+    def write_log(self, lines):
+        log_path = self.out_dir / 'PackageParser.log'
         try:
             with log_path.open('a', encoding='utf-8', newline='') as fh:
-                fh.write(line + '\r\n')
+                for line in lines:
+                    fh.write(line + '\r\n')
         except Exception as e:
             print(Fore.LIGHTRED_EX + f'\nERROR: {e}')
 
-    def run_simp_command(self, command):
+    def run_logged(self, command, timeout, files=None, size=None, out_path=None):
+        """
+        run an EZ tool, writing its console output to tools.log as it arrives
+        :param timeout: seconds, used when size is None. otherwise the timeout comes from size (see ToolTimeouts)
+        :param files: number of input files, for metrics
+        :param size: input bytes
+        :param out_path: folder the tool writes to, for ToolProgress.json
+        """
+        name = Path(command[0]).name
+        key = tool_key(command)
+        timeout = self.timeouts.timeout(key, size, timeout)
+        stage = getattr(self._local, 'stage', None)
+        start = datetime.now().replace(microsecond=0)
+        wall = time.perf_counter()
+        usage = {}
+        entry = self.progress.start(name, stage, timeout, size, out_path)
+
+        with (self.out_dir / 'tools.log').open('a', encoding='utf-8', errors='replace', newline='') as fh:
+            def write(line):
+                with self._tools_lock:  # tools running at the same time share the log a line at a time
+                    fh.write(f'{name} | {line}\r\n')
+                    fh.flush()
+
+            write(f'==== started {start} | input {size or 0} bytes | timeout {timeout}s')
+            try:
+                spr, usage = run_streamed(command, timeout, write, entry, self.progress.write)
+                write(f'==== exit code {spr.returncode} after {time.perf_counter() - wall:.0f}s')
+                if spr.returncode == 0:
+                    self.timeouts.record(key, size, time.perf_counter() - wall)
+                return spr
+            except subprocess.TimeoutExpired:
+                write(f'==== killed after {timeout}s timeout')
+                self.timeouts.timed_out(key)
+                raise
+            finally:
+                self.progress.finish(entry)
+                self.metrics.add('tool', name, start, time.perf_counter() - wall, stage, files, **usage)
+
+    def run_tool(self, command, timeout, inputs=None, out_path=None, size=None):
+        """
+        Run an EZ tool. With --cache, output the tool made before from the same inputs,
+        tool and arguments is copied to out_path instead
+        :param timeout: seconds, if the input size isn't known
+        :param inputs: every file the output depends on. None never uses the cache
+        :param out_path: folder the tool writes its output to
+        :param size: input bytes the timeout is based on. defaults to the size of inputs
+        """
+        key = None
+        if self.cache is not None and inputs:
+            out_path = Path(out_path)
+            try:
+                key = self.cache.key(command, inputs, self.package, out_path, self.toolPath)
+            except OSError:  # an input can't be read. let the tool report it
+                pass
+        if key is not None:
+            restored = self.cache.restore(key, out_path, self.package)
+            if restored is not None:
+                self.logger('INFO', f'{Path(command[0]).name}: restored {len(restored)} file(s) from cache')
+                self.metrics.add('cached tool', Path(command[0]).name, datetime.now().replace(microsecond=0), 0,
+                                 getattr(self._local, 'stage', None), len(inputs))
+                return
+            before = {p: p.stat().st_mtime_ns for p in out_path.rglob('*') if p.is_file()}
+
+        start = time.monotonic()
+        spr = self.run_logged(command, timeout, len(inputs) if inputs else None,
+                              size if size is not None else input_size(inputs), out_path)
+        spr.check_returncode()
+
+        if key is not None:
+            files = [p for p in out_path.rglob('*') if p.is_file() and before.get(p) != p.stat().st_mtime_ns]
+            self.cache.store(key, files, out_path, self.package, time.monotonic() - start)
+
+    def run_simp_command(self, command, inputs=None, out_path=None, size=None):
         """run subprocess and redirect console output to log"""
-        ez_log = self.out_dir / 'tools.log'
-        with ez_log.open('a') as fh:
-            spr = subprocess.run(command, stdout=fh, stderr=fh, timeout=300)
-            spr.check_returncode()
+        self.run_tool(command, 300, inputs, out_path, size)
 
-    def run_command(self, command, bin_path, artifact, out_path):
+    def run_command(self, command, bin_path, artifact, out_path, inputs=None):
         """run subprocess and redirect console output to log"""
-        ez_log = self.out_dir / 'tools.log'
-        with ez_log.open('a') as fh:
-            try:
-                self.logger('INFO', f'Found {artifact}. Running {bin_path.name}')
-                spr = subprocess.run(command, stdout=fh, stderr=fh, timeout=1200)
-                spr.check_returncode()
-                self.logger('SUCCESS', f'{artifact} output written to {out_path}')
-            except subprocess.CalledProcessError as e:
-                self.logger('ERROR', str(e))
-            except subprocess.TimeoutExpired:
-                self.logger('ERROR', f'{bin_path.name} exceeded 20 minute timeout')
+        try:
+            self.logger('INFO', f'Found {artifact}. Running {bin_path.name}')
+            self.track('output_dirs', [out_path])
+            self.run_tool(command, 1200, inputs, out_path)
+            self.logger('SUCCESS', f'{artifact} output written to {out_path}')
+        except subprocess.CalledProcessError as e:
+            self.logger('ERROR', str(e))
+        except subprocess.TimeoutExpired as e:
+            self.logger('ERROR', f'{bin_path.name} exceeded {e.timeout} second timeout')
+
+    def run_stage(self, stage):
+        """run a scheduled stage, collecting its log lines so they aren't mixed with other stages"""
+        lines = self._local.lines = []
+        if self.resume and self.manifest.done(stage.name):
+            self.logger('INFO', f'{stage.name} already done. Skipping')
+            self._local.lines = None
+            return lines
+
+        # a stage that was interrupted or failed starts again from clean output folders
+        for out in self.manifest.stage(stage.name).get('output_dirs', []):
+            if (self.out_dir / out).is_dir():
+                shutil.rmtree(self.out_dir / out)
+
+        self.manifest.start(stage.name)
+        self._local.stage = stage.name
+        self._local.errors = 0
+        start = datetime.now().replace(microsecond=0)
+        error = None
+        try:
+            with self.metrics.measure('stage', stage.name, profile=stage.name in self.python_stages) as info:
+                try:
+                    stage.func()
+                except Exception as e:
+                    error = str(e)
+                    self.logger('ERROR', f'{stage.name} failed: {e}')
+                info['files'] = len(self.manifest.stage(stage.name).get('inputs', []))
+        finally:
+            status = 'failed' if self._local.errors else 'done'
+            self._local.stage = None
+            self.manifest.finish(stage.name, status, self.out_dir, error)
+            self.logger('INFO', f'{stage.name} finished in {datetime.now().replace(microsecond=0) - start}')
+            self._local.lines = None
+        return lines
 
     def extract_sevenzip(self):
         """extract password protected 7zip archives"""
-        seven_zip = PackageParser.toolPath / 'sevenZip/7za.exe'
+        seven_zip = self.toolPath / 'sevenZip/7za.exe'
         command = [str(seven_zip), 'x', '-spe', '-o' + str(self.source.parent), '-p' + self.password,
                    str(self.source), '-aoa']
         try:
             self.logger('INFO', f'Extracting 7zip: {self.source.name}')
-            self.run_command(command)
+            if self.only_artifacts:
+                with tempfile.TemporaryDirectory() as tmp:
+                    list_file = Path(tmp) / 'artifacts.txt'
+                    listed, selected = self.list_sevenzip(seven_zip, list_file)
+                    self.run_simp_command(command + ['-scsUTF-8', '@' + str(list_file)],
+                                          size=self.source.stat().st_size)
+                self.logger('INFO', f'Extracted {selected} of {listed} files (artifacts only)')
+            else:
+                self.run_simp_command(command, size=self.source.stat().st_size)
             self.logger('SUCCESS', f'Extracted 7zip: {self.source.name}')
             self.source.unlink()
             self.logger('INFO', f'Deleted 7zip Archive: {self.source.name}')
-        except subprocess.CalledProcessError:
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
             self.logger('ERROR', 'Problem extracting 7zip. Check tools.log for details.')
             print(Fore.LIGHTRED_EX + '\nIt was probably your password.')
-            sys.exit()
+            raise PackageError(f'Problem extracting 7zip: {self.source.name}')
+
+    def list_sevenzip(self, seven_zip, list_file):
+        """
+        write the artifact members of a 7zip to list_file, for 7za x @list_file
+        :return: (files in archive, files selected)
+        """
+        command = [str(seven_zip), 'l', '-slt', '-ba', '-p' + self.password, str(self.source)]
+        spr = subprocess.run(command, capture_output=True, timeout=300, encoding='utf-8', errors='replace')
+        spr.check_returncode()
+
+        names = []
+        name = None
+        for line in spr.stdout.splitlines() + ['']:
+            if line.startswith('Path = '):
+                name = line[len('Path = '):]
+            elif line.startswith('Folder = +') or (line.startswith('Attributes = ') and 'D' in line[13:14]):
+                name = None  # folders are created as needed
+            elif not line.strip() and name:
+                names.append(name)
+                name = None
+
+        selected = select_names(names)
+        list_file.write_text('\n'.join(selected) + '\n', encoding='utf-8')
+        return len(names), len(selected)
 
     def extract_tar(self):
         """extract gzipped TAR package"""
         try:
             self.logger('INFO', f'Extracting tar file: {self.source.name}')
-            with tarfile.open(str(self.source)) as tf:
-                
-                import os
-                
-                def is_within_directory(directory, target):
-                    
-                    abs_directory = os.path.abspath(directory)
-                    abs_target = os.path.abspath(target)
-                
-                    prefix = os.path.commonprefix([abs_directory, abs_target])
-                    
-                    return prefix == abs_directory
-                
-                def safe_extract(tar, path=".", members=None, *, numeric_owner=False):
-                
-                    for member in tar.getmembers():
-                        member_path = os.path.join(path, member.name)
-                        if not is_within_directory(path, member_path):
-                            raise Exception("Attempted Path Traversal in Tar File")
-                
-                    tar.extractall(path, members, numeric_owner) 
-                    
-                
-                safe_extract(tf, str(self.package))
+            if self.only_artifacts:
+                selected, listed = extract_tar(str(self.source), str(self.package))
+                self.logger('INFO', f'Extracted {selected} of {listed} files (artifacts only)')
+            else:
+                with tarfile.open(str(self.source)) as tf:
+                    safe_extract(tf, str(self.package))
             self.logger('SUCCESS', f'Extracted tar file: {self.source.name}')
             self.source.unlink()
             self.logger('INFO', f'Deleted tar file: {self.source.name}')
         except Exception as e:
             self.logger('ERROR', 'Problem extracting tar file: ' + str(e))
-            sys.exit()
+            raise PackageError('Problem extracting tar file: ' + str(e))
 
     def extract_zipfile(self):
         """extract .zip no password"""
         try:
             self.logger('INFO', f'Extracting zip file: {self.source.name}')
-            with ZipFile(str(self.source), 'r') as zf:
-                zf.extractall(str(self.package))
+            if self.only_artifacts:
+                selected, listed = extract_zip(str(self.source), str(self.package))
+                self.logger('INFO', f'Extracted {selected} of {listed} files (artifacts only)')
+            else:
+                with ZipFile(str(self.source), 'r') as zf:
+                    zf.extractall(str(self.package))
             self.logger('SUCCESS', f'Extracted zip file: {self.source.name}')
             self.source.unlink()
             self.logger('INFO', f'Deleted zip file: {self.source.name}')
         except Exception as e:
             self.logger('ERROR', 'Problem extracting zip file: ' + str(e))
-            sys.exit()
+            raise PackageError('Problem extracting zip file: ' + str(e))
 
     def convert_csv(self):
         """convert JSON files to CSV"""
@@ -206,202 +492,515 @@ class PackageParser:
 
         if not empty:
             self.logger('INFO', 'Converting Query Results to CSV')
-            if not out_dir.exists():
-                out_dir.mkdir(parents=True, exist_ok=True)
-            for i in query_results.iterdir():
-                out_file = out_dir.joinpath(str(i.stem) + '.csv')
-                try:
-                    with i.open(encoding='utf-8-sig', errors='replace') as fh:
-                        df = pandas.read_json(fh)
-                    df.to_csv(str(out_file), encoding='utf-8', index=False)
-                    # self.logger('SUCCESS', f'Converted: {i}')
-                except Exception as e:
-                    self.logger('ERROR', f'Problem converting: {i} : {str(e)}')
+            files = sorted(i for i in query_results.iterdir() if i.is_file())
+            self.track('inputs', files)
+            self.track('output_dirs', [out_dir])
+            from convert.json2csv import convert_files
+
+            for i, rows, error in convert_files(files, out_dir, self.workers):
+                if error:
+                    self.logger('ERROR', f'Problem converting: {i} : {error}')
             self.logger('SUCCESS', f'JSON 2 CSV Output written to: {out_dir}')
         else:
             self.logger('NOTICE', f'No QueryResults found in package: {self.package.name}. Skipping...')
 
+    def run_jobs(self, jobs):
+        """
+        run EZ tool jobs one after another
+        :return: number of jobs
+        """
+        for job in jobs:
+            self.run_command(job.command(), job.tool, job.artifact, job.out_path, job.inputs)
+        return len(jobs)
+
+    def mft_jobs(self):
+        mftecmd = self.toolPath / 'MFTECmd.exe'
+        return ([Job(mftecmd, '-f', mft, self.out_dir / 'Filesystem/MFT', '$MFT', [mft])
+                 for mft in self.artifacts('mft')] +
+                [Job(mftecmd, '-f', j, self.out_dir / 'Filesystem/UsnJrnl', '$J', [j], resource='light')
+                 for j in self.artifacts('usnjrnl')])
+
     def mft_parse(self):
         """find and parse $MFT and UsnJrnl"""
-        mftecmd = PackageParser.toolPath / 'MFTECmd.exe'
-        mft_list = list(self.package.rglob('$MFT'))
-        j_list = list(self.package.rglob('$J'))
-
-        if mft_list:
-            mft_out = self.out_dir / 'Filesystem/MFT'
-            for mft in mft_list:
-                command = [str(mftecmd), '-f', '"' + str(mft) + '"', '--csv', str(mft_out)]
-                self.run_command(command, mftecmd, '$MFT', str(mft_out))
-
-        if j_list:
-            j_out = self.out_dir / 'Filesystem/UsnJrnl'
-            for j in j_list:
-                command = [str(mftecmd), '-f', '"' + str(j) + '"', '--csv', str(j_out)]
-                self.run_command(command, mftecmd, '$J', str(j_out))
+        self.run_jobs(self.mft_jobs())
 
-    def shim_parse(self):
-        """find and parse SYSTEM hive"""
-        ez_shim = PackageParser.toolPath / 'AppCompatCacheParser.exe'
-        empty = not bool(list(i for i in self.package.rglob('SYSTEM') if i.is_file()))
+    def shim_jobs(self):
+        ez_shim = self.toolPath / 'AppCompatCacheParser.exe'
+        return [Job(ez_shim, '-f', hive, self.out_dir / 'ProgramExecution/Shimcache', 'SYSTEM Hive (shimcache',
+                    [hive], ('--nl',)) for hive in self.artifacts('system')]
 
-        if not empty:
-            shim_path = list(i for i in self.package.rglob('SYSTEM') if i.is_file())
-            shim_out = self.out_dir / 'ProgramExecution/Shimcache'
-            command = [str(ez_shim), '-f', '"' + str(shim_path[0]) + '"', '--csv', str(shim_out), '--nl']
-            self.run_command(command, ez_shim, 'SYSTEM Hive (shimcache', shim_out)
-        else:
+    def shim_parse(self):
+        """find and parse SYSTEM hives"""
+        if not self.run_jobs(self.shim_jobs()):
             self.logger('NOTICE', f'No SYSTEM file found in package: {self.package.name}. Skipping...')
 
+    def amcache_jobs(self):
+        ez_amc = self.toolPath / 'AmcacheParser.exe'
+        return [Job(ez_amc, '-f', amc, self.out_dir / 'ProgramExecution/Amcache', 'Amcache.hve', [amc], ('--nl',))
+                for amc in self.artifacts('amcache')]
+
     def amcache_parse(self):
         """find and parse Amcache"""
-        ez_amc = PackageParser.toolPath / 'AmcacheParser.exe'
-        empty = not bool(list(self.package.rglob('Amcache.hve')))
-
-        if not empty:
-            amc_path = self.package.rglob('Amcache.hve')
-            amc_out = self.out_dir / 'ProgramExecution/Amcache'
-            command = [str(ez_amc), '-f', '"' + str(next(amc_path)) + '"', '--csv', str(amc_out), '--nl']
-            self.run_command(command, ez_amc, 'Amcache.hve', amc_out)
-        else:
+        if not self.run_jobs(self.amcache_jobs()):
             self.logger('NOTICE', f'No Amcache.hve found in package: {self.package.name}. Skipping...')
 
+    def rfc_jobs(self):
+        ez_rfc = self.toolPath / 'RecentFileCacheParser.exe'
+        return [Job(ez_rfc, '-f', rfc, self.out_dir / 'ProgramExecution/RecentFileCache', 'RecentFileCache.bcf',
+                    [rfc]) for rfc in self.artifacts('recentfilecache')]
+
     def rfc_parse(self):
         """find and parse RecentFileCache"""
-        ez_rfc = PackageParser.toolPath / 'RecentFileCacheParser.exe'
-        empty = not bool(list(self.package.rglob('RecentFileCache.bcf')))
-
-        if not empty:
-            rfc_path = self.package.rglob('RecentFileCache.bcf')
-            rfc_out = self.out_dir / 'ProgramExecution/RecentFileCache'
-            command = [str(ez_rfc), '-f', '"' + str(next(rfc_path)) + '"', '--csv', str(rfc_out)]
-            self.run_command(command, ez_rfc, 'RecentFileCache.bcf', rfc_out)
-        else:
+        if not self.run_jobs(self.rfc_jobs()):
             self.logger('NOTICE', f'No RecentFileCache.bcf found in package: {self.package.name}. Skipping...')
 
-    def prefetch_parse(self):
-        """find and parse Prefetch files"""
-        pecmd = PackageParser.toolPath / 'PECmd.exe'
-        empty = not bool(list(self.package.rglob('*.pf')))
+    def prefetch_jobs(self):
+        pecmd = self.toolPath / 'PECmd.exe'
+        return [Job(pecmd, '-d', folder, self.out_dir / 'ProgramExecution/Prefetch', 'Prefetch files', files)
+                for folder, files in by_folder(self.artifacts('prefetch')).items()]
 
-        if not empty:
-            pf_dir = list(self.package.rglob('*.pf'))
-            pf_out = self.out_dir / 'ProgramExecution/Prefetch'
-            command = [str(pecmd), '-d', '"' + str(pf_dir[0].parent) + '"', '--csv', str(pf_out)]
-            self.run_command(command, pecmd, 'Prefetch files', pf_out)
-        else:
+    def prefetch_parse(self):
+        """find and parse Prefetch folders"""
+        if not self.run_jobs(self.prefetch_jobs()):
             self.logger('NOTICE', f'No Prefetch files found in package: {self.package.name}. Skipping...')
 
     def reg_parse(self):
         """find and parse registry hive files"""
-        recmd = PackageParser.toolPath / 'RECmd/RECmd.exe'
-        reg_files = ['SYSTEM', 'SECURITY', 'SOFTWARE', 'SAM', 'NTUSER.DAT', 'UsrClass.DAT']
-        empty = not bool(list(i for i in self.package.rglob('*') if i.name in reg_files))
+        recmd = self.toolPath / 'RECmd/RECmd.exe'
 
-        if not empty:
+        if self.artifacts('registry'):
             reg_out = self.out_dir / 'Registry'
-            batch_mc = PackageParser.toolPath / 'RECmd/RECmd_Batch_MC.reb'
+            batch_mc = self.toolPath / 'RECmd/RECmd_Batch_MC.reb'
             batch_command = [str(recmd), '-d', '"' + str(self.package) + '"', '--bn', str(batch_mc), '--csv',
-                             str(reg_out) + '\\RECmdBatch', '--nl']
+                             str(reg_out / 'RECmdBatch'), '--nl']
 
-            reg_exe = PackageParser.toolPath / 'RECmd/AllRegExecutablesFoundOrRun.reb'
+            reg_exe = self.toolPath / 'RECmd/AllRegExecutablesFoundOrRun.reb'
             exe_command = [str(recmd), '-d', '"' + str(self.package) + '"', '--bn', str(reg_exe), '--csv',
-                           str(reg_out) + '\\RegEXEsFoundOrRun', '--nl']
+                           str(reg_out / 'RegEXEsFoundOrRun'), '--nl']
 
-            user_activity = PackageParser.toolPath / 'RECmd/UserActivity.reb'
+            user_activity = self.toolPath / 'RECmd/UserActivity.reb'
             user_command = [str(recmd), '-d', '"' + str(self.package) + '"', '--bn', str(user_activity), '--csv',
-                            str(reg_out) + '\\UserActivity', '--nl']
+                            str(reg_out / 'UserActivity'), '--nl']
+
+            # RECmd finds hives itself, so key cached output on every hive in the package
+            hives = self.artifacts('registry') + self.artifacts('user_hives') + self.artifacts('amcache')
             try:
+                self.track('output_dirs', [reg_out / 'RECmdBatch', reg_out / 'RegEXEsFoundOrRun',
+                                           reg_out / 'UserActivity'])
                 self.logger('INFO', f'Parsing Registry Hives in package: {self.package.name}')
-                self.run_command(batch_command)
-                self.logger('SUCCESS', f'Registry output written to: {reg_out}\\RECmdBatch')
+                self.run_simp_command(batch_command, hives + [batch_mc], reg_out / 'RECmdBatch')
+                self.logger('SUCCESS', f'Registry output written to: {reg_out / "RECmdBatch"}')
 
                 self.logger('INFO', f'Parsing Registry Hives for EXEs '
                                     f'found or run in package: {self.package.name}')
-                self.run_command(exe_command)
-                self.logger('SUCCESS', f'EXEs found or run output written to: {reg_out}\\RegEXEsFoundOrRun')
+                self.run_simp_command(exe_command, hives + [reg_exe], reg_out / 'RegEXEsFoundOrRun')
+                self.logger('SUCCESS', f'EXEs found or run output written to: {reg_out / "RegEXEsFoundOrRun"}')
 
                 self.logger('INFO', f'Parsing Registry Hives for user activity '
                                     f'in package: {self.package.name}')
-                self.run_command(user_command)
-                self.logger('SUCCESS', f'User activity output written to: {reg_out}\\UserActivity')
+                self.run_simp_command(user_command, hives + [user_activity], reg_out / 'UserActivity')
+                self.logger('SUCCESS', f'User activity output written to: {reg_out / "UserActivity"}')
             except subprocess.CalledProcessError as e:
                 self.logger('ERROR', str(e))
-            except subprocess.TimeoutExpired:
-                self.logger('ERROR', f'{recmd.name} exceeded 5 minute timeout.')
+            except subprocess.TimeoutExpired as e:
+                self.logger('ERROR', f'{recmd.name} exceeded {e.timeout} second timeout.')
         else:
             self.logger('NOTICE', f'No Registry Hives found in package: {self.package.name}. Skipping...')
 
-    def winevt_parse(self):
-        """find and parse event logs"""
-        evtxecmd = PackageParser.toolPath / 'EvtxECmd/EvtxECmd.exe'
-        empty = not bool(list(self.package.rglob('*.evtx')))
+    def winevt_jobs(self):
+        evtxecmd = self.toolPath / 'EvtxECmd/EvtxECmd.exe'
+        return [Job(evtxecmd, '-d', folder, self.out_dir / 'EventLogs', 'Event Logs', files)
+                for folder, files in by_folder(self.artifacts('evtx')).items()]
 
-        if not empty:
-            winevt_path = list(self.package.rglob('*.evtx'))
-            winevt_out = self.out_dir / 'EventLogs'
-            command = [str(evtxecmd), '-d', '"' + str(winevt_path[0].parent) + '"', '--csv', str(winevt_out)]
-            self.run_command(command, evtxecmd, 'Event Logs', winevt_out)
+    def winevt_parse(self):
+        """find and parse event log folders"""
+        self.run_jobs(self.winevt_jobs())
 
     def shellbags_parse(self):
         """find and parse User registry hive files"""
-        sbecmd = PackageParser.toolPath / 'SBECmd.exe'
-        empty = not bool(list(self.package.rglob('*.DAT')))
-
-        if not empty:
+        sbecmd = self.toolPath / 'SBECmd.exe'
+        if self.artifacts('user_hives'):
             sb_out = self.out_dir / 'FileFolderAccess/ShellBags'
             command = [str(sbecmd), '-d', '"' + str(self.package) + '"', '--csv', str(sb_out), '--nl']
-            self.run_command(command, sbecmd, 'User hives (shellbags', sb_out)
+            self.run_command(command, sbecmd, 'User hives (shellbags', sb_out, self.artifacts('user_hives'))
         else:
             self.logger('NOTICE', f'No User Hives found in package: {self.package.name}. Skipping...')
 
     def lnk_parse(self):
         """find and parse LNK files"""
-        lecmd = PackageParser.toolPath / 'LECmd.exe'
-        empty = not bool(list(self.package.rglob('*.lnk*')))
-
-        if not empty:
+        lecmd = self.toolPath / 'LECmd.exe'
+        if self.artifacts('lnk'):
             lnk_out = self.out_dir / 'FileFolderAccess/LNKfiles'
             command = [str(lecmd), '-d', '"' + str(self.package) + '"', '--csv', str(lnk_out), '--all']
-            self.run_command(command, lecmd, 'LNK files', lnk_out)
+            self.run_command(command, lecmd, 'LNK files', lnk_out, self.artifacts('lnk'))
 
     def jumplist_parse(self):
         """find and parse Jump Lists"""
-        jlecmd = PackageParser.toolPath / 'JLECmd.exe'
-        empty = not bool(list(self.package.rglob('*Destinations-ms')))
-
-        if not empty:
+        jlecmd = self.toolPath / 'JLECmd.exe'
+        if self.artifacts('jumplists'):
             jl_out = self.out_dir / 'FileFolderAccess/JumpLists'
             command = [str(jlecmd), '-d', '"' + str(self.package) + '"', '--csv', str(jl_out)]
-            self.run_command(command, jlecmd, 'Jump Lists', jl_out)
+            self.run_command(command, jlecmd, 'Jump Lists', jl_out, self.artifacts('jumplists'))
 
-    def run_all(self):
+    def stacker(self):
+        """
+        add the package's execution artifacts to the fleet stacking store in the output directory
+        :return: number of CSV files read
+        """
+        from stack.store import STORE, StackStore
+
+        try:
+            with StackStore(self.out_dir.parent / STORE) as store:
+                files, items = store.update_host(self.out_dir)
+            self.logger('SUCCESS', f'Added {items} items from {files} CSV file(s) to {STORE}')
+            return files
+        except Exception as e:
+            self.logger('ERROR', f'Problem updating {STORE}: {e}')
+            return 0
+
+    def parquet_export(self):
+        """convert the output CSVs to Parquet, once every parse stage is done"""
+        from convert.parquet import PARQUET_DIR, convert_files
+        from search.writer import is_report
+
+        files = [i for i in sorted(self.out_dir.rglob('*.csv')) if not is_report(i) and
+                 PARQUET_DIR not in i.relative_to(self.out_dir).parts]
+        if not files:
+            self.logger('NOTICE', 'No output CSVs to convert to Parquet. Skipping...')
+            return
+        out_dir = self.out_dir / PARQUET_DIR
+        self.logger('INFO', f'Converting {len(files)} output CSVs to Parquet')
+        self.track('output_dirs', [out_dir])
+        for i, rows, error in convert_files(files, self.out_dir, self.workers):
+            if error:
+                self.logger('ERROR', f'Problem converting to Parquet: {i} : {error}')
+        self.logger('SUCCESS', f'Parquet output written to: {out_dir}')
+
+    def compress_output(self):
+        """compress the larger output CSVs in place, once every other stage is done"""
+        from convert.compress import MIN_SIZE, compress_files
+        from search.writer import is_report
+
+        files = [i for i in sorted(self.out_dir.rglob('*.csv')) if not is_report(i) and
+                 i.stat().st_size >= MIN_SIZE]
+        if not files:
+            self.logger('NOTICE', f'No output CSVs of {MIN_SIZE // 2 ** 20} MB or more to compress. Skipping...')
+            return
+        self.logger('INFO', f'Compressing {len(files)} output CSVs with {self.compress}')
+        total = saved = 0
+        for i, before, after, error in compress_files(files, self.compress, self.workers):
+            if error:
+                self.logger('ERROR', f'Problem compressing: {i} : {error}')
+            else:
+                total += before
+                saved += before - after
+        self.logger('SUCCESS', f'Compressed output CSVs from {total / 2 ** 20:.0f} MB to '
+                               f'{(total - saved) / 2 ** 20:.0f} MB')
+
+    def stages(self):
+        """parse stages for the Scheduler. tools reading the same registry hives run one after another"""
+        stages = [
+            Stage('convert_csv', self.convert_csv),
+            Stage('mft_parse', self.mft_parse, resource='heavy'),
+            Stage('amcache_parse', self.amcache_parse),
+            Stage('rfc_parse', self.rfc_parse),
+            Stage('shim_parse', self.shim_parse),
+            Stage('prefetch_parse', self.prefetch_parse),
+            Stage('reg_parse', self.reg_parse, needs=('shim_parse',)),
+            Stage('winevt_parse', self.winevt_parse, resource='heavy'),
+            Stage('shellbags_parse', self.shellbags_parse, needs=('reg_parse',)),
+            Stage('lnk_parse', self.lnk_parse),
+            Stage('jumplist_parse', self.jumplist_parse),
+        ]
+        if self.parquet:
+            stages.append(Stage('parquet_export', self.parquet_export, needs=tuple(s.name for s in stages)))
+        if self.compress:
+            stages.append(Stage('compress_output', self.compress_output, needs=tuple(s.name for s in stages)))
+        return stages
+
+    def run_all(self, stages=None):
+        """
+        extract, discover artifacts, run the parse stages, then search if selected.
+        with search_only, only search the archive in place
+        :param stages: names of the parse stages to run (see stages()). None runs all of them
+        """
+        try:
+            if self.search_only:
+                with self.metrics.measure('step', 'search', profile=True):
+                    self.archive_searcher()
+            else:
+                self.run_steps(stages)
+        finally:
+            self.metrics.save(self.out_dir)
+
+    def select_stages(self, names=None):
+        """:return: the named stages, in run order. ordering on a stage that isn't selected is dropped"""
+        stages = self.stages()
+        if names is None:
+            return stages
+        unknown = set(names) - {stage.name for stage in stages}
+        if unknown:
+            raise ValueError(f'Unknown stage(s): {", ".join(sorted(unknown))}')
+        return [stage._replace(needs=tuple(n for n in stage.needs if n in names))
+                for stage in stages if stage.name in names]
+
+    def instance_jobs(self):
+        """:return: {stage name: function listing its jobs} for stages that run a tool once per artifact instance"""
+        return {'mft_parse': self.mft_jobs, 'shim_parse': self.shim_jobs, 'amcache_parse': self.amcache_jobs,
+                'rfc_parse': self.rfc_jobs, 'prefetch_parse': self.prefetch_jobs, 'winevt_parse': self.winevt_jobs}
+
+    def fan_out(self, stages):
+        """
+        Give every instance of an artifact its own stage when a package has more than one
+        (several volumes, shadow copies), so the Scheduler runs them at the same time.
+        Instances that would share an output folder write to their own folder under
+        Instances instead. The original stage then runs after them and merges their CSVs
+        :param stages: list of Stage
+        :return: list of Stage, instance stages first, named e.g. mft_parse:MFT/C
+        """
+        job_lists = self.instance_jobs()
+        expanded = []
+        for stage in stages:
+            jobs = job_lists[stage.name]() if stage.name in job_lists else []
+            if len(jobs) <= 1:
+                expanded.append(stage)
+                continue
+
+            shared = Counter(job.out_path for job in jobs)
+            merges = {}  # {output folder: {instance label: instance folder}}
+            names = []
+            for job in jobs:
+                label = instance_label(job.folder(), self.package)
+                name = f'{stage.name}:{job.out_path.name}/{label}'
+                if shared[job.out_path] > 1:
+                    part = self.out_dir / INSTANCES / job.out_path.relative_to(self.out_dir) / label
+                    merges.setdefault(job.out_path, {})[label] = part
+                    job = job._replace(out_path=part)
+                names.append(name)
+                expanded.append(Stage(name, partial(self.run_instance, job), stage.needs,
+                                      job.resource or stage.resource))
+            self.logger('INFO', f'{stage.name}: found {len(jobs)} artifact instances. Parsing each in its own stage')
+            expanded.append(stage._replace(func=partial(self.merge_instances, merges, names), needs=tuple(names),
+                                           resource='light'))
+        return expanded
+
+    def run_instance(self, job):
+        """stage for one artifact instance (see fan_out)"""
+        self.track('inputs', job.inputs)
+        self.run_jobs([job])
+
+    def merge_instances(self, merges, names):
+        """
+        Merge the CSVs of instances that shared an output folder, one file per kind of output with
+        the instance in a SourceInstance column. Instance folders are removed once every instance stage is done
+        :param merges: {output folder: {instance label: instance folder}}
+        :param names: instance stage names
+        """
+        from convert.merge import merge_outputs
+
+        for out_path, parts in merges.items():
+            self.logger('INFO', f'Merging {len(parts)} instances into {out_path}')
+            for file, rows in merge_outputs(parts, out_path):
+                self.logger('SUCCESS', f'Merged {rows} rows into {file.name}')
+
+        failed = [name for name in names if not self.manifest.done(name)]
+        if failed:
+            # left in place so --resume can rerun the failed instances and merge again
+            self.logger('ERROR', f'Instance stage(s) failed: {", ".join(failed)}. '
+                                 f'Instance output kept in {self.out_dir / INSTANCES}')
+            return
+        for parts in merges.values():
+            for part in parts.values():
+                shutil.rmtree(part, ignore_errors=True)
+                try:
+                    os.removedirs(part.parent)  # empty folders up to Instances
+                except OSError:
+                    pass
+
+    def run_steps(self, stages=None):
+        selected = self.select_stages(stages)
         start_time = datetime.now().replace(microsecond=0)
-        if self.source.suffix == '.7z' and self.password is not None:
-            self.extract_sevenzip()
-        elif self.source.suffix == '.zip':
-            self.extract_zipfile()
+        if self.resume and self.manifest.get('extracted') and self.package.is_dir():
+            self.logger('INFO', f'Resuming. Using package extracted by an earlier run: {self.package}')
         else:
-            self.extract_tar()
-        self.convert_csv()
-        self.mft_parse()
-        self.amcache_parse()
-        self.rfc_parse()
-        self.shim_parse()
-        self.prefetch_parse()
-        self.reg_parse()
-        self.winevt_parse()
-        self.shellbags_parse()
-        self.lnk_parse()
-        self.jumplist_parse()
+            self.manifest.update(source=str(self.source.resolve()), started=str(start_time), extracted=None, indexed=None,
+                                 finished=None, stages={})
+            with self.metrics.measure('step', 'extract', profile=True):
+                if self.source.suffix == '.7z' and self.password is not None:
+                    self.extract_sevenzip()
+                elif self.source.suffix == '.zip':
+                    self.extract_zipfile()
+                else:
+                    self.extract_tar()
+            self.manifest.update(extracted=str(self.package.resolve()))
+
+        with self.metrics.measure('step', 'discover', profile=True) as info:
+            self.discover()
+            info['files'] = self.index.files
+        selected = self.fan_out(selected)
+
+        scheduler = Scheduler(self.tool_workers, self.resource_limits)
+        for result in scheduler.run(selected, self.run_stage):
+            self.write_log(result.value)
+        if stages is None:
+            self.manifest.update(finished=str(datetime.now().replace(microsecond=0)))
+        if self.cache is not None:
+            self.logger('INFO', self.cache.stats())
+
         self.logger('DONE', f'Processed {self.package.name} in {datetime.now().replace(microsecond=0) - start_time}')
         print(Fore.LIGHTGREEN_EX + '\nOutput written to: ' + Fore.LIGHTWHITE_EX + f'{self.out_dir}')
+        if self.stack:
+            with self.metrics.measure('step', 'stack', profile=True) as info:
+                info['files'] = self.stacker()
         if self.search:
-            self.searcher()
+            with self.metrics.measure('step', 'search', profile=True) as info:
+                info['files'] = self.searcher()
+
+
+def parse_package(source, out_dir, stages=None, console=None, **options):
+    """
+    Process a package from other Python code: no command line, banner or console colors
+    :param source: path of package archive
+    :param out_dir: output directory. the package output goes to a folder named after the package in it
+    :param stages: names of parse stages to run (see PackageParser.stages). None runs all of them
+    :param console: text file object for console output, with colors removed. None discards it
+    :param options: PackageParser keyword arguments, e.g. tool_path, search, tool_workers, cache
+    :return: PackageParser, for out_dir, errors, index and metrics
+    raises PackageError if the package can't be extracted
+    """
+    with contextlib.ExitStack() as stack:
+        if console is None:
+            console = stack.enter_context(open(os.devnull, 'w'))
+        stack.enter_context(contextlib.redirect_stdout(AnsiToWin32(console, strip=True).stream))
+        package = PackageParser(source, out_dir, **options)
+        package.run_all(stages)
+    return package
+
+
+def run_package(archive, out_dir, options, quiet=False):
+    """
+    Process one package, catching failures so a batch can carry on
+    :param archive: path of package archive
+    :param out_dir: output directory
+    :param options: PackageParser keyword arguments
+    :param quiet: send console output to console.log in the package output folder (used by --jobs)
+    :return: summary dict
+    """
+    start = datetime.now().replace(microsecond=0)
+    summary = {'Package': archive.name, 'Status': 'OK', 'Duration': '', 'Errors': 0, 'Output': '', 'Message': ''}
+
+    with contextlib.ExitStack() as stack:
+        if quiet:
+            console = stack.enter_context(contextlib.redirect_stdout(io.StringIO()))
+        package = None
+        try:
+            package = PackageParser(archive, out_dir, **options)
+            if quiet:
+                fh = stack.enter_context((package.out_dir / 'console.log').open('a', encoding='utf-8'))
+                stream = AnsiToWin32(fh, strip=True).stream
+                stream.write(console.getvalue())
+                stack.enter_context(contextlib.redirect_stdout(stream))
+            package.run_all()
+        except PackageError as e:
+            summary['Status'] = 'FAILED'
+            summary['Message'] = str(e)
+        except Exception as e:
+            summary['Status'] = 'FAILED'
+            summary['Message'] = str(e)
+            if package is not None:
+                package.logger('ERROR', f'Processing stopped: {e}')
+
+    if package is not None:
+        summary['Errors'] = package.errors
+        summary['Output'] = str(package.out_dir)
+    summary['Duration'] = str(datetime.now().replace(microsecond=0) - start)
+    return summary
+
+
+def process_packages(archives, out_dir, options, jobs=1):
+    """
+    Process packages one after another, or in parallel worker processes with jobs > 1.
+    A failed package is reported in the summary and doesn't stop the others.
+    """
+    if jobs <= 1:
+        summaries = [run_package(archive, out_dir, options) for archive in archives]
+    else:
+        print(Fore.LIGHTWHITE_EX + f'\nProcessing {len(archives)} packages with {jobs} jobs. '
+                                   f'Console output for each is written to console.log in its output folder.\n')
+        from alive_progress import alive_bar
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+
+        summaries = []
+        with ProcessPoolExecutor(jobs) as pool, alive_bar(len(archives), bar='smooth') as bar:
+            futures = [pool.submit(run_package, archive, out_dir, options, True) for archive in archives]
+            for future in as_completed(futures):
+                summary = future.result()
+                color = Fore.LIGHTGREEN_EX if summary['Status'] == 'OK' else Fore.LIGHTRED_EX
+                print(color + f"{summary['Status']:<7}" + Fore.LIGHTWHITE_EX +
+                      f"{summary['Package']} in {summary['Duration']} ({summary['Errors']} errors)")
+                summaries.append(summary)
+                bar()
+        order = {archive.name: n for n, archive in enumerate(archives)}
+        summaries.sort(key=lambda i: order[i['Package']])
+
+    write_summary(summaries, out_dir)
+    return summaries
+
+
+def watch_packages(intake, out_dir, options, jobs=1, settle=30):
+    """
+    Process packages as they are copied to intake, until Ctrl-C. See runner.watch.IntakeWatcher
+    """
+    def report(summary):
+        color = Fore.LIGHTGREEN_EX if summary['Status'] == 'OK' else Fore.LIGHTRED_EX
+        print(color + f"{summary['Status']:<7}" + Fore.LIGHTWHITE_EX +
+              f"{summary['Package']} in {summary['Duration']} ({summary['Errors']} errors)  {summary['Message']}")
+
+    process = partial(run_package, out_dir=out_dir, options=options, quiet=True)
+    watcher = IntakeWatcher(intake, out_dir, process, jobs, settle, on_done=report)
+    print(Fore.LIGHTGREEN_EX + '\nWatching ' + Fore.LIGHTWHITE_EX + f'{intake}' + Fore.LIGHTGREEN_EX +
+          f' for packages with {watcher.jobs} job(s). Press Ctrl-C to stop.')
+    print(Fore.LIGHTWHITE_EX + f'Archives are processed once unchanged for {settle} seconds. Queue and throughput '
+                               f'are in {watcher.status_file}, console output in console.log of each package.\n')
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        print(Fore.YELLOW + '\nStopped watching.')
+    print(Fore.LIGHTCYAN_EX + f"\nProcessed {watcher.counts['done']} package(s), {watcher.counts['failed']} failed")
+
+
+def write_summary(summaries, out_dir):
+    """print a per-package summary and write it to BatchSummary_<timestamp>.csv in out_dir"""
+    failed = [i for i in summaries if i['Status'] != 'OK']
+    print(Fore.LIGHTCYAN_EX + f'\nProcessed {len(summaries) - len(failed)} of {len(summaries)} package(s)')
+    for i in summaries:
+        color = Fore.LIGHTGREEN_EX if i['Status'] == 'OK' else Fore.LIGHTRED_EX
+        print(color + f"{i['Status']:<7}" + Fore.LIGHTWHITE_EX + f"{i['Package']:<40} {i['Duration']:>9} "
+                                                              f"{i['Errors']:>4} errors  {i['Message']}")
+
+    out_file = Path(out_dir) / f'BatchSummary_{datetime.now().strftime("%Y%m%d%H%M%S")}.csv'
+    out_file.parent.mkdir(parents=True, exist_ok=True)
+    with out_file.open('w', newline='', encoding='utf-8') as fh:
+        writer = csv.DictWriter(fh, fieldnames=list(summaries[0]))
+        writer.writeheader()
+        writer.writerows(summaries)
+
+
+def banner():
+    import pyfiglet  # only for the command line
+
+    package_print = pyfiglet.figlet_format('PackageParser', font='cosmic')
+    print(Fore.LIGHTGREEN_EX + '\n' + package_print)
 
 
 def main():
     out_dir = args.out
     user_source = Path(args.source)
+    options = dict(password=args.password, search=args.search, workers=args.workers, structured=args.structured,
+                   tool_workers=args.tool_workers, resume=args.resume, cache=args.cache, cache_size=args.cache_size,
+                   only_artifacts=args.only_artifacts, profile=args.profile, search_index=args.index,
+                   hit_summary=args.hit_summary, parquet=args.parquet, stack=args.stack, compress=args.compress,
+                   search_only=args.search_only)
 
     if not ctypes.windll.shell32.IsUserAnAdmin() == 1:
         sys.exit(Fore.LIGHTRED_EX + 'Please rerun from an Administrative command prompt. Exiting')
@@ -410,28 +1009,37 @@ def main():
         sys.exit(Fore.LIGHTRED_EX + '\nCan\'t find the tools folder. The tools folder should be placed in '
                                     'the same directory as PackageParser. Exiting.')
 
+    if args.watch and not user_source.is_dir():
+        sys.exit(Fore.LIGHTRED_EX + f'--watch needs a directory to watch, not {user_source}. Exiting.')
+
     if user_source.is_dir():
         if str(user_source) == out_dir:
             sys.exit(Fore.LIGHTRED_EX + '-s (--source) and -o (--out) cannot be the same directory. Exiting.')
 
+        if args.watch:
+            if not args.password:
+                print(Fore.YELLOW + '\nNo password provided. .7z packages will fail.')
+            watch_packages(user_source, out_dir, options, args.jobs, args.settle)
+            return
+
         ext_glob = ['*.7z', '*.zip', '*.gz']
         archives = [a for a in [user_source.glob(e) for e in ext_glob] for a in a]
+        if args.resume:  # extraction deletes the archive, so also pick up unfinished runs without one
+            known = {a.resolve() for a in archives}
+            archives += [a for a in unfinished(out_dir, user_source) if a not in known]
 
         if len(archives) > 0:
             pa = '\n'.join(map(str, archives))
             print(Fore.LIGHTGREEN_EX + f'\nFound {len(archives)} Package(s) '
                                        'in: ' + Fore.LIGHTWHITE_EX + f'{user_source}')
             print(Fore.LIGHTCYAN_EX + '\n' + pa)
-            for archive in archives:
-                if archive.suffix == '.7z' and not args.password:
-                    sys.exit(Fore.LIGHTRED_EX + f'\nNo password provided for .7z. Exiting')
-                else:
-                    package = PackageParser(archive, out_dir, args.password, args.search)
-                    package.run_all()
+            if any(a.suffix == '.7z' and a.exists() for a in archives) and not args.password:
+                sys.exit(Fore.LIGHTRED_EX + f'\nNo password provided for .7z. Exiting')
+            process_packages(archives, out_dir, options, args.jobs)
         else:
             sys.exit(Fore.LIGHTRED_EX + f'\nPath: {user_source} contains no packages. Exiting.')
 
-    elif user_source.is_file():
+    elif user_source.is_file() or (args.resume and user_source.resolve() in unfinished(out_dir, user_source.parent)):
         exts = ['.7z', '.zip', '.gz']
         if str(user_source.parent) == out_dir:
             sys.exit(Fore.LIGHTRED_EX + '\nOutput directory cannot be the same as the source file. Exiting.')
@@ -439,11 +1047,14 @@ def main():
         if user_source.suffix in exts:
             print(Fore.LIGHTGREEN_EX + '\nFound package: ' + Fore.LIGHTWHITE_EX + f'{user_source}')
 
-            if user_source.suffix == '.7z' and not args.password:
+            if user_source.suffix == '.7z' and user_source.exists() and not args.password:
                 sys.exit(Fore.LIGHTRED_EX + '\nNo password provided for .7z. Exiting.')
             else:
-                package = PackageParser(user_source, out_dir, args.password, args.search)
-                package.run_all()
+                package = PackageParser(user_source, out_dir, **options)
+                try:
+                    package.run_all()
+                except PackageError as e:
+                    sys.exit(Fore.LIGHTRED_EX + f'\n{e}. Exiting.')
         else:
             sys.exit(Fore.LIGHTRED_EX + f'\nWrong file type based on extension: {user_source.name}')
     else:
@@ -451,14 +1062,63 @@ def main():
 
 
 if __name__ == '__main__':
-    package_print = pyfiglet.figlet_format('PackageParser', font='cosmic')
-    print(Fore.LIGHTGREEN_EX + '\n' + package_print)
+    init(autoreset=True)
+    banner()
 
     parser = argparse.ArgumentParser(description='Process archives containing LR artifacts', epilog=example_text,
                                      formatter_class=argparse.RawDescriptionHelpFormatter)
     parser.add_argument('-p', '--password', type=str, help='archive password')
     parser.add_argument('--search', type=str, action='store', nargs='?', const='regex.txt',
                         help='input file to use. must be placed in search folder. Default is regex.txt')
+    parser.add_argument('--search-only', action='store_true',
+                        help='only search the text files in each package (QueryResults, logs, CSVs) for --search '
+                             'rules, reading them straight out of the archive. Nothing is extracted or parsed and '
+                             'the archive is kept. Uses regex.txt if --search isn\'t given')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of processes to search output and convert QueryResults with. Large CSVs are '
+                             'split between them. Default is 1')
+    parser.add_argument('--tool-workers', type=int, default=1,
+                        help='number of EZ tools to run at once. MFT and event log parsing never overlap. '
+                             'Default is 1')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='number of packages to process at once when -s is a directory. Default is 1')
+    parser.add_argument('--watch', action='store_true',
+                        help=f'keep running and process packages as they are copied to -s (a directory). '
+                             f'Queue and throughput are written to {STATUS} in the output directory')
+    parser.add_argument('--settle', type=int, default=30,
+                        help='with --watch, seconds an archive must stay unchanged before it is processed. '
+                             'Default is 30')
+    parser.add_argument('--only-artifacts', action='store_true',
+                        help='only extract files PackageParser parses (artifacts and QueryResults) from packages')
+    parser.add_argument('--cache', type=str,
+                        help='folder to keep EZ tool output in. artifacts seen before (same content, tool and '
+                             'arguments) have their output copied from it instead of running the tool again')
+    parser.add_argument('--cache-size', type=float, default=MAX_GB,
+                        help=f'size limit of --cache in GB. least recently used output is removed first. '
+                             f'Default is {MAX_GB}')
+    parser.add_argument('--resume', action='store_true',
+                        help='continue an interrupted run: reuse the extracted package and skip stages that finished')
+    parser.add_argument('--profile', action='store_true',
+                        help='run extraction, discovery, QueryResults conversion and search under cProfile. '
+                             'Output goes to the Profiles folder of each package')
+    parser.add_argument('--structured', action='store_true',
+                        help='parse output CSVs and search column values. Rules can target columns with a 4th field')
+    parser.add_argument('--hit-summary', action='store_true',
+                        help='also write a SearchSummary CSV with one row per distinct matched line: the rules that '
+                             'matched it with counts, and the first and last source file')
+    parser.add_argument('--parquet', action='store_true',
+                        help='also convert the output CSVs to typed Parquet files in a Parquet folder of each package '
+                             'output. --structured searches them instead of the CSVs. Needs pyarrow')
+    parser.add_argument('--compress', choices=['gzip', 'zstd'], nargs='?', const='gzip',
+                        help='compress output CSVs of 1 MB or more once parsing is done (gzip, the default, or zstd, '
+                             'which needs zstandard). Search reads them without unpacking')
+    parser.add_argument('--stack', action='store_true',
+                        help='add each package\'s Amcache, Shimcache, Prefetch and RegEXEsFoundOrRun output to a '
+                             'fleet stacking store (FleetStack.db) in the output directory. '
+                             'Query it with python -m stack.stack')
+    parser.add_argument('--index', action='store_true',
+                        help='keep a search index of the output in each package output folder (SearchIndex.db) so '
+                             'later searches only read lines that can match. Not used with --structured')
 
     required_args = parser.add_argument_group('required arguments')
     required_args.add_argument('-s', '--source', type=str, required=True,
@@ -466,4 +1126,6 @@ if __name__ == '__main__':
                                     'multiple archives.')
     required_args.add_argument('-o', '--out', type=str, required=True, help='Processed package output directory.')
     args = parser.parse_args()
+    if args.search_only and not args.search:
+        args.search = 'regex.txt'
     main()
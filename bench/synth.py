@@ -0,0 +1,106 @@
+"""
+Synthetic packages for benchmarks: a deep directory tree shaped like a triage
+collection, with placeholder artifacts ($MFT, hives, Prefetch, event logs, LNK
+files, Jump Lists), plenty of files nobody parses, and QueryResults JSON.
+"""
+import json
+import os
+import random
+from pathlib import Path
+from zipfile import ZipFile, ZIP_DEFLATED
+
+KB = 1024
+
+# artifact placeholders at scale 1: (path in package, size in KB)
+SYSTEM_FILES = [
+    ('C/$MFT', 8192),
+    ('C/$Extend/$J', 2048),
+    ('C/Windows/System32/config/SYSTEM', 1024),
+    ('C/Windows/System32/config/SOFTWARE', 2048),
+    ('C/Windows/System32/config/SAM', 64),
+    ('C/Windows/System32/config/SECURITY', 64),
+    ('C/Windows/AppCompat/Programs/Amcache.hve', 512),
+]
+
+
+def _write(path, size, rnd):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # compressible but not trivially so, like real artifacts
+    block = bytes(rnd.getrandbits(8) for _ in range(256)) * 16
+    with path.open('wb') as fh:
+        for _ in range(size // len(block)):
+            fh.write(block)
+        fh.write(block[:size % len(block)])
+
+
+def make_package(root, scale=1, seed=1):
+    """
+    Build an extracted package at root
+    :param scale: multiplies file counts and sizes
+    :return: dict of what was generated, for reports
+    """
+    rnd = random.Random(seed)
+    root = Path(root)
+    counts = {'artifacts': 0, 'other files': 0, 'json records': 0}
+
+    for name, size in SYSTEM_FILES:
+        _write(root / name, size * KB * scale, rnd)
+        counts['artifacts'] += 1
+
+    for n in range(50 * scale):
+        _write(root / f'C/Windows/Prefetch/APP{n:04d}.EXE-{rnd.getrandbits(32):08X}.pf', 16 * KB, rnd)
+        counts['artifacts'] += 1
+
+    for n in range(20 * scale):
+        _write(root / f'C/Windows/System32/winevt/Logs/Channel-{n:03d}%4Operational.evtx', 256 * KB, rnd)
+        counts['artifacts'] += 1
+
+    for u in range(3 * scale):
+        home = root / f'C/Users/user{u:02d}'
+        _write(home / 'NTUSER.DAT', 512 * KB, rnd)
+        _write(home / 'AppData/Local/Microsoft/Windows/UsrClass.DAT', 256 * KB, rnd)
+        recent = home / 'AppData/Roaming/Microsoft/Windows/Recent'
+        for n in range(30):
+            _write(recent / f'document{n:03d}.docx.lnk', 2 * KB, rnd)
+            counts['artifacts'] += 1
+        for n in range(10):
+            _write(recent / f'AutomaticDestinations/{rnd.getrandbits(64):016x}.automaticDestinations-ms', 8 * KB, rnd)
+            counts['artifacts'] += 1
+        counts['artifacts'] += 2
+
+    # deep tree of files that aren't artifacts, like Program Files and WinSxS in a full collection
+    for n in range(2000 * scale):
+        depth = rnd.randint(2, 8)
+        parts = [f'dir{rnd.randint(0, 9)}' for _ in range(depth)]
+        ext = rnd.choice(['.dll', '.txt', '.xml', '.log', '.bin', '.dat.bak'])
+        _write(root.joinpath('C', 'Program Files', *parts, f'file{n:05d}{ext}'), rnd.randint(1, 32) * KB, rnd)
+        counts['other files'] += 1
+
+    results = root / 'QueryResults'
+    results.mkdir(parents=True, exist_ok=True)
+    for q in range(3):
+        records = 5000 * scale
+        with (results / f'query{q}.json').open('w', encoding='utf-8') as fh:
+            fh.write('[')
+            for n in range(records):
+                record = {'Host': 'WORKSTATION01', 'Pid': n, 'Name': f'proc{n % 97}.exe',
+                          'CommandLine': f'C:\\Windows\\System32\\proc{n % 97}.exe -k {rnd.getrandbits(32):x}',
+                          'User': f'CORP\\user{n % 7}', 'Started': '2023-01-01T00:00:00Z'}
+                if n % 1000 == 999:
+                    record['Parent'] = {'Pid': n - 1, 'Name': 'services.exe'}
+                fh.write((',' if n else '') + json.dumps(record))
+            fh.write(']')
+        counts['json records'] += records
+
+    return counts
+
+
+def make_archive(package, archive):
+    """zip an extracted package the way collections are delivered: files at the root of the archive"""
+    package = Path(package)
+    with ZipFile(archive, 'w', ZIP_DEFLATED, compresslevel=1) as zf:
+        for dirpath, _, filenames in os.walk(package):
+            for name in filenames:
+                path = Path(dirpath) / name
+                zf.write(path, path.relative_to(package).as_posix())
+    return Path(archive)
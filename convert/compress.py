@@ -0,0 +1,101 @@
+"""
+Compress finished output CSVs in place, to x.csv.gz (gzip) or x.csv.zst (zstd).
+
+EZ tool output, MFTECmd and EvtxECmd above all, is very repetitive text and shrinks
+several times over. The search, the search index, --structured and the stacking
+store read the compressed files directly (see search.compressed). Files are
+written to a temporary name, keep the CSV's modification time, and replace the CSV
+only when complete. zstd needs zstandard (pip install zstandard). gzip needs
+nothing extra.
+
+python -m convert.compress <folder> [gzip|zstd]
+"""
+import gzip
+import os
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+METHODS = {'gzip': '.gz', 'zstd': '.zst'}
+# smaller CSVs are left alone. they save little and people open them by hand
+MIN_SIZE = 2 ** 20
+# bytes copied at a time
+READ_SIZE = 2 ** 20
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError('zstd compression needs zstandard. pip install zstandard')
+    return zstandard
+
+
+def _writer(path, method):
+    if method == 'gzip':
+        return gzip.open(path, 'wb', compresslevel=6)
+    return _zstandard().ZstdCompressor(level=3).stream_writer(path.open('wb'), closefd=True)
+
+
+def compress_file(path, method='gzip'):
+    """
+    Compress a CSV and remove it
+    :return: (bytes before, bytes after)
+    """
+    path = Path(path)
+    out_file = path.with_name(path.name + METHODS[method])
+    tmp = out_file.with_name(out_file.name + '.tmp')
+    try:
+        with path.open('rb') as src, _writer(tmp, method) as dst:
+            shutil.copyfileobj(src, dst, READ_SIZE)
+        shutil.copystat(path, tmp)  # the mtime tells the search index and Parquet copies the content didn't change
+        os.replace(tmp, out_file)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    before = path.stat().st_size
+    path.unlink()
+    return before, out_file.stat().st_size
+
+
+def _compress(path, method):
+    try:
+        return (path, *compress_file(path, method), None)
+    except Exception as e:
+        return path, 0, 0, str(e)
+
+
+def compress_files(files, method='gzip', workers=1):
+    """
+    :param files: list of CSV files
+    :param method: gzip or zstd
+    :param workers: files compressed at once in worker processes
+    :return: generator of (file, bytes before, bytes after, error message or None) as files finish
+    """
+    if method not in METHODS:
+        raise ValueError(f'Unknown compression: {method}. Use one of {", ".join(METHODS)}')
+    if method == 'zstd':
+        _zstandard()  # fail once, not for every file
+
+    if workers <= 1 or len(files) <= 1:
+        for path in files:
+            yield _compress(path, method)
+        return
+
+    with ProcessPoolExecutor(min(workers, len(files))) as pool:
+        futures = [pool.submit(_compress, path, method) for path in files]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def main():
+    source = Path(sys.argv[1])
+    method = sys.argv[2] if len(sys.argv) > 2 else 'gzip'
+    files = [f for f in sorted(source.rglob('*.csv')) if f.stat().st_size >= MIN_SIZE] if source.is_dir() else [source]
+    for path, before, after, error in compress_files(files, method):
+        print(f'{path.name}: {error}' if error else f'{path.name}: {before} -> {after} bytes')
+
+
+if __name__ == '__main__':
+    main()
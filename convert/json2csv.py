@@ -0,0 +1,217 @@
+"""
+Convert QueryResults JSON to CSV without loading whole files into memory.
+
+Reads a JSON array of records, or newline delimited JSON (one record per line), a
+piece at a time and writes each record as a CSV row as soon as it is parsed.
+
+python -m convert.json2csv <json file or folder> <output folder>
+"""
+import csv
+import json
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import chain, islice
+from pathlib import Path
+
+# characters read from the JSON file at a time
+READ_SIZE = 2 ** 20
+# records looked at to work out the CSV header before the first row is written
+SAMPLE = 1000
+# a decode error this close to the end of the buffer may be a literal, number or escape cut off by a read
+TRUNCATED_TAIL = 16
+
+_decoder = json.JSONDecoder()
+
+
+class ConvertError(Exception):
+    """the file isn't a JSON array of records or newline delimited JSON"""
+
+
+def iter_records(path, read_size=READ_SIZE):
+    """
+    Parse JSON records one at a time
+    :param path: JSON file. either a JSON array of records, NDJSON, or a single object
+    :param read_size: characters read at a time
+    :return: generator of records
+    """
+    with Path(path).open(encoding='utf-8-sig', errors='replace') as fh:
+        buf = ''
+        pos = 0
+        eof = False
+        in_array = None
+        count = 0
+
+        while True:
+            # skip whitespace and, inside an array, the commas between records
+            while True:
+                while pos < len(buf) and (buf[pos].isspace() or (in_array and buf[pos] == ',')):
+                    pos += 1
+                if pos < len(buf) or eof:
+                    break
+                buf, pos = fh.read(read_size), 0
+                eof = not buf
+
+            if pos >= len(buf):
+                if in_array:
+                    raise ConvertError('JSON array is not closed')
+                return
+
+            if in_array is None:
+                in_array = buf[pos] == '['
+                if in_array:
+                    pos += 1
+                    continue
+            elif in_array and buf[pos] == ']':
+                return
+
+            while True:
+                try:
+                    record, end = _decoder.raw_decode(buf, pos)
+                    if end < len(buf) or eof:  # a number at the end of buf may continue
+                        break
+                except json.JSONDecodeError as e:
+                    if eof or not _truncated(e, buf):
+                        raise ConvertError(f'invalid JSON in record {count + 1}: {e.msg}') from None
+                # record runs past the end of buf. read at least as much again so a huge
+                # record isn't parsed from the start once per read_size
+                more = fh.read(max(read_size, len(buf) - pos))
+                eof = not more
+                buf, pos = buf[pos:] + more, 0
+
+            pos = end
+            count += 1
+            yield record
+
+
+def _truncated(error, buf):
+    """
+    True if a decode error could just be the record running past the end of buf, so
+    reading more may fix it. An error further back is a corrupt record, and reading on
+    would pull the rest of the file into buf before failing anyway.
+    An unterminated string is left to read on: it fails at the next quote or raw newline
+    """
+    return error.msg.startswith('Unterminated string') or len(buf) - error.pos <= TRUNCATED_TAIL
+
+
+def to_rows(records):
+    """
+    Turn parsed JSON into CSV records. a file holding one object whose values are all
+    objects is read column first, like pandas.read_json does: {"col": {"0": value}, ...}
+    """
+    records = iter(records)
+    first = list(islice(records, 2))
+    if len(first) == 1 and _column_first(first[0]):
+        rows = {}
+        for column, values in first[0].items():
+            for row, value in values.items():
+                rows.setdefault(row, {})[column] = value
+        first = list(rows.values())
+
+    for record in chain(first, records):
+        if isinstance(record, dict):
+            yield record
+        else:
+            yield {'value': record}
+
+
+def _column_first(record):
+    return isinstance(record, dict) and record and all(isinstance(v, dict) for v in record.values())
+
+
+def cell(value):
+    """CSV cell for a JSON value. nested objects and lists are kept as JSON"""
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def collect_header(path, limit=None):
+    """
+    :param path: JSON file
+    :param limit: records to look at. None reads the whole file (schema pass)
+    :return: list of columns in the order they are first seen
+    """
+    header = {}
+    for n, record in enumerate(to_rows(iter_records(path))):
+        if limit is not None and n >= limit:
+            break
+        header.update(dict.fromkeys(record))
+    return list(header)
+
+
+def convert_file(path, out_file, sample=SAMPLE):
+    """
+    Stream a JSON file to CSV. The header comes from the first sample records; if a
+    later record has a column not in it, the file is converted again with a header
+    from a full pass over the records, so no values are dropped.
+    :param path: JSON file
+    :param out_file: CSV file to write
+    :param sample: records used to infer the header
+    :return: number of rows written
+    """
+    header = collect_header(path, sample)
+    rows, missed = _write(path, out_file, header)
+    if missed:
+        header = collect_header(path)
+        rows, _ = _write(path, out_file, header)
+    return rows
+
+
+def _write(path, out_file, header):
+    rows = 0
+    missed = False
+    known = set(header)
+    with Path(out_file).open('w', newline='', encoding='utf-8') as fh:
+        writer = csv.writer(fh)
+        if header:
+            writer.writerow(header)
+        for record in to_rows(iter_records(path)):
+            if not missed and not known.issuperset(record):
+                missed = True
+            writer.writerow([cell(record.get(column)) for column in header])
+            rows += 1
+    return rows, missed
+
+
+def _convert(path, out_file):
+    try:
+        return path, convert_file(path, out_file), None
+    except Exception as e:
+        return path, 0, str(e)
+
+
+def convert_files(files, out_dir, workers=1):
+    """
+    Convert JSON files to CSV files of the same name in out_dir
+    :param files: list of JSON files
+    :param out_dir: output folder
+    :param workers: files converted at once in worker processes
+    :return: generator of (file, rows written, error message or None) as files finish
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    jobs = [(Path(f), out_dir / (Path(f).stem + '.csv')) for f in files]
+
+    if workers <= 1 or len(jobs) <= 1:
+        for path, out_file in jobs:
+            yield _convert(path, out_file)
+        return
+
+    with ProcessPoolExecutor(min(workers, len(jobs))) as pool:
+        futures = [pool.submit(_convert, path, out_file) for path, out_file in jobs]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def main():
+    source = Path(sys.argv[1])
+    out_dir = Path(sys.argv[2])
+    files = sorted(source.glob('*.json')) if source.is_dir() else [source]
+    for path, rows, error in convert_files(files, out_dir):
+        print(f'{path.name}: {error}' if error else f'{path.name}: {rows} rows')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Merge the CSVs an EZ tool wrote for several instances of an artifact, e.g. the $MFT
+of each volume or the Prefetch folder of each shadow copy, into one CSV per kind of
+output.
+
+Files are matched on their name without the timestamp EZ tools put in front of it,
+so C/20200101120000_MFTECmd_$MFT_Output.csv and VSS1/20200101120105_MFTECmd_$MFT_Output.csv
+become MFTECmd_$MFT_Output.csv. Rows are copied a line at a time with the instance
+they came from in an extra SourceInstance column. Instances with different columns
+(e.g. another tool version) are lined up by column name.
+"""
+import csv
+import os
+import re
+from pathlib import Path
+
+INSTANCE_COLUMN = 'SourceInstance'
+_STAMP = re.compile(r'^\d{14}_')
+
+
+def output_kind(name):
+    """:return: CSV file name without the EZ tool timestamp"""
+    return _STAMP.sub('', name)
+
+
+def _header(path):
+    with Path(path).open(encoding='utf-8-sig', errors='replace', newline='') as fh:
+        return next(csv.reader(fh), [])
+
+
+def merge_csvs(files, out_file):
+    """
+    Write the rows of several CSVs to one, with the instance of each row in a last column
+    :param files: list of (instance label, CSV file)
+    :param out_file: merged CSV. written to a temporary name and renamed when done
+    :return: number of rows written
+    """
+    csv.field_size_limit(2 ** 31 - 1)  # EvtxECmd payloads can be longer than the default limit
+    headers = [_header(path) for _, path in files]
+    columns = list(dict.fromkeys(column for header in headers for column in header))
+    out_file = Path(out_file)
+    out_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out_file.with_name(out_file.name + '.tmp')
+    rows = 0
+    try:
+        with tmp.open('w', encoding='utf-8', errors='replace', newline='') as out:
+            writer = csv.writer(out)
+            writer.writerow(columns + [INSTANCE_COLUMN])
+            for (label, path), header in zip(files, headers):
+                position = None if header == columns else [columns.index(column) for column in header]
+                with Path(path).open(encoding='utf-8-sig', errors='replace', newline='') as fh:
+                    reader = csv.reader(fh)
+                    next(reader, None)
+                    for row in reader:
+                        if not row:
+                            continue
+                        if position is not None:
+                            values = [''] * len(columns)
+                            for n, value in zip(position, row):
+                                values[n] = value
+                            row = values
+                        elif len(row) != len(columns):  # ragged row. keep the label in its column
+                            row = (row + [''] * len(columns))[:len(columns)]
+                        writer.writerow(row + [label])
+                        rows += 1
+        os.replace(tmp, out_file)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    return rows
+
+
+def merge_outputs(parts, out_dir):
+    """
+    Merge the CSVs in each instance folder into out_dir, one file per kind of output
+    :param parts: {instance label: folder the tool wrote that instance's CSVs to}
+    :param out_dir: folder for the merged CSVs
+    :return: list of (merged file, rows written)
+    """
+    kinds = {}
+    for label, folder in parts.items():
+        for path in sorted(Path(folder).glob('*.csv')):
+            kinds.setdefault(output_kind(path.name), []).append((label, path))
+    return [(Path(out_dir) / kind, merge_csvs(files, Path(out_dir) / kind)) for kind, files in kinds.items()]
@@ -0,0 +1,159 @@
+"""
+Convert parsed output CSVs to Parquet, a block at a time.
+
+Each CSV is read twice. The first pass works out a type for every column: integer,
+float, timestamp, boolean, or text when values don't all fit one of those. The
+second pass converts the values and writes them, dictionary encoded and zstd
+compressed. Empty cells become nulls. Memory use depends on the block size, not on
+the size of the CSV. Needs pyarrow (pip install pyarrow).
+
+python -m convert.parquet <csv file or folder> <output folder>
+"""
+import csv
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+# folder in the package output that mirrors the CSV tree with .parquet files
+PARQUET_DIR = 'Parquet'
+# bytes of CSV parsed at a time
+BLOCK_SIZE = 16 * 2 ** 20
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.csv
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('Parquet export needs pyarrow. pip install pyarrow')
+    return pyarrow
+
+
+def parquet_path(csv_file, root):
+    """:return: where the Parquet copy of a CSV under root goes"""
+    return Path(root) / PARQUET_DIR / Path(csv_file).relative_to(root).with_suffix('.parquet')
+
+
+def _header(path):
+    with Path(path).open(encoding='utf-8-sig', errors='replace', newline='') as fh:
+        return next(csv.reader(fh), [])
+
+
+def _batches(path, header, block_size):
+    """:return: generator of record batches with every column read as text, empty cells as nulls"""
+    pa = _pyarrow()
+    reader = pa.csv.open_csv(
+        str(path),
+        read_options=pa.csv.ReadOptions(block_size=block_size),
+        parse_options=pa.csv.ParseOptions(newlines_in_values=True, invalid_row_handler=lambda row: 'skip'),
+        convert_options=pa.csv.ConvertOptions(column_types={name: pa.string() for name in header},
+                                              strings_can_be_null=True, null_values=['']))
+    for batch in reader:
+        yield batch
+
+
+def _fits(column, candidate):
+    pa = _pyarrow()
+    pc = pa.compute
+    try:
+        column.cast(candidate)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        return False
+    if pa.types.is_integer(candidate) or pa.types.is_floating(candidate):
+        # leading zeros are part of the value (e.g. codes), and long whole numbers (ids, serials) would lose
+        # digits as floats. keep both as text
+        return not pc.any(pc.match_substring_regex(column, r'^-?0\d|^-?\d{16,}$')).as_py()
+    return True
+
+
+def infer_schema(path, block_size=BLOCK_SIZE):
+    """
+    Work out column types from every value in a CSV
+    :return: pyarrow schema. columns with no values are text
+    """
+    pa = _pyarrow()
+    header = _header(path)
+    order = [pa.int64(), pa.float64(), pa.timestamp('ns'), pa.bool_()]
+    candidates = {name: list(order) for name in header}
+    seen = set()
+    for batch in _batches(path, header, block_size):
+        for name, column in zip(batch.schema.names, batch.columns):
+            if column.null_count == len(column):
+                continue
+            seen.add(name)
+            candidates[name] = [c for c in candidates[name] if _fits(column, c)]
+    return pa.schema([(name, candidates[name][0] if name in seen and candidates[name] else pa.string())
+                      for name in header])
+
+
+def convert_file(path, out_file, block_size=BLOCK_SIZE):
+    """
+    Convert a CSV to Parquet. The file is written to a temporary name and renamed when done
+    :return: number of rows written
+    """
+    pa = _pyarrow()
+    schema = infer_schema(path, block_size)
+    out_file = Path(out_file)
+    out_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out_file.with_name(out_file.name + '.tmp')
+    rows = 0
+    try:
+        with pa.parquet.ParquetWriter(str(tmp), schema, compression='zstd', use_dictionary=True) as writer:
+            for batch in _batches(path, schema.names, block_size):
+                columns = [column.cast(field.type) for column, field in zip(batch.columns, schema)]
+                writer.write_batch(pa.RecordBatch.from_arrays(columns, schema=schema))
+                rows += batch.num_rows
+        os.replace(tmp, out_file)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    return rows
+
+
+def _convert(path, out_file):
+    try:
+        return path, convert_file(path, out_file), None
+    except Exception as e:
+        return path, 0, str(e)
+
+
+def convert_files(files, root, workers=1):
+    """
+    Convert CSVs under root to Parquet files in root/Parquet, in the same folder layout
+    :param files: list of CSV files under root
+    :param root: package output folder
+    :param workers: files converted at once in worker processes
+    :return: generator of (file, rows written, error message or None) as files finish
+    """
+    _pyarrow()  # fail once, not for every file
+    jobs = [(Path(f), parquet_path(f, root)) for f in files]
+
+    if workers <= 1 or len(jobs) <= 1:
+        for path, out_file in jobs:
+            yield _convert(path, out_file)
+        return
+
+    with ProcessPoolExecutor(min(workers, len(jobs))) as pool:
+        futures = [pool.submit(_convert, path, out_file) for path, out_file in jobs]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def main():
+    source = Path(sys.argv[1])
+    out_dir = Path(sys.argv[2])
+    if source.is_dir():
+        files = sorted(source.rglob('*.csv'))
+        jobs = [(path, out_dir / path.relative_to(source).with_suffix('.parquet')) for path in files]
+    else:
+        jobs = [(source, out_dir / source.with_suffix('.parquet').name)]
+    for path, out_file in jobs:
+        path, rows, error = _convert(path, out_file)
+        print(f'{path.name}: {error}' if error else f'{path.name}: {rows} rows')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+# default cache size limit, in GB
+MAX_GB = 50
+# bytes hashed at a time
+READ_SIZE = 2 ** 20
+
+_ENTRY = 'entry.json'
+
+
+def file_hash(path):
+    """:return: sha256 hex digest of a file's content"""
+    digest = hashlib.sha256()
+    with Path(path).open('rb') as fh:
+        for block in iter(lambda: fh.read(READ_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ToolCache:
+    """
+    EZ tool output kept on disk, keyed by what the output depends on: the content of
+    the artifacts the tool reads (and where they sit in the package), the tool itself,
+    and its arguments. A package with the same artifacts as one seen before (a
+    re-acquired host, the same hive in two collections, a rerun) gets the earlier
+    CSVs copied into place instead of running the tool again.
+
+    Entries are evicted least recently used first once the cache is over max_bytes.
+    Paths of the package an entry was made from are rewritten to the new package's
+    when it is restored, so SourceFile style columns stay correct.
+    """
+
+    def __init__(self, root, max_bytes=MAX_GB * 2 ** 30):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.saved = 0.0  # seconds of tool run time the hits would have taken
+        self._hashes = {}
+        self._lock = threading.Lock()
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _hash(self, path):
+        stat = path.stat()
+        memo = (str(path), stat.st_size, stat.st_mtime_ns)
+        if memo not in self._hashes:
+            self._hashes[memo] = file_hash(path)
+        return self._hashes[memo]
+
+    def key(self, command, inputs, package, out_path, tools):
+        """
+        :param command: tool command line
+        :param inputs: every file the tool output depends on
+        :param package: extracted package folder. paths are keyed relative to it
+        :param out_path: the tool's output folder
+        :param tools: tools folder
+        :return: cache key
+        """
+        def name(path):
+            return str(path).replace(str(out_path), '<out>').replace(str(package), '<package>').replace(
+                str(tools), '<tools>')
+
+        tool = Path(command[0])
+        # tools in their own folder (EvtxECmd, RECmd) read maps and plugins from it
+        tool_files = sorted(p for p in tool.parent.rglob('*') if p.is_file()) if tool.parent != Path(tools) \
+            else [tool]
+        files = sorted((name(p), self._hash(Path(p))) for p in inputs)
+        data = json.dumps([[(name(p), self._hash(p)) for p in tool_files], [name(a) for a in command[1:]], files])
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def _entry(self, key):
+        return self.root / key[:2] / key
+
+    def restore(self, key, out_path, package):
+        """
+        Copy the cached output for key into out_path
+        :param package: extracted package folder. replaces the folder the entry was made from in the output
+        :return: list of restored files, or None on a miss
+        """
+        entry = self._entry(key)
+        try:
+            with (entry / _ENTRY).open(encoding='utf-8') as fh:
+                meta = json.load(fh)
+            os.utime(entry / _ENTRY)  # last used, for LRU eviction
+            out_path = Path(out_path)
+            restored = []
+            for name in meta['files']:
+                target = out_path / name
+                target.parent.mkdir(parents=True, exist_ok=True)
+                if meta['package'] == str(package):
+                    # a copy, not a link, so later changes to the output (e.g. --compress) can't reach the cache.
+                    # unlinked first in case it is a link to the entry from an older restore
+                    if target.exists():
+                        target.unlink()
+                    shutil.copy2(entry / 'files' / name, target)
+                else:
+                    _rewrite(entry / 'files' / name, target, meta['package'], str(package))
+                restored.append(target)
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+            self.saved += meta.get('seconds', 0)
+        return restored
+
+    def store(self, key, files, out_path, package, seconds):
+        """
+        Add a tool's output to the cache
+        :param files: output files the tool wrote, inside out_path
+        :param seconds: how long the tool ran
+        """
+        entry = self._entry(key)
+        if entry.exists():
+            return
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        tmp = Path(tempfile.mkdtemp(prefix='.tmp-', dir=entry.parent))
+        try:
+            names = []
+            size = 0
+            for f in files:
+                name = str(Path(f).relative_to(out_path))
+                (tmp / 'files' / name).parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(f, tmp / 'files' / name)
+                size += Path(f).stat().st_size
+                names.append(name)
+            with (tmp / _ENTRY).open('w', encoding='utf-8') as fh:
+                json.dump({'package': str(package), 'files': names, 'size': size, 'seconds': seconds}, fh)
+            os.rename(tmp, entry)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)  # another process stored it first, or the disk is full
+            return
+        self.evict()
+
+    def evict(self):
+        """delete least recently used entries until the cache is under max_bytes"""
+        entries = []
+        total = 0
+        for meta_file in self.root.glob(f'*/*/{_ENTRY}'):
+            try:
+                with meta_file.open(encoding='utf-8') as fh:
+                    size = json.load(fh)['size']
+                entries.append((meta_file.stat().st_mtime, size, meta_file.parent))
+            except (OSError, ValueError, KeyError):
+                continue
+            total += size
+
+        for _, size, entry in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def stats(self):
+        """:return: one line summary of hits and misses"""
+        saved = time.strftime('%H:%M:%S', time.gmtime(self.saved))
+        return f'Tool cache: {self.hits} hit(s), {self.misses} miss(es). About {saved} of tool run time saved'
+
+
+def _rewrite(src, dst, old, new):
+    """copy src to dst, replacing the path of the package the output was made from"""
+    with open(src, encoding='utf-8', errors='surrogateescape', newline='') as fin, \
+            open(dst, 'w', encoding='utf-8', errors='surrogateescape', newline='') as fout:
+        for line in fin:
+            fout.write(line.replace(old, new))
@@ -0,0 +1,127 @@
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+
+MANIFEST = 'RunManifest.json'
+
+
+def _now():
+    return str(datetime.now().replace(microsecond=0))
+
+
+class RunManifest:
+    """
+    What a package run has done so far, saved to RunManifest.json in the package
+    output folder after every change so it survives a crash, timeout or Ctrl-C.
+
+    Records whether the package was extracted and, for each stage, its status
+    (running, done or failed), start/end time, duration, the artifacts it read and
+    the output files it wrote. --resume uses it to skip finished stages and reuse
+    the extracted package.
+    """
+
+    def __init__(self, path, data=None):
+        self.path = Path(path)
+        self.data = data if data is not None else {'stages': {}}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, out_dir, resume=False):
+        """
+        :param out_dir: package output folder
+        :param resume: keep what an earlier run recorded. otherwise start a new manifest
+        :return: RunManifest
+        """
+        path = Path(out_dir) / MANIFEST
+        if resume and path.is_file():
+            try:
+                with path.open(encoding='utf-8') as fh:
+                    return cls(path, json.load(fh))
+            except (OSError, ValueError):
+                pass  # unreadable manifest. nothing can be trusted, start over
+        return cls(path)
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def update(self, **values):
+        with self._lock:
+            self.data.update(values)
+            self._save()
+
+    def stage(self, name):
+        """:return: what was recorded for a stage. empty dict if it hasn't run"""
+        return self.data['stages'].get(name, {})
+
+    def done(self, name):
+        return self.stage(name).get('status') == 'done'
+
+    def start(self, name):
+        with self._lock:
+            self.data['stages'][name] = {'status': 'running', 'start': _now(), 'inputs': [], 'output_dirs': []}
+            self._save()
+
+    def add(self, name, kind, paths, root):
+        """
+        record paths a running stage reads (inputs) or writes to (output_dirs)
+        :param root: paths are stored relative to root
+        """
+        with self._lock:
+            stage = self.data['stages'].get(name)
+            if stage is None:
+                return
+            for path in paths:
+                path = _relative(path, root)
+                if path not in stage[kind]:
+                    stage[kind].append(path)
+            self._save()
+
+    def finish(self, name, status, out_dir, error=None):
+        """
+        :param status: done or failed
+        :param out_dir: package output folder. files in the stage's output dirs are listed
+        :param error: why the stage failed
+        """
+        with self._lock:
+            stage = self.data['stages'][name]
+            end = datetime.now().replace(microsecond=0)
+            stage['status'] = status
+            stage['end'] = str(end)
+            stage['duration'] = str(end - datetime.fromisoformat(stage['start']))
+            stage['outputs'] = sorted(str(p.relative_to(out_dir)) for d in stage['output_dirs']
+                                      if (out_dir / d).is_dir() for p in (out_dir / d).rglob('*') if p.is_file())
+            if error:
+                stage['error'] = error
+            self._save()
+
+    def _save(self):
+        self.data['updated'] = _now()
+        tmp = self.path.with_suffix('.tmp')
+        with tmp.open('w', encoding='utf-8') as fh:
+            json.dump(self.data, fh, indent=2)
+        os.replace(tmp, self.path)
+
+
+def _relative(path, root):
+    try:
+        return str(Path(path).relative_to(root))
+    except ValueError:
+        return str(path)
+
+
+def unfinished(out_dir, source_dir):
+    """
+    Packages from source_dir with an unfinished run in out_dir whose extracted
+    package is still there. their archives may already be deleted
+    :return: list of archive paths
+    """
+    found = []
+    for path in sorted(Path(out_dir).glob(f'*/{MANIFEST}')):
+        manifest = RunManifest.open(path.parent, resume=True)
+        source = manifest.get('source')
+        if (source and not manifest.get('finished') and Path(source).parent == Path(source_dir).resolve() and
+                manifest.get('extracted') and Path(manifest.get('extracted')).is_dir()):
+            found.append(Path(source))
+    return found
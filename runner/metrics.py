@@ -0,0 +1,168 @@
+import csv
+import io
+import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import psutil
+except ImportError:  # optional. without it tool CPU, memory and I/O come from resource (not on Windows)
+    psutil = None
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+FIELDS = ['package', 'kind', 'name', 'stage', 'start', 'wall_s', 'cpu_s', 'peak_rss_mb', 'read_mb', 'write_mb',
+          'files']
+# seconds between samples of a running tool
+SAMPLE_SECS = 0.2
+MB = 2 ** 20
+
+
+def _self_usage():
+    """:return: (peak rss bytes, bytes read, bytes written) of this process, None where unknown"""
+    if psutil is not None:
+        proc = psutil.Process()
+        mem = proc.memory_info()
+        try:
+            counters = proc.io_counters()
+            read, written = counters.read_bytes, counters.write_bytes
+        except (AttributeError, psutil.Error):
+            read = written = None
+        return getattr(mem, 'peak_wset', mem.rss), read, written
+    if resource is not None:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return usage.ru_maxrss * 1024, usage.ru_inblock * 512, usage.ru_oublock * 512
+    return None, None, None
+
+
+class _Sampler(threading.Thread):
+    """poll a running tool with psutil for CPU time, peak memory and I/O"""
+
+    def __init__(self, pid):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.cpu = self.peak = self.read = self.written = None
+        self._done = threading.Event()
+        self.start()
+
+    def run(self):
+        try:
+            proc = psutil.Process(self.pid)
+            while True:
+                with proc.oneshot():
+                    times = proc.cpu_times()
+                    mem = proc.memory_info()
+                    self.cpu = times.user + times.system
+                    self.peak = max(self.peak or 0, getattr(mem, 'peak_wset', mem.rss))
+                    try:
+                        counters = proc.io_counters()
+                        self.read, self.written = counters.read_bytes, counters.write_bytes
+                    except (AttributeError, psutil.Error):
+                        pass
+                if self._done.wait(SAMPLE_SECS):
+                    break
+        except psutil.Error:
+            pass  # the tool has exited
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+def _mb(value):
+    return None if value is None else round(value / MB, 1)
+
+
+class Metrics:
+    """
+    Timing and resource use of every step, stage and EZ tool run of a package,
+    written to RunMetrics.json and RunMetrics.csv in the package output folder.
+
+    Steps and stages record wall time and the CPU time of the thread running them.
+    Their memory and I/O figures are for the whole PackageParser process. Tool runs
+    record the tool's own CPU time, peak memory and I/O (needs psutil on Windows).
+    """
+
+    def __init__(self, package, profile_dir=None):
+        """
+        :param package: package name
+        :param profile_dir: folder for cProfile output of steps measured with profile=True. None turns it off
+        """
+        self.package = package
+        self.profile_dir = Path(profile_dir) if profile_dir else None
+        self.records = []
+        self._lock = threading.Lock()
+
+    def add(self, kind, name, start, wall, stage=None, files=None, **usage):
+        record = dict.fromkeys(FIELDS)
+        record.update(package=self.package, kind=kind, name=name, stage=stage, start=str(start),
+                      wall_s=round(wall, 2), files=files, **usage)
+        if record['cpu_s'] is not None:
+            record['cpu_s'] = round(record['cpu_s'], 2)
+        with self._lock:
+            self.records.append(record)
+
+    @contextmanager
+    def measure(self, kind, name, profile=False):
+        """
+        Measure a block of Python code. The caller can set 'files' in the yielded dict
+        :param kind: step or stage
+        :param profile: run the block under cProfile when profiling is on
+        """
+        info = {'files': None}
+        start = datetime.now().replace(microsecond=0)
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        _, read, written = _self_usage()
+        profiler = self._profiler() if profile else None
+        try:
+            yield info
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                self._dump(profiler, name)
+            peak, read_after, written_after = _self_usage()
+            self.add(kind, name, start, time.perf_counter() - wall, files=info['files'],
+                     cpu_s=time.thread_time() - cpu, peak_rss_mb=_mb(peak),
+                     read_mb=_mb(read_after - read) if read is not None else None,
+                     write_mb=_mb(written_after - written) if written is not None else None)
+
+    def _profiler(self):
+        if self.profile_dir is None:
+            return None
+        import cProfile  # only with --profile
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # python 3.12+ allows one profiler at a time
+            return None
+        return profiler
+
+    def _dump(self, profiler, name):
+        """write <name>.prof (for snakeviz, pstats) and <name>.txt, the top 30 functions by cumulative time"""
+        import pstats
+
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(str(self.profile_dir / f'{name}.prof'))
+        text = io.StringIO()
+        pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(30)
+        (self.profile_dir / f'{name}.txt').write_text(text.getvalue(), encoding='utf-8')
+
+    def save(self, out_dir):
+        """write RunMetrics.json and RunMetrics.csv"""
+        out_dir = Path(out_dir)
+        with self._lock:
+            records = list(self.records)
+        with (out_dir / 'RunMetrics.json').open('w', encoding='utf-8') as fh:
+            json.dump(records, fh, indent=2)
+        with (out_dir / 'RunMetrics.csv').open('w', newline='', encoding='utf-8') as fh:
+            writer = csv.DictWriter(fh, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(records)
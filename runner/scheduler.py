@@ -0,0 +1,85 @@
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+
+# a unit of work for the Scheduler. needs: names of stages that must finish first.
+# resource: class used to cap how many stages of one kind run at once (see Scheduler)
+Stage = namedtuple('Stage', ['name', 'func', 'needs', 'resource'], defaults=[(), 'light'])
+
+# result of a finished stage, yielded in stage declaration order
+StageResult = namedtuple('StageResult', ['stage', 'value', 'error', 'start', 'end'])
+
+
+class Scheduler:
+    """
+    Run independent stages concurrently on a thread pool.
+
+    A stage starts once every stage it needs has finished (failed counts as finished)
+    and both a worker and a slot in its resource class are free. Results are yielded
+    in the order the stages were declared, so callers can log them in a stable order
+    no matter which stage finished first.
+    """
+
+    def __init__(self, workers=1, limits=None):
+        """
+        :param workers: stages running at the same time
+        :param limits: {resource class: max running at once}, e.g. {'heavy': 1}
+        """
+        self.workers = max(1, workers)
+        self.limits = limits or {}
+
+    def run(self, stages, call=None):
+        """
+        :param stages: list of Stage
+        :param call: optional callable(stage) that runs a stage. defaults to stage.func()
+        :return: generator of StageResult in declaration order
+        """
+        names = {stage.name for stage in stages}
+        for stage in stages:
+            missing = [n for n in stage.needs if n not in names]
+            if missing:
+                raise ValueError(f'{stage.name} needs unknown stage(s): {", ".join(missing)}')
+
+        call = call or (lambda stage: stage.func())
+        finished = {}
+        running = {}
+        waiting = list(stages)
+        next_yield = 0
+
+        def timed(stage):
+            start = datetime.now()
+            try:
+                return stage, call(stage), None, start
+            except Exception as e:
+                return stage, None, e, start
+
+        with ThreadPoolExecutor(self.workers) as pool:
+            while next_yield < len(stages):
+                busy = {}
+                for stage in running.values():
+                    busy[stage.resource] = busy.get(stage.resource, 0) + 1
+
+                for stage in list(waiting):
+                    if len(running) >= self.workers:
+                        break
+                    if any(n not in finished for n in stage.needs):
+                        continue
+                    if busy.get(stage.resource, 0) >= self.limits.get(stage.resource, self.workers):
+                        continue
+                    waiting.remove(stage)
+                    running[pool.submit(timed, stage)] = stage
+                    busy[stage.resource] = busy.get(stage.resource, 0) + 1
+
+                if not running:
+                    raise RuntimeError('stages left that can never start: ' +
+                                       ', '.join(s.name for s in waiting))
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    del running[future]
+                    stage, value, error, start = future.result()
+                    finished[stage.name] = StageResult(stage, value, error, start, datetime.now())
+
+                while next_yield < len(stages) and stages[next_yield].name in finished:
+                    yield finished[stages[next_yield].name]
+                    next_yield += 1
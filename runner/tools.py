@@ -0,0 +1,318 @@
+import asyncio
+import codecs
+import json
+import os
+import signal
+import statistics
+import subprocess
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from .metrics import _Sampler, _mb, psutil, resource
+
+RATES = 'ToolRates.json'
+PROGRESS = 'ToolProgress.json'
+# shortest timeout. covers tool start up and small inputs
+MIN_TIMEOUT = 120
+MAX_TIMEOUT = 24 * 3600
+# a tool may take this many times longer than a run at its median rate before it is killed
+SLACK = 4
+# most a tool's timeouts grow after it is killed by them
+MAX_ESCALATION = 8
+# runs remembered per tool
+SAMPLES = 20
+# smaller inputs are mostly start up time and say little about throughput
+MIN_SAMPLE_BYTES = 2 ** 20
+# seconds between writes of ToolProgress.json
+PROGRESS_SECS = 2
+MB = 2 ** 20
+# seconds to wait for the rest of a tool's output after it exits
+READ_GRACE = 10
+# asyncio stream buffer size, as create_subprocess_exec uses
+READ_LIMIT = 2 ** 16
+
+
+def tool_key(command):
+    """:return: name throughput is recorded under. RECmd is timed per batch file"""
+    name = Path(command[0]).name
+    if '--bn' in command:
+        name += ':' + Path(command[command.index('--bn') + 1]).name
+    return name
+
+
+def input_size(paths):
+    """:return: total bytes of the files in paths, None if there are none"""
+    size = 0
+    for path in paths or ():
+        try:
+            size += os.path.getsize(path)
+        except OSError:
+            pass
+    return size or None
+
+
+class ToolTimeouts:
+    """
+    Timeouts from input size and how fast each tool has been before.
+
+    The input MB/s of the last SAMPLES finished runs of every tool is kept in
+    ToolRates.json in the output folder, shared by all packages written there. A tool
+    gets MIN_TIMEOUT plus SLACK times as long as a run at its median rate would take
+    on the input. Tools that haven't been timed yet, and runs without a known input
+    size, get the caller's fixed timeout. Some tools spend their time per hive or
+    per batch rather than per byte, so no rate is assumed for them.
+
+    Runs killed by their timeout say nothing about throughput and aren't recorded as
+    rates. Instead each timeout doubles the tool's timeouts (up to MAX_ESCALATION
+    times) until it next finishes.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.rates, self.escalation = self._load()
+
+    def _load(self):
+        """:return: ({key: [MB/s]}, {key: timeout multiplier})"""
+        try:
+            with self.path.open(encoding='utf-8') as fh:
+                data = json.load(fh)
+        except (OSError, ValueError):
+            return {}, {}
+        if 'rates' not in data:  # written before timeouts were kept apart
+            return data, {}
+        return data['rates'], data.get('escalation', {})
+
+    def timeout(self, key, size, default):
+        """
+        :param key: tool_key of the command
+        :param size: input bytes, or None
+        :param default: seconds to use when the input size isn't known or the tool has no history
+        :return: seconds
+        """
+        if not size or not self.rates.get(key):
+            seconds = default
+        else:
+            seconds = MIN_TIMEOUT + SLACK * size / MB / statistics.median(self.rates[key])
+        return int(min(MAX_TIMEOUT, seconds * self.escalation.get(key, 1)))
+
+    def record(self, key, size, seconds):
+        """remember the throughput of a run that finished, and drop any timeout escalation"""
+        sample = size and seconds > 0 and size >= MIN_SAMPLE_BYTES
+        if not sample and key not in self.escalation:
+            return
+        with self._lock:
+            rates, escalation = self._load()  # other packages may have recorded runs since
+            if sample:
+                rates[key] = (rates.get(key, []) + [float(f'{size / MB / seconds:.3g}')])[-SAMPLES:]
+            escalation.pop(key, None)
+            self._save(rates, escalation)
+
+    def timed_out(self, key):
+        """a run was killed by its timeout. the tool's next timeouts are twice as long"""
+        with self._lock:
+            rates, escalation = self._load()
+            escalation[key] = min(MAX_ESCALATION, escalation.get(key, 1) * 2)
+            self._save(rates, escalation)
+
+    def _save(self, rates, escalation):
+        self.rates, self.escalation = rates, escalation
+        tmp = self.path.with_name(f'{self.path.name}.{os.getpid()}.tmp')
+        try:
+            with tmp.open('w', encoding='utf-8') as fh:
+                json.dump({'rates': rates, 'escalation': escalation}, fh, indent=2)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass  # another package is writing it. this run just isn't recorded
+
+
+class ToolProgress:
+    """
+    The EZ tools running for a package, kept in ToolProgress.json in the package
+    output folder while they run: how long each has run, its timeout, input size,
+    the output written so far and the last line it printed.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.running = {}
+        self._lock = threading.Lock()
+        self._written = 0
+
+    def start(self, name, stage, timeout, size, out_path):
+        entry = {'tool': name, 'stage': stage, 'pid': None, 'started': str(datetime.now().replace(microsecond=0)),
+                 'elapsed_s': 0, 'timeout_s': timeout, 'input_mb': _mb(size), 'output_mb': None, 'last_line': '',
+                 '_start': time.monotonic(), '_out': out_path}
+        with self._lock:
+            self.running[id(entry)] = entry
+        return entry
+
+    def finish(self, entry):
+        with self._lock:
+            self.running.pop(id(entry), None)
+        self.write(force=True)
+
+    def write(self, force=False):
+        if not force and time.monotonic() - self._written < PROGRESS_SECS:
+            return
+        self._written = time.monotonic()
+        with self._lock:
+            entries = list(self.running.values())
+        tools = []
+        for entry in entries:
+            entry['elapsed_s'] = round(time.monotonic() - entry['_start'])
+            if entry['_out'] is not None:
+                entry['output_mb'] = _mb(_folder_size(entry['_out']))
+            tools.append({k: v for k, v in entry.items() if not k.startswith('_')})
+        tmp = self.path.with_name(f'{self.path.name}.{threading.get_ident()}.tmp')
+        try:
+            with tmp.open('w', encoding='utf-8') as fh:
+                json.dump({'updated': str(datetime.now().replace(microsecond=0)), 'running': tools}, fh, indent=2)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass  # progress is best effort. tools running at the same time may race on Windows
+
+
+def _folder_size(path):
+    total = 0
+    for dirpath, _, names in os.walk(path):
+        for name in names:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+def kill_tree(pid):
+    """kill a process and everything it started"""
+    if psutil is not None:
+        try:
+            parent = psutil.Process(pid)
+            procs = parent.children(recursive=True) + [parent]
+        except psutil.Error:
+            return
+        for proc in procs:
+            try:
+                proc.kill()
+            except psutil.Error:
+                pass
+        psutil.wait_procs(procs, timeout=10)
+    elif os.name == 'nt':
+        subprocess.run(['taskkill', '/F', '/T', '/PID', str(pid)], stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL)
+    else:
+        try:
+            os.killpg(pid, signal.SIGKILL)  # started as a process group leader, see _run
+        except OSError:
+            pass
+
+
+class _ToolProtocol(asyncio.subprocess.SubprocessStreamProtocol):
+    """subprocess protocol with a future set when the process exits, whether or not its stdout is closed"""
+
+    def __init__(self, loop):
+        super().__init__(READ_LIMIT, loop)
+        self.exited = loop.create_future()
+
+    def process_exited(self):
+        super().process_exited()
+        if not self.exited.done():
+            self.exited.set_result(None)
+
+
+async def _run(command, timeout, on_line, entry, tick):
+    kwargs = {}
+    if os.name != 'nt' and psutil is None:
+        kwargs['start_new_session'] = True  # so kill_tree can kill the group without psutil
+    loop = asyncio.get_running_loop()
+    # create_subprocess_exec, keeping the transport so the pipe can be closed if it never reaches EOF
+    transport, protocol = await loop.subprocess_exec(lambda: _ToolProtocol(loop), *command,
+                                                     stdout=asyncio.subprocess.PIPE,
+                                                     stderr=asyncio.subprocess.STDOUT, **kwargs)
+    proc = asyncio.subprocess.Process(transport, protocol, loop)
+    if entry is not None:
+        entry['pid'] = proc.pid
+    sampler = _Sampler(proc.pid) if psutil is not None else None
+
+    async def read():
+        decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        pending = ''
+        while True:
+            data = await proc.stdout.read(65536)
+            if not data:
+                break
+            # EZ tools redraw progress with \r, so treat it as a line end too
+            lines = (pending + decoder.decode(data)).replace('\r\n', '\n').replace('\r', '\n').split('\n')
+            pending = lines.pop()
+            for line in lines:
+                if line.strip():
+                    on_line(line)
+        if pending.strip():
+            on_line(pending)
+
+    async def ticker():
+        while True:
+            await asyncio.sleep(PROGRESS_SECS)
+            tick()
+
+    reader = asyncio.ensure_future(read())
+    ticking = asyncio.ensure_future(ticker()) if tick is not None else None
+    try:
+        # not proc.wait(), which also waits for stdout to close
+        try:
+            await asyncio.wait_for(asyncio.shield(protocol.exited), timeout)
+        except asyncio.TimeoutError:
+            kill_tree(proc.pid)
+            await protocol.exited
+            raise subprocess.TimeoutExpired(command, timeout)
+        try:
+            await asyncio.wait_for(reader, READ_GRACE)
+        except asyncio.TimeoutError:
+            # a process the tool started still has its stdout open. don't wait for it
+            on_line(f'output still open {READ_GRACE}s after exit, stopped reading')
+    finally:
+        if proc.returncode is None:  # cancelled, e.g. Ctrl-C
+            kill_tree(proc.pid)
+        reader.cancel()
+        transport.close()
+        if ticking is not None:
+            ticking.cancel()
+        if sampler is not None:
+            sampler.stop()
+    return proc.returncode, sampler
+
+
+def run_streamed(command, timeout, on_line, entry=None, tick=None):
+    """
+    Run an EZ tool on an asyncio event loop, passing each line it prints to on_line
+    as it arrives. On timeout the tool and any processes it started are killed.
+    Safe to call from several threads at once, each gets its own event loop.
+    :param on_line: callable(line)
+    :param entry: optional ToolProgress entry, updated with the pid and last line
+    :param tick: optional callable, called every few seconds while the tool runs
+    :return: (CompletedProcess, {cpu_s, peak_rss_mb, read_mb, write_mb}). values are None where unknown
+    raises subprocess.TimeoutExpired
+    """
+    before = resource.getrusage(resource.RUSAGE_CHILDREN) if resource is not None and psutil is None else None
+
+    def line_seen(line):
+        if entry is not None:
+            entry['last_line'] = line.strip()[:200]
+        on_line(line)
+
+    returncode, sampler = asyncio.run(_run(command, timeout, line_seen, entry, tick))
+
+    usage = dict(cpu_s=None, peak_rss_mb=None, read_mb=None, write_mb=None)
+    if sampler is not None:
+        usage.update(cpu_s=sampler.cpu, peak_rss_mb=_mb(sampler.peak), read_mb=_mb(sampler.read),
+                     write_mb=_mb(sampler.written))
+    elif before is not None:
+        # all children of this process. only exact when tools don't run at the same time
+        after = resource.getrusage(resource.RUSAGE_CHILDREN)
+        usage.update(cpu_s=after.ru_utime + after.ru_stime - before.ru_utime - before.ru_stime,
+                     read_mb=_mb((after.ru_inblock - before.ru_inblock) * 512),
+                     write_mb=_mb((after.ru_oublock - before.ru_oublock) * 512))
+    return subprocess.CompletedProcess(command, returncode), usage
@@ -0,0 +1,187 @@
+import csv
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import wait, FIRST_COMPLETED
+from datetime import datetime
+from pathlib import Path
+
+STATUS = 'WatchStatus.json'
+SUMMARY = 'WatchSummary.csv'
+EXTENSIONS = ('.7z', '.zip', '.gz')
+# recent packages listed in the status file
+RECENT = 20
+
+
+def _now():
+    return str(datetime.now().replace(microsecond=0))
+
+
+class IntakeWatcher:
+    """
+    Watch an intake folder and process packages as they arrive.
+
+    The folder is polled. A new archive is only queued once its size and modification
+    time haven't changed for settle seconds and it can be opened, so packages still
+    being copied are left alone. Queued packages go to a pool of jobs worker processes
+    and WatchStatus.json in the output folder shows what is settling, queued and
+    running, what finished, and the throughput so far. A summary row for each
+    processed package is added to WatchSummary.csv.
+    """
+
+    def __init__(self, intake, out_dir, process, jobs=1, settle=30, poll=5, on_done=None):
+        """
+        :param intake: folder packages are copied to
+        :param out_dir: output folder, also where WatchStatus.json is written
+        :param process: picklable callable(archive path) run in a worker, returning a run_package style summary
+        :param jobs: packages processed at once
+        :param settle: seconds an archive's size and mtime must stay the same before it is queued
+        :param poll: seconds between looks at the intake folder
+        :param on_done: optional callable, called with each summary as packages finish
+        """
+        self.intake = Path(intake)
+        self.out_dir = Path(out_dir)
+        self.process = process
+        self.jobs = max(1, jobs)
+        self.settle = settle
+        self.poll = poll
+        self.on_done = on_done
+        self.status_file = self.out_dir / STATUS
+        self.settling = {}  # {archive: ((size, mtime_ns), first seen unchanged)}
+        self.queue = deque()
+        self.running = {}  # {future: (archive, signature, started)}
+        self.handled = {}  # {archive: signature} processed archives still in the folder, e.g. failed ones
+        self.recent = deque(maxlen=RECENT)
+        self.counts = {'done': 0, 'failed': 0}
+        self.busy_seconds = 0.0
+        self.started = time.time()
+
+    def scan(self):
+        """look at the intake folder and queue archives that have finished arriving"""
+        now = time.time()
+        present = set()
+        queued = {a for a, _ in self.queue} | {a for a, _, _ in self.running.values()}
+
+        for path in sorted(self.intake.iterdir()):
+            if path.suffix.lower() not in EXTENSIONS or path in queued:
+                continue
+            try:
+                stat = path.stat()
+            except OSError:  # removed since listing
+                continue
+            if not path.is_file():
+                continue
+            present.add(path)
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if self.handled.get(path) == signature:
+                continue
+
+            seen = self.settling.get(path)
+            if seen is None or seen[0] != signature:
+                self.settling[path] = (signature, now)
+            elif now - seen[1] >= self.settle and _readable(path):
+                del self.settling[path]
+                self.handled.pop(path, None)
+                self.queue.append((path, signature))
+
+        for path in list(self.settling):
+            if path not in present:
+                del self.settling[path]
+        for path in list(self.handled):
+            if path not in present:
+                del self.handled[path]
+
+    def submit(self, pool):
+        while self.queue and len(self.running) < self.jobs:
+            archive, signature = self.queue.popleft()
+            self.running[pool.submit(self.process, archive)] = (archive, signature, time.time())
+
+    def collect(self, timeout):
+        """wait up to timeout seconds for running packages and record the ones that finish"""
+        if not self.running:
+            time.sleep(timeout)
+            return
+        done, _ = wait(self.running, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            archive, signature, started = self.running.pop(future)
+            self.busy_seconds += time.time() - started
+            try:
+                summary = future.result()
+            except Exception as e:  # the worker died, e.g. out of memory
+                summary = {'Package': archive.name, 'Status': 'FAILED', 'Duration': '', 'Errors': 0, 'Output': '',
+                           'Message': str(e)}
+            self.counts['done' if summary['Status'] == 'OK' else 'failed'] += 1
+            self.handled[archive] = signature
+            summary = dict(summary, Finished=_now())
+            self.recent.appendleft(summary)
+            self.add_summary(summary)
+            if self.on_done:
+                self.on_done(summary)
+
+    def add_summary(self, summary):
+        path = self.out_dir / SUMMARY
+        new = not path.is_file()
+        with path.open('a', newline='', encoding='utf-8') as fh:
+            writer = csv.DictWriter(fh, fieldnames=list(summary))
+            if new:
+                writer.writeheader()
+            writer.writerow(summary)
+
+    def status(self, state='watching'):
+        finished = self.counts['done'] + self.counts['failed']
+        hours = (time.time() - self.started) / 3600
+        return {
+            'state': state,
+            'intake': str(self.intake),
+            'started': str(datetime.fromtimestamp(self.started).replace(microsecond=0)),
+            'updated': _now(),
+            'jobs': self.jobs,
+            'settling': [p.name for p in self.settling],
+            'queue_depth': len(self.queue),
+            'queued': [p.name for p, _ in self.queue],
+            'running': [{'package': a.name, 'started': str(datetime.fromtimestamp(s).replace(microsecond=0))}
+                        for a, _, s in self.running.values()],
+            'done': self.counts['done'],
+            'failed': self.counts['failed'],
+            'packages_per_hour': round(finished / hours, 2) if hours else 0,
+            'avg_package_seconds': round(self.busy_seconds / finished, 1) if finished else None,
+            'recent': list(self.recent),
+        }
+
+    def write_status(self, state='watching'):
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.status_file.with_suffix('.tmp')
+        with tmp.open('w', encoding='utf-8') as fh:
+            json.dump(self.status(state), fh, indent=2)
+        os.replace(tmp, self.status_file)
+
+    def run(self, stop=None):
+        """
+        Watch until Ctrl-C, or until stop() returns True
+        :param stop: optional callable checked after every poll
+        """
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(self.jobs) as pool:
+            try:
+                while True:
+                    self.scan()
+                    self.submit(pool)
+                    self.write_status()
+                    self.collect(self.poll)
+                    if stop is not None and stop():
+                        break
+            finally:
+                for future in self.running:
+                    future.cancel()
+                self.write_status('stopped')
+
+
+def _readable(path):
+    """False while another process holds the file open for writing (Windows copies do)"""
+    try:
+        with path.open('rb'):
+            return True
+    except OSError:
+        return False
@@ -0,0 +1,198 @@
+import csv
+import hashlib
+import heapq
+import pickle
+import shutil
+import tempfile
+from pathlib import Path
+
+SUMMARY_HEADER = ['Line Hash', 'Hits', 'Rules', 'Matches', 'Descriptions', 'Files', 'First Source File',
+                  'Last Source File', 'Found in Line']
+# distinct lines held in memory before they are spilled to disk
+MAX_GROUPS = 100000
+# spill files. each is aggregated on its own at the end, so one holds about 1/PARTITIONS of the lines
+PARTITIONS = 64
+
+
+class _Group:
+    __slots__ = ('seq', 'text', 'rules', 'hits', 'first', 'last', 'files')
+
+    def __init__(self, seq, text, file):
+        self.seq = seq  # order of the line's first hit
+        self.text = text
+        self.rules = {}  # {(key, description): hits}
+        self.hits = 0
+        self.first = self.last = file
+        self.files = 1
+
+    def add(self, rule, file):
+        self.rules[rule] = self.rules.get(rule, 0) + 1
+        self.hits += 1
+        if file != self.last:  # hits come in file order, so a file never comes back
+            self.files += 1
+            self.last = file
+
+    def merge(self, other):
+        """add a later partial group for the same line"""
+        for rule, count in other.rules.items():
+            self.rules[rule] = self.rules.get(rule, 0) + count
+        self.hits += other.hits
+        self.files += other.files - (other.first == self.last)
+        self.last = other.last
+
+    def state(self):
+        return self.seq, self.text, self.rules, self.hits, self.first, self.last, self.files
+
+    @classmethod
+    def from_state(cls, state):
+        group = cls.__new__(cls)
+        group.seq, group.text, group.rules, group.hits, group.first, group.last, group.files = state
+        return group
+
+    def row(self, digest):
+        return [digest.hex(), self.hits, len(self.rules),
+                '; '.join(f'{key} ({count})' for (key, _), count in self.rules.items()),
+                '; '.join(dict.fromkeys(desc for _, desc in self.rules)),
+                self.files, self.first, self.last, self.text]
+
+
+class HitAggregator:
+    """
+    Group search hits by the text they were found in, for the SearchSummary CSV.
+
+    One summary row per distinct line (or column value with --structured) lists the
+    rules that matched it with hit counts, how many hits and source files it has, and
+    the first and last file it was found in. Lines repeated across duplicate outputs
+    or matched by several overlapping rules collapse into one row.
+
+    Groups are kept in memory up to max_groups. Past that they are spilled to
+    partition files by line hash, and at the end each partition is aggregated on its
+    own, so memory stays bounded however many distinct lines there are. Rows are
+    written in the order lines were first found. close() removes the spill files
+    if the rows are never read, e.g. when the search fails.
+    """
+
+    def __init__(self, max_groups=MAX_GROUPS, partitions=PARTITIONS, root=None):
+        """:param root: folder the searched files are under. files are named relative to it"""
+        self.max_groups = max_groups
+        self.partitions = partitions
+        self.root = root
+        self.groups = {}  # {line hash: _Group}
+        self.count = 0
+        self._seq = 0
+        self._spill_dir = None
+        self._spills = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def add(self, row, file=None):
+        """
+        :param row: SearchResults row, [file name, key, description, ..., matched text]
+        :param file: path of the file the hit is from. same-named files in different folders (e.g. each
+        host's Amcache output) are counted apart. Default is the row's file name
+        """
+        text = row[-1].rstrip('\r\n')
+        file = row[0] if file is None else self._name(file)
+        digest = hashlib.blake2b(text.encode('utf-8', 'replace'), digest_size=16).digest()
+        group = self.groups.get(digest)
+        if group is None:
+            if len(self.groups) >= self.max_groups:
+                self._spill()
+            group = self.groups[digest] = _Group(self._seq, text, file)
+            self._seq += 1
+        group.add((row[1], row[2]), file)
+        self.count += 1
+
+    def _name(self, file):
+        if self.root is not None:
+            try:
+                return str(Path(file).relative_to(self.root))
+            except ValueError:
+                pass
+        return str(file)
+
+    def _spill(self):
+        if self._spill_dir is None:
+            self._spill_dir = Path(tempfile.mkdtemp(prefix='SearchSummary_'))
+            self._spills = [(self._spill_dir / f'{n}.part').open('wb') for n in range(self.partitions)]
+        for digest, group in self.groups.items():
+            pickle.dump((digest, group.state()), self._spills[digest[0] % self.partitions], pickle.HIGHEST_PROTOCOL)
+        self.groups.clear()
+
+    def _partitions(self):
+        """:return: generator of sorted (seq, row) lists, one per partition"""
+        self._spill()
+        for fh in self._spills:
+            fh.close()
+        for n in range(self.partitions):
+            groups = {}
+            with (self._spill_dir / f'{n}.part').open('rb') as fh:
+                while True:
+                    try:
+                        digest, state = pickle.load(fh)
+                    except EOFError:
+                        break
+                    part = _Group.from_state(state)
+                    if digest in groups:
+                        groups[digest].merge(part)
+                    else:
+                        groups[digest] = part
+            yield sorted((group.seq, group.row(digest)) for digest, group in groups.items())
+
+    def rows(self):
+        """:return: generator of summary rows, in first found order"""
+        if self._spill_dir is None:
+            for digest, group in self.groups.items():
+                yield group.row(digest)
+            return
+
+        try:
+            # each partition is sorted to its own file so only one is in memory at a time, then merged
+            sorted_files = []
+            for n, rows in enumerate(self._partitions()):
+                path = self._spill_dir / f'{n}.sorted'
+                with path.open('wb') as fh:
+                    for item in rows:
+                        pickle.dump(item, fh, pickle.HIGHEST_PROTOCOL)
+                sorted_files.append(path)
+            for _, row in heapq.merge(*map(_load, sorted_files)):
+                yield row
+        finally:
+            self.close()
+
+    def close(self):
+        """remove the spill files"""
+        if self._spill_dir is not None:
+            for fh in self._spills:
+                fh.close()
+            shutil.rmtree(self._spill_dir, ignore_errors=True)
+            self._spill_dir = self._spills = None
+
+    def write(self, out_file):
+        """
+        write the summary CSV
+        :return: number of rows (distinct lines)
+        """
+        out_file = Path(out_file)
+        out_file.parent.mkdir(parents=True, exist_ok=True)
+        written = 0
+        with out_file.open('w', newline='', errors='replace') as fh:
+            writer = csv.writer(fh)
+            writer.writerow(SUMMARY_HEADER)
+            for row in self.rows():
+                writer.writerow(row)
+                written += 1
+        return written
+
+
+def _load(path):
+    with path.open('rb') as fh:
+        while True:
+            try:
+                yield pickle.load(fh)
+            except EOFError:
+                return
@@ -0,0 +1,210 @@
+"""
+Search the text members of a package archive in place, without extracting it.
+
+Zip members are read one after another, tar and tar.gz files as one stream, and 7z
+through a pipe from 7-Zip (7za x -so). Every member with a text file extension
+(QueryResults JSON, CSV, logs...) is cut into blocks of whole lines as it is read,
+and the blocks are tested against the rule set in worker processes while the
+archive is still being read. Hits come out in archive order.
+"""
+import codecs
+import subprocess
+import tarfile
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path, PurePosixPath
+from zipfile import ZipFile
+
+if __package__:
+    from .engine import _init_worker, _scan_block, scan_bytes
+else:  # run as a script from the search folder
+    from engine import _init_worker, _scan_block, scan_bytes
+
+# members searched. anything else is skipped without being decompressed (zip, 7z) or read past (tar)
+TEXT_SUFFIXES = ('.csv', '.json', '.txt', '.log', '.xml', '.tsv', '.ini', '.cfg', '.conf', '.ps1', '.bat', '.cmd',
+                 '.vbs', '.js', '.htm', '.html', '.reg')
+# archives searched when a folder is given
+ARCHIVE_PATTERNS = ['*.zip', '*.7z', '*.tar', '*.tar.gz', '*.tgz']
+# bytes of a member tested at a time
+BLOCK_SIZE = 4 * 2 ** 20
+# 7-Zip in the tools folder next to the search folder, as PackageParser uses it. 7za on the PATH otherwise
+SEVENZIP = Path(__file__).resolve().parent.parent / 'tools' / 'sevenZip' / '7za.exe'
+
+
+class ArchiveError(Exception):
+    """the archive can't be read, e.g. a wrong 7z password"""
+
+
+def is_text(name):
+    return PurePosixPath(name.replace('\\', '/')).suffix.lower() in TEXT_SUFFIXES
+
+
+def archive_files(source):
+    """:return: the archive source, or the archives in the folder source, sorted on name"""
+    source = Path(source)
+    if source.is_file():
+        return [source]
+    return sorted({file for pattern in ARCHIVE_PATTERNS for file in source.glob(pattern)}, key=lambda i: i.name)
+
+
+def find_sevenzip():
+    return str(SEVENZIP) if SEVENZIP.is_file() else '7za'
+
+
+class _Member:
+    """the next size bytes of the 7-Zip output pipe"""
+
+    def __init__(self, stream, size):
+        self.stream = stream
+        self.left = size
+
+    def read(self, size=-1):
+        size = self.left if size < 0 else min(size, self.left)
+        data = self.stream.read(size) if size else b''
+        if len(data) < size:
+            raise ArchiveError('7-Zip output ended early')
+        self.left -= len(data)
+        return data
+
+    def skip(self):
+        while self.left:
+            self.read(BLOCK_SIZE)
+
+
+def _sevenzip_list(archive, password, sevenzip):
+    """:return: list of (member path, size) of the files in a 7z, in archive order"""
+    command = [sevenzip, 'l', '-slt', '-ba', '-p' + (password or ''), str(archive)]
+    spr = subprocess.run(command, capture_output=True, stdin=subprocess.DEVNULL, timeout=300, encoding='utf-8',
+                         errors='replace')
+    if spr.returncode != 0:
+        raise ArchiveError(f'7-Zip can\'t list {archive.name} (exit code {spr.returncode}). Wrong password?')
+
+    members = []
+    entry = {}
+    for line in spr.stdout.splitlines() + ['']:
+        if line.strip():
+            key, _, value = line.partition(' = ')
+            entry[key] = value
+            continue
+        if entry.get('Path') and entry.get('Folder') != '+' and 'D' not in entry.get('Attributes', '')[:1]:
+            members.append((entry['Path'], int(entry.get('Size') or 0)))
+        entry = {}
+    return members
+
+
+def _sevenzip_members(archive, password, sevenzip, select):
+    wanted = [(name, size) for name, size in _sevenzip_list(archive, password, sevenzip) if select(name)]
+    if not wanted:
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        list_file = Path(tmp) / 'members.txt'
+        list_file.write_text('\n'.join(name for name, _ in wanted) + '\n', encoding='utf-8')
+        # -so writes the selected files one after another in archive order. the listed sizes split them up
+        command = [sevenzip, 'x', '-so', '-p' + (password or ''), str(archive), '-scsUTF-8', '@' + str(list_file)]
+        proc = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL)
+        try:
+            for name, size in wanted:
+                member = _Member(proc.stdout, size)
+                yield name, member
+                member.skip()
+            if proc.stdout.read(1) or proc.wait() != 0:
+                raise ArchiveError(f'7-Zip failed reading {archive.name} (exit code {proc.wait()}). Wrong password?')
+        finally:
+            proc.stdout.close()
+            if proc.poll() is None:
+                proc.kill()
+            proc.wait()
+
+
+def iter_members(archive, password=None, sevenzip=None, select=is_text):
+    """
+    :param archive: .zip, .7z, or tar file (.tar, .tar.gz, .gz)
+    :param password: zip or 7z password
+    :param sevenzip: 7-Zip executable for .7z. defaults to find_sevenzip()
+    :param select: callable(member path), True for members to read
+    :return: generator of (member path, binary file object). read each before taking the next
+    """
+    archive = Path(archive)
+    suffix = archive.suffix.lower()
+    if suffix == '.zip':
+        with ZipFile(archive) as zf:
+            for info in zf.infolist():
+                if not info.is_dir() and select(info.filename):
+                    with zf.open(info, pwd=password.encode() if password else None) as fh:
+                        yield info.filename, fh
+    elif suffix == '.7z':
+        yield from _sevenzip_members(archive, password, sevenzip or find_sevenzip(), select)
+    else:
+        with tarfile.open(archive, 'r|*') as tf:  # one pass, no seeking back
+            for member in tf:
+                if member.isfile() and select(member.name):
+                    yield member.name, tf.extractfile(member)
+
+
+def _utf8_blocks(fh, block_size):
+    """:return: generator of utf-8 blocks of a member. UTF-16 text (with a BOM) is converted, binary is skipped"""
+    first = fh.read(block_size)
+    if first.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        decoder = codecs.getincrementaldecoder('utf-16')('replace')
+        data = first
+        while data:
+            yield decoder.decode(data).encode('utf-8')
+            data = fh.read(block_size)
+        yield decoder.decode(b'', final=True).encode('utf-8')
+    elif b'\0' not in first[:8192]:
+        data = first
+        while data:
+            yield data
+            data = fh.read(block_size)
+
+
+def line_blocks(fh, block_size=BLOCK_SIZE):
+    """:return: generator of blocks of whole lines of a member, as utf-8"""
+    rest = b''
+    for data in _utf8_blocks(fh, block_size):
+        data = rest + data
+        cut = data.rfind(b'\n') + 1
+        rest = data[cut:]
+        if cut:
+            yield data[:cut]
+    if rest:
+        yield rest
+
+
+def search_archive(archive, ruleset, workers=1, password=None, sevenzip=None, progress=None):
+    """
+    Test every line of the text members of an archive against the whole rule set
+    :param workers: number of worker processes testing blocks while the archive is read
+    :param progress: optional callable, called with each member path as it is reached
+    :return: generator of (member path, rule index, (line,)) in archive order, then line and rule order
+    raises ArchiveError, or zipfile/tarfile errors for a damaged archive
+    """
+    def blocks():
+        for member, fh in iter_members(archive, password, sevenzip):
+            if progress:
+                progress(member)
+            history = 'history' in PurePosixPath(member.replace('\\', '/')).name.lower()
+            for data in line_blocks(fh):
+                yield member, history, data
+
+    if workers <= 1:
+        for member, history, data in blocks():
+            for idx, detail in scan_bytes(data, ruleset, history):
+                yield member, idx, detail
+        return
+
+    with ProcessPoolExecutor(workers, initializer=_init_worker,
+                             initargs=(ruleset.rgx_dict, ruleset.str_dict, ruleset.col_dict)) as pool:
+        pending = deque()  # (member, future) in archive order. bounds the blocks held in memory
+        for member, history, data in blocks():
+            pending.append((member, pool.submit(_scan_block, data, history)))
+            while len(pending) >= workers * 2:
+                done, future = pending.popleft()
+                for idx, detail in future.result():
+                    yield done, idx, detail
+        while pending:
+            done, future = pending.popleft()
+            for idx, detail in future.result():
+                yield done, idx, detail
@@ -0,0 +1,149 @@
+"""
+Work out which literal substrings a regex needs in order to match, so that lines
+without any of them can be skipped before the regex runs.
+
+python -m search.compiler search/regex.txt
+"""
+import csv
+import sys
+from pathlib import Path
+
+try:
+    from re import _parser as sre_parse  # python 3.11+
+except ImportError:
+    import sre_parse
+
+# largest set of alternative literals kept for one rule, e.g. {.exe, .ps1, .bat, ...}
+MAX_SET = 32
+# literals shorter than this pass too many lines to be worth checking first
+MIN_LITERAL = 3
+
+_ZERO_WIDTH = (sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT)
+_REPEATS = tuple(getattr(sre_parse, op) for op in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT')
+                 if hasattr(sre_parse, op))
+
+
+def _best(candidates):
+    """pick the literal set that filters best: longest shortest-literal, then fewest literals"""
+    usable = [c for c in candidates if c and all(c) and all(s.isascii() for s in c)]
+    if not usable:
+        return None
+    return max(usable, key=lambda c: (min(map(len, c)), -len(c)))
+
+
+def _requirement(exact, candidates):
+    """a set of literals one of which every match contains, or None"""
+    if exact is not None and '' not in exact:
+        candidates = candidates + [exact]
+    return _best(candidates)
+
+
+def _sequence(items):
+    """
+    :param items: parsed (opcode, argument) pairs matched one after another
+    :return: (set of every string the sequence can match or None, list of required literal sets)
+    """
+    exact = {''}
+    complete = True
+    candidates = []
+
+    for op, av in items:
+        node_exact, node_candidates = _node(op, av)
+        candidates.extend(node_candidates)
+        if node_exact is not None and len(exact) * len(node_exact) <= MAX_SET:
+            exact = {a + b for a in exact for b in node_exact}
+        else:
+            # the literal run ends here. what was collected so far is still required
+            candidates.append(exact)
+            exact = node_exact if node_exact is not None else {''}
+            complete = False
+
+    candidates.append(exact)
+    return (exact if complete else None), candidates
+
+
+def _node(op, av):
+    if op == sre_parse.LITERAL:
+        return {chr(av).lower()}, []
+
+    if op == sre_parse.SUBPATTERN:
+        return _sequence(av[-1])
+
+    if op == getattr(sre_parse, 'ATOMIC_GROUP', None):
+        return _sequence(av)
+
+    if op in _ZERO_WIDTH:
+        return {''}, []
+
+    if op == sre_parse.IN:
+        if all(item_op == sre_parse.LITERAL for item_op, _ in av) and len(av) <= MAX_SET:
+            return {chr(v).lower() for _, v in av}, []
+        return None, []
+
+    if op == sre_parse.BRANCH:
+        alternatives = [_sequence(alt) for alt in av[1]]
+        exact = None
+        if all(e is not None for e, _ in alternatives):
+            exact = set().union(*(e for e, _ in alternatives))
+            if len(exact) > MAX_SET:
+                exact = None
+
+        required = [_requirement(e, c) for e, c in alternatives]
+        if all(required) and sum(map(len, required)) <= MAX_SET:
+            return exact, [set().union(*required)]
+        return exact, []
+
+    if op in _REPEATS:
+        low, high, item = av
+        if low == 0:
+            return None, []
+        exact, candidates = _sequence(item)
+        if low == high and exact is not None and len(exact) ** low <= MAX_SET:
+            repeated = {''}
+            for _ in range(low):
+                repeated = {a + b for a in repeated for b in exact}
+            return repeated, []
+        required = _requirement(exact, candidates)
+        return None, [required] if required else []
+
+    return None, []
+
+
+def required_literals(pattern):
+    """
+    :param pattern: regex string
+    :return: set of lowercase ascii literals, at least one of which is in every line the
+             regex matches (ignoring case), or None if the regex has no useful literal
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except Exception:
+        return None
+
+    literals = _requirement(*_sequence(parsed))
+    if literals is None or min(map(len, literals)) < MIN_LITERAL:
+        return None
+    return literals
+
+
+def main():
+    rgx_file = Path(sys.argv[1]) if len(sys.argv) > 1 else Path(__file__).parent / 'regex.txt'
+    unfiltered = []
+
+    with rgx_file.open() as csvfile:
+        for row in csv.reader(csvfile, delimiter=';'):
+            if any(row) and row[0] == '1':
+                literals = required_literals(row[1])
+                if literals:
+                    print(f'{row[1]}\n    {", ".join(sorted(literals))}')
+                else:
+                    unfiltered.append(row[1])
+
+    if unfiltered:
+        print(f'\n{len(unfiltered)} rule(s) without a required literal. These run on every line:')
+        for pattern in unfiltered:
+            print(f'    {pattern}')
+
+
+if __name__ == '__main__':
+    main()
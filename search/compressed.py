@@ -0,0 +1,47 @@
+"""
+Read output CSVs compressed by PackageParser --compress (see convert.compress) as if
+they weren't. x.csv.gz and x.csv.zst are decompressed as they are read, a block at a
+time, so nothing is unpacked to disk.
+"""
+import gzip
+import io
+from pathlib import Path
+
+# compressed CSV suffix: PackageParser --compress method
+SUFFIXES = {'.gz': 'gzip', '.zst': 'zstd'}
+PATTERNS = ['*.csv'] + [f'*.csv{suffix}' for suffix in SUFFIXES]
+
+
+def is_compressed(file):
+    return Path(file).suffix.lower() in SUFFIXES
+
+
+def csv_name(file):
+    """:return: file name without the compression suffix, e.g. x.csv for x.csv.gz"""
+    file = Path(file)
+    return file.stem if is_compressed(file) else file.name
+
+
+def csv_files(root):
+    """:return: CSV files under root, compressed or not"""
+    return [file for pattern in PATTERNS for file in Path(root).rglob(pattern)]
+
+
+def open_binary(file):
+    """:return: binary file object with the decompressed content of file"""
+    file = Path(file)
+    suffix = file.suffix.lower()
+    if suffix == '.gz':
+        return gzip.open(file, 'rb')
+    if suffix == '.zst':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError(f'reading {file.name} needs zstandard. pip install zstandard')
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(file.open('rb'), closefd=True))
+    return file.open('rb')
+
+
+def open_text(file, newline=None):
+    """:return: text file object for file, decoded as utf-8 the way the search opens plain CSVs"""
+    return io.TextIOWrapper(open_binary(file), encoding='utf-8', errors='replace', newline=newline)
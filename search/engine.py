@@ -0,0 +1,327 @@
+import io
+import re
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+if __package__:
+    from .compiler import required_literals
+    from .structured import scan_columns
+    from .compressed import is_compressed, open_text
+else:  # run as a script from the search folder
+    from compiler import required_literals
+    from structured import scan_columns
+    from compressed import is_compressed, open_text
+
+try:
+    import ahocorasick
+except ImportError:  # optional. falls back to one substring test per literal
+    ahocorasick = None
+
+# skipped for shell/browser history output, which is full of long base64 blobs
+B64_RULE = '[a-zA-Z0-9/+=]{500}'
+
+# files bigger than this are split into line aligned byte ranges when searching with workers
+CHUNK_SIZE = 32 * 2 ** 20
+
+
+class LiteralMatcher:
+    """
+    Find which of a set of lowercase literals occur in a line. Uses an Aho-Corasick
+    automaton when pyahocorasick is installed, otherwise a substring test per literal.
+    """
+
+    def __init__(self, literals):
+        """:param literals: list of (rule index, lowercase literal). a rule may have several"""
+        self.literals = literals
+        self.empty = {idx for idx, lit in literals if not lit}  # an empty string is in every line
+        self.automaton = None
+
+        if ahocorasick is not None and len(self.empty) < len(literals):
+            self.automaton = ahocorasick.Automaton()
+            by_literal = {}
+            for idx, lit in literals:
+                if not lit:
+                    continue
+                by_literal.setdefault(lit, []).append(idx)
+            for lit, idxs in by_literal.items():
+                self.automaton.add_word(lit, idxs)
+            self.automaton.make_automaton()
+
+    def __bool__(self):
+        return bool(self.literals)
+
+    def find(self, text):
+        """:return: set of rule indexes with a literal that occurs in text"""
+        if self.automaton is not None:
+            return self.empty.union(idx for _, idxs in self.automaton.iter(text) for idx in idxs)
+        return {idx for idx, lit in self.literals if lit in text}
+
+
+class RuleSet:
+    """
+    Compiled regex.txt rules, matched against a line in a single pass.
+
+    Regex rules come first and string rules second, each in rule file order, and hits
+    on a line are reported in that order. String rules and the required literals of
+    each regex (see compiler.required_literals) go through one LiteralMatcher, and a
+    regex only runs on lines containing one of its literals.
+    """
+
+    def __init__(self, rgx_dict, str_dict, col_dict=None):
+        self.rgx_dict = rgx_dict
+        self.str_dict = str_dict
+        self.col_dict = col_dict or {}
+        self.errors = []
+        self.rules = []  # [(key, description)]
+        self.kinds = []  # 'regex' or 'string' per rule
+        self.columns = {}  # {rule index: [(artifact or None, column)]} for rules limited to named columns
+        self.regexes = []  # [(rule index, compiled regex)] run on every line
+        self.gated = {}  # {rule index: compiled regex} run only when one of its literals is found
+        self.strings = []  # [(rule index, lowercase string)]
+        self.unfiltered = []  # regexes without a required literal
+        self.b64_index = None
+        literals = []
+
+        for key, val in rgx_dict.items():
+            try:
+                rgx = re.compile(key)
+            except Exception as e:
+                self.errors.append(f'{key}: {e}')
+                continue
+
+            idx = len(self.rules)
+            self.rules.append((key, val))
+            self.kinds.append('regex')
+            if key == B64_RULE:
+                self.b64_index = idx
+
+            required = required_literals(key)
+            if required:
+                self.gated[idx] = rgx
+                literals.extend((idx, lit) for lit in required)
+            else:
+                self.regexes.append((idx, rgx))
+                self.unfiltered.append(key)
+
+        for key, val in str_dict.items():
+            idx = len(self.rules)
+            self.rules.append((key, val))
+            self.kinds.append('string')
+            self.strings.append((idx, key.lower()))
+            literals.append((idx, key.lower()))
+
+        self.literals = LiteralMatcher(literals)
+        self.history_regexes = [(idx, rgx) for idx, rgx in self.regexes if idx != self.b64_index]
+
+        for idx, (key, _) in enumerate(self.rules):
+            spec = self.col_dict.get((self.kinds[idx], key))  # a regex and a string can share their text
+            if spec:
+                self.columns[idx] = parse_columns(spec)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def subset(self, indexes):
+        """
+        :param indexes: sorted rule indexes to keep
+        :return: RuleSet with only those rules. its rule n is rule indexes[n] of this set
+        """
+        keep = set(indexes)
+        rgx_dict = {}
+        str_dict = {}
+        for idx, (key, val) in enumerate(self.rules):
+            if idx in keep:
+                if self.kinds[idx] == 'regex':
+                    rgx_dict[key] = val
+                else:
+                    str_dict[key] = val
+        return RuleSet(rgx_dict, str_dict)
+
+    def match(self, line, history=False):
+        """
+        Test one line against every rule
+        :param line: line of text
+        :param history: True if the source is a history file (skips the base64 rule)
+        :return: sorted list of matching rule indexes
+        """
+        regexes = self.history_regexes if history else self.regexes
+        hits = [idx for idx, rgx in regexes if rgx.search(line)]
+
+        if self.literals:
+            lower = line.lower()
+            if line.isascii():
+                for idx in self.literals.find(lower):
+                    rgx = self.gated.get(idx)
+                    if rgx is None or rgx.search(line):
+                        hits.append(idx)
+            else:
+                # (?i) folds a few non-ascii characters (e.g. dotless i) that lower() doesn't
+                hits.extend(idx for idx, rgx in self.gated.items() if rgx.search(line))
+                hits.extend(idx for idx, s in self.strings if s in lower)
+
+        hits.sort()
+        return hits
+
+
+def parse_columns(spec):
+    """
+    :param spec: column field of a rule, e.g. 'Prefetch:ExecutableName,Amcache:Path,CommandLine'
+    :return: list of (lowercase artifact or None, lowercase column)
+    """
+    targets = []
+    for item in spec.split(','):
+        artifact, _, column = item.strip().rpartition(':')
+        if column:
+            targets.append((artifact.lower() or None, column.lower()))
+    return targets
+
+
+def is_history(file):
+    return 'history' in file.name.lower()
+
+
+def plan_chunks(file, chunk_size=CHUNK_SIZE):
+    """
+    Split a file into byte ranges that start and end on line boundaries
+    :param file: path of CSV/text file
+    :param chunk_size: approximate size of each range. None keeps the file whole
+    :return: list of (start, end) offsets. end is None for "to the end of the file"
+    """
+    size = file.stat().st_size
+    if chunk_size is None or size <= chunk_size or is_compressed(file):  # can't seek into a compressed stream
+        return [(0, None)]
+
+    ranges = []
+    start = 0
+    with file.open('rb') as fh:
+        while start < size:
+            fh.seek(start + chunk_size)
+            fh.readline()  # finish the line the nominal boundary falls in
+            end = min(fh.tell(), size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def scan_range(file, ruleset, start=0, end=None):
+    """
+    Test every line in a byte range of a file against the whole rule set
+    :param file: path of CSV/text file
+    :param ruleset: RuleSet
+    :param start: offset of the first line
+    :param end: offset after the last line, or None to read to the end of the file
+    :return: generator of (rule index, (line,)) in line order
+    """
+    history = is_history(file)
+
+    if is_compressed(file):
+        fh = open_text(file)  # always whole, see plan_chunks
+    elif end is None:
+        fh = file.open('r', encoding='utf-8', errors='replace')
+        fh.seek(start)
+    else:
+        with file.open('rb') as raw:
+            raw.seek(start)
+            data = raw.read(end - start)
+        # decode the same way as opening the file in text mode would (universal newlines)
+        fh = io.TextIOWrapper(io.BytesIO(data), encoding='utf-8', errors='replace')
+
+    with fh:
+        for line in fh:
+            for idx in ruleset.match(line, history):
+                yield idx, (line,)
+
+
+def scan_bytes(data, ruleset, history=False):
+    """
+    Test every line of a block of utf-8 text against the whole rule set (archive members, see archive.py)
+    :return: generator of (rule index, (line,)) in line order
+    """
+    with io.TextIOWrapper(io.BytesIO(data), encoding='utf-8', errors='replace') as fh:
+        for line in fh:
+            for idx in ruleset.match(line, history):
+                yield idx, (line,)
+
+
+def to_row(file, ruleset, idx, detail):
+    """:return: [file name, key, description, *detail] row for a hit"""
+    key, val = ruleset.rules[idx]
+    return [file.name, key, val, *detail]
+
+
+def plan_search(file_list, workers=1, chunk_size=CHUNK_SIZE, structured=False):
+    """
+    :return: list of (file, byte ranges). Files are only split when searching lines with workers
+    """
+    if workers <= 1 or structured:  # quoted CSV fields can span lines, so parse whole files
+        chunk_size = None
+    return [(file, plan_chunks(file, chunk_size)) for file in file_list]
+
+
+_worker_rules = None
+
+
+def _init_worker(rgx_dict, str_dict, col_dict):
+    global _worker_rules
+    _worker_rules = RuleSet(rgx_dict, str_dict, col_dict)
+
+
+def _scan(file, ruleset, start, end, structured):
+    if structured:
+        return scan_columns(file, ruleset, is_history(file))
+    return scan_range(file, ruleset, start, end)
+
+
+def _scan_chunk(file, start, end, structured):
+    return list(_scan(file, _worker_rules, start, end, structured))
+
+
+def _scan_block(data, history):
+    return list(scan_bytes(data, _worker_rules, history))
+
+
+def search_files(plan, ruleset, workers=1, progress=None, structured=False):
+    """
+    Search planned files and yield hits as they are found. Hits come out in plan order,
+    then line order, then rule order, whatever the number of workers.
+    :param plan: output of plan_search
+    :param ruleset: RuleSet
+    :param workers: number of worker processes. 1 searches in this process
+    :param progress: optional callable, called with the file once per finished byte range
+    :param structured: parse files as CSV and test column values (see structured.scan_columns)
+    :return: generator of (file, rule index, detail). detail is (line,) or (column, row, value)
+    """
+    if workers <= 1:
+        for file, ranges in plan:
+            for start, end in ranges:
+                for idx, detail in _scan(file, ruleset, start, end, structured):
+                    yield file, idx, detail
+                if progress:
+                    progress(file)
+        return
+
+    tasks = [(file, start, end, structured) for file, ranges in plan for start, end in ranges]
+    results = {}  # {task number: hits} finished but not yet yielded
+    pending = {}
+    next_task = 0
+    next_yield = 0
+    window = workers * 4  # bounds the finished ranges held while an earlier range finishes
+
+    with ProcessPoolExecutor(workers, initializer=_init_worker,
+                             initargs=(ruleset.rgx_dict, ruleset.str_dict, ruleset.col_dict)) as pool:
+        while next_yield < len(tasks):
+            while next_task < len(tasks) and len(pending) < workers * 2 and next_task - next_yield < window:
+                pending[pool.submit(_scan_chunk, *tasks[next_task])] = next_task
+                next_task += 1
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                task = pending.pop(future)
+                results[task] = future.result()
+                if progress:
+                    progress(tasks[task][0])
+
+            while next_yield in results:
+                file = tasks[next_yield][0]
+                for idx, detail in results.pop(next_yield):
+                    yield file, idx, detail
+                next_yield += 1
@@ -0,0 +1,239 @@
+"""
+Persistent trigram index over parsed output, for hunting through the same output
+folder again with new or changed rules.
+
+Every line of every indexed CSV goes into an SQLite FTS5 table with the trigram
+tokenizer, so the lines containing a literal can be looked up instead of read. A
+search asks the index for the lines that contain a literal of some rule, reads just
+those lines and tests them with RuleSet.match, so the hits are the same as a full
+scan. Files are reindexed when their size or modification time changes.
+"""
+import sqlite3
+import zlib
+from array import array
+from itertools import islice
+from pathlib import Path
+
+if __package__:
+    from .engine import is_history
+    from .compressed import open_text
+    from .compiler import MIN_LITERAL, sre_parse
+else:  # run as a script from the search folder
+    from engine import is_history
+    from compressed import open_text
+    from compiler import MIN_LITERAL, sre_parse
+
+INDEX = 'SearchIndex.db'
+# line lengths are stored as unsigned shorts. longer lines are stored as this
+MAX_WIDTH = 0xFFFF
+# phrases per MATCH query. long OR chains are split to keep the FTS5 parser happy
+MAX_TERMS = 100
+BATCH = 5000
+
+
+def trigram_support():
+    """:return: True if this SQLite has FTS5 with the trigram tokenizer (SQLite 3.34 or later)"""
+    if sqlite3.sqlite_version_info < (3, 34, 0):
+        return False
+    db = sqlite3.connect(':memory:')
+    try:
+        db.execute("CREATE VIRTUAL TABLE t USING fts5(line, tokenize='trigram')")
+        return True
+    except sqlite3.OperationalError:  # built without FTS5
+        return False
+    finally:
+        db.close()
+
+
+def min_width(pattern):
+    """:return: shortest text a regex can match, 0 if unknown"""
+    try:
+        return sre_parse.parse(pattern).getwidth()[0]
+    except Exception:
+        return 0
+
+
+def _phrase(literal):
+    return '"' + literal.replace('"', '""') + '"'
+
+
+class IndexPlan:
+    """
+    What a RuleSet needs from the index: the literals to look up, and the shortest
+    line that rules without a usable literal could match.
+    """
+
+    def __init__(self, ruleset):
+        literals = {}  # {rule index: [lowercase literal]}
+        for idx, lit in ruleset.literals.literals:
+            literals.setdefault(idx, []).append(lit)
+
+        self.terms = set()
+        self.widths = {}  # {rule index: min width} for rules that need a look at every long enough line
+        for idx, lits in literals.items():
+            if min(map(len, lits)) >= MIN_LITERAL:
+                self.terms.update(lits)
+            elif ruleset.kinds[idx] == 'regex':
+                self.widths[idx] = min_width(ruleset.rules[idx][0])
+            else:
+                self.widths[idx] = min(map(len, lits))
+        for idx, rgx in ruleset.regexes:
+            self.widths[idx] = min_width(rgx.pattern)
+
+        self.queries = [' OR '.join(map(_phrase, chunk))
+                        for chunk in (sorted(self.terms)[i:i + MAX_TERMS] for i in range(0, len(self.terms), MAX_TERMS))]
+        self.b64_index = ruleset.b64_index
+
+    def width(self, history):
+        """:return: lines at least this long are candidates. None if no rule needs it"""
+        widths = [w for idx, w in self.widths.items() if not (history and idx == self.b64_index)]
+        return min(widths) if widths else None
+
+
+class SearchIndex:
+    """
+    SearchIndex.db in an output folder. Each file gets its own contentless FTS5
+    table of its lines (rowid is the line number), plus the length of every line and
+    the numbers of the lines that aren't ASCII.
+    """
+
+    def __init__(self, root):
+        """:param root: folder the index is kept in. Paths under it are stored relative to it"""
+        self.root = Path(root)
+        self.path = self.root / INDEX
+        self.db = sqlite3.connect(str(self.path))
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, path TEXT UNIQUE, size INTEGER, '
+                        'mtime_ns INTEGER, lines INTEGER, widths BLOB, non_ascii BLOB)')
+        self.db.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def _key(self, file):
+        file = Path(file).resolve()
+        try:
+            return file.relative_to(self.root.resolve()).as_posix()
+        except ValueError:
+            return str(file)
+
+    def _entry(self, file):
+        return self.db.execute('SELECT id, size, mtime_ns, lines, widths, non_ascii FROM files WHERE path = ?',
+                               (self._key(file),)).fetchone()
+
+    def is_current(self, file):
+        """:return: True if file is indexed and hasn't changed since"""
+        entry = self._entry(file)
+        if entry is None:
+            return False
+        stat = Path(file).stat()
+        return (entry[1], entry[2]) == (stat.st_size, stat.st_mtime_ns)
+
+    def add(self, file):
+        """(re)index a file. lines are read the same way as engine.scan_range reads them"""
+        file = Path(file)
+        stat = file.stat()
+        self.remove(file)
+        cur = self.db.execute('INSERT INTO files (path, size, mtime_ns) VALUES (?, ?, ?)',
+                              (self._key(file), stat.st_size, stat.st_mtime_ns))
+        file_id = cur.lastrowid
+        table = f'f{file_id}'
+        self.db.execute(f"CREATE VIRTUAL TABLE {table} USING fts5(line, tokenize='trigram', content='', "
+                        f"columnsize=0, detail=full)")
+
+        widths = array('H')
+        non_ascii = array('I')
+        insert = f'INSERT INTO {table} (rowid, line) VALUES (?, ?)'
+        with open_text(file) as fh:
+            batch = []
+            for n, line in enumerate(fh):
+                widths.append(min(len(line), MAX_WIDTH))
+                if line.isascii():
+                    batch.append((n, line))
+                    if len(batch) >= BATCH:
+                        self.db.executemany(insert, batch)
+                        batch = []
+                else:  # always read, see candidates
+                    non_ascii.append(n)
+            self.db.executemany(insert, batch)
+
+        self.db.execute('UPDATE files SET lines = ?, widths = ?, non_ascii = ? WHERE id = ?',
+                        (len(widths), zlib.compress(widths.tobytes()), zlib.compress(non_ascii.tobytes()), file_id))
+        self.db.commit()
+
+    def remove(self, file):
+        entry = self._entry(file)
+        if entry is not None:
+            self.db.execute(f'DROP TABLE IF EXISTS f{entry[0]}')
+            self.db.execute('DELETE FROM files WHERE id = ?', (entry[0],))
+            self.db.commit()
+
+    def update(self, file_list, progress=None):
+        """
+        Index new and changed files, and forget indexed files that no longer exist
+        :param progress: optional callable, called with each file after it is checked
+        :return: number of files (re)indexed
+        """
+        gone = [path for path, in self.db.execute('SELECT path FROM files')
+                if not (self.root / path).is_file()]
+        for path in gone:
+            self.remove(self.root / path)
+
+        count = 0
+        for file in file_list:
+            if not self.is_current(file):
+                self.add(file)
+                count += 1
+            if progress:
+                progress(file)
+        return count
+
+    def candidates(self, file, plan):
+        """
+        :param plan: IndexPlan of the rules
+        :return: sorted line numbers any rule could match on, or None if every line has to be read
+        """
+        file_id, _, _, lines, widths, non_ascii = self._entry(file)
+        width = plan.width(is_history(file))
+        if width is not None and width <= 1:
+            return None
+
+        found = set(array('I', zlib.decompress(non_ascii)))
+        for query in plan.queries:
+            found.update(n for n, in self.db.execute(f'SELECT rowid FROM f{file_id} WHERE f{file_id} MATCH ?',
+                                                     (query,)))
+        if width is not None:
+            found.update(n for n, w in enumerate(array('H', zlib.decompress(widths)))
+                         if w >= width or w == MAX_WIDTH)
+        return sorted(found)
+
+    def scan(self, file, ruleset, plan):
+        """
+        Test the candidate lines of an indexed file against the whole rule set
+        :return: generator of (rule index, (line,)) in line order, the same hits as engine.scan_range
+        """
+        file = Path(file)
+        lines = self.candidates(file, plan)
+        history = is_history(file)
+
+        with open_text(file) as fh:
+            if lines is None:
+                for line in fh:
+                    for idx in ruleset.match(line, history):
+                        yield idx, (line,)
+                return
+            pos = 0
+            for n in lines:
+                line = next(islice(fh, n - pos, None), None)
+                if line is None:
+                    break
+                pos = n + 1
+                for idx in ruleset.match(line, history):
+                    yield idx, (line,)
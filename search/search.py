@@ -1,63 +1,225 @@
-import re
 from pathlib import Path
 import argparse
 import csv
+import os
+import sqlite3
 import sys
 from datetime import datetime
 from colorama import init, Fore
-from alive_progress import alive_bar
 
-init(autoreset=True)
+if __package__:
+    from .engine import RuleSet, plan_search, search_files, to_row
+    from .writer import HitWriter, HEADER, is_report
+    from .structured import HEADER as STRUCTURED_HEADER, prefer_parquet
+    from .compressed import csv_files
+    from .index import INDEX, IndexPlan, SearchIndex, trigram_support
+    from .aggregate import HitAggregator
+    from .archive import archive_files, search_archive
+else:  # run as a script from the search folder
+    from engine import RuleSet, plan_search, search_files, to_row
+    from writer import HitWriter, HEADER, is_report
+    from structured import HEADER as STRUCTURED_HEADER, prefer_parquet
+    from compressed import csv_files
+    from index import INDEX, IndexPlan, SearchIndex, trigram_support
+    from aggregate import HitAggregator
+    from archive import archive_files, search_archive
 
 examples = '''
 python search.py -s \\path\\to\\directory\\withCSVs -o \\path\\to\\out --search (uses default)
 python search.py -s \\path\\to\\directory\\withCSVs -o \\path\\to\\out --search yourfile.txt
+python search.py -s \\path\\to\\archive.7z -o \\path\\to\\out --search --archives -p <password>
 
 '''
 rgx_dict = {}
 str_dict = {}
+col_dict = {}
 
 
-def find_hits(file_list, dict1, dict2):
+def _search(file_list, ruleset, workers, emit, structured=False, index=None):
+    """run the search with the usual progress output, passing each hit row and the file it is from to emit"""
+    if index is not None and not structured:
+        if trigram_support():
+            return _search_indexed(file_list, ruleset, emit, index)
+        print(Fore.YELLOW + f'SQLite {sqlite3.sqlite_version} has no trigram full text search (needs 3.34 or later '
+                            f'with FTS5). Searching without {INDEX}\n')
+    from alive_progress import alive_bar
+
+    plan = plan_search(file_list, workers, structured=structured)
+    total_patterns = len(ruleset.rgx_dict) + len(ruleset.str_dict)
+
+    print(Fore.LIGHTWHITE_EX + f'Found {len(file_list)} CSV files. Searching using {total_patterns} patterns...\n')
+    if ruleset.unfiltered:
+        print(Fore.YELLOW + f'{len(ruleset.unfiltered)} regex(es) have no required literal and run on every line:')
+        for pattern in ruleset.unfiltered:
+            print(Fore.LIGHTWHITE_EX + f'    {pattern}')
+        print()
+    if workers > 1:
+        print(Fore.LIGHTWHITE_EX + f'Using {workers} workers for {sum(len(r) for _, r in plan)} chunks\n')
+    with alive_bar(sum(len(r) for _, r in plan), bar='smooth') as bar:
+        seen = set()
+
+        def progress(file):
+            if file not in seen:
+                print(Fore.LIGHTWHITE_EX + f'{file.name}' + Fore.LIGHTGREEN_EX)
+                seen.add(file)
+            bar()
+
+        for file, idx, detail in search_files(plan, ruleset, workers, progress, structured):
+            emit(to_row(file, ruleset, idx, detail), file)
+
+
+def _search_indexed(file_list, ruleset, emit, root):
+    """bring the SearchIndex in root up to date, then search only the lines it points to"""
+    from alive_progress import alive_bar
+
+    plan = IndexPlan(ruleset)
+    with SearchIndex(root) as index:
+        stale = [file for file in file_list if not index.is_current(file)]
+        if stale:
+            print(Fore.LIGHTWHITE_EX + f'Indexing {len(stale)} of {len(file_list)} CSV files...\n')
+            with alive_bar(len(stale), bar='smooth') as bar:
+                index.update(stale, lambda file: bar())
+
+        total_patterns = len(ruleset.rgx_dict) + len(ruleset.str_dict)
+        print(Fore.LIGHTWHITE_EX + f'\nSearching {len(file_list)} indexed CSV files using {total_patterns} patterns...\n')
+        if plan.width(False) is not None:
+            print(Fore.YELLOW + f'{len(plan.widths)} rule(s) have no literal to look up and run on every line of '
+                                f'{plan.width(False)}+ characters\n')
+        with alive_bar(len(file_list), bar='smooth') as bar:
+            for file in file_list:
+                print(Fore.LIGHTWHITE_EX + f'{file.name}' + Fore.LIGHTGREEN_EX)
+                for idx, detail in index.scan(file, ruleset, plan):
+                    emit(to_row(file, ruleset, idx, detail), file)
+                bar()
+
+
+def find_hits(file_list, dict1, dict2, workers=1, dict3=None, structured=False, index=None):
     """
-    Search parsed artifact output CSVs for regex/strings
+    Search parsed artifact output CSVs for regex/strings. Each file is read once
+    and every line is tested against all patterns together.
     :param file_list: list of CSV files to search
     :param dict1: dictionary with regex
     :param dict2: dictionary with strings
+    :param workers: number of worker processes. Large files are split across workers
+    :param dict3: dictionary with columns targeted by a regex/string, keyed by ('regex' or 'string', rule text)
+    (structured search only)
+    :param structured: parse CSVs and search column values instead of raw lines
+    :param index: folder to keep a SearchIndex in and search through. Not used with structured
     :return: matches, re compile errors
     """
-    re_errors = []
+    ruleset = RuleSet(dict1, dict2, dict3)
     matches = []
-    total_patterns = len(dict1) + len(dict2)
+    _search(file_list, ruleset, workers, lambda row, file: matches.append(row), structured, index)
+    return matches, ruleset.errors
 
-    print(Fore.LIGHTWHITE_EX + f'Found {len(file_list)} CSV files. Searching using {total_patterns} patterns...\n')
-    with alive_bar(len(file_list), bar='smooth') as bar:
-        for file in file_list:
-            print(Fore.LIGHTWHITE_EX + f'{file.name}' + Fore.LIGHTGREEN_EX)
-            for key, val in dict1.items():
-                if key == '[a-zA-Z0-9/+=]{500}' and 'history' in file.name.lower():
-                    pass
-                else:
-                    try:
-                        rgx = re.compile(key)
-                    except Exception as e:
-                        re_errors.append(f'{key}: {e}')
-                    else:
-                        with file.open('r', encoding='utf-8', errors='replace') as fh:
-                            for line in fh:
-                                if rgx.search(line):
-                                    row = [file.name, key, val, line]
-                                    matches.append(row)
-
-            for key, val in dict2.items():
-                with file.open('r', encoding='utf-8', errors='replace') as fh:
-                    for line in fh:
-                        if key.lower() in line.lower():
-                            row = [file.name, key, val, line]
-                            matches.append(row)
+
+def stream_hits(file_list, dict1, dict2, out_path, workers=1, dict3=None, structured=False, index=None,
+                summary=False):
+    """
+    Search parsed artifact output CSVs for regex/strings and write each hit to the
+    SearchResults CSV as it is found, instead of collecting them first
+    :param file_list: list of CSV files to search
+    :param dict1: dictionary with regex
+    :param dict2: dictionary with strings
+    :param out_path: path to write CSV
+    :param workers: number of worker processes. Large files are split across workers
+    :param dict3: dictionary with columns targeted by a regex/string, keyed by ('regex' or 'string', rule text)
+    (structured search only)
+    :param structured: parse CSVs and search column values instead of raw lines
+    :param index: folder to keep a SearchIndex in and search through. Not used with structured
+    :param summary: also write SearchSummary_<timestamp>.csv, with one row per distinct matched line
+    :return: number of hits, re compile errors
+    """
+    ruleset = RuleSet(dict1, dict2, dict3)
+    header = STRUCTURED_HEADER if structured else HEADER
+    hits = _stream(out_path, header, summary,
+                   lambda emit: _search(file_list, ruleset, workers, emit, structured, index), _common_root(file_list))
+    return hits, ruleset.errors
+
+
+def _search_archives(archives, ruleset, workers, emit, password=None, sevenzip=None):
+    """
+    search the text members of each archive with the usual progress output, passing each hit row to emit
+    :return: list of (archive, error message) for archives that couldn't be read
+    """
+    from alive_progress import alive_bar
+
+    total_patterns = len(ruleset.rgx_dict) + len(ruleset.str_dict)
+    print(Fore.LIGHTWHITE_EX + f'Searching {len(archives)} archive(s) in place using {total_patterns} patterns...\n')
+    if workers > 1:
+        print(Fore.LIGHTWHITE_EX + f'Using {workers} workers\n')
+    errors = []
+    with alive_bar(bar='smooth') as bar:  # members aren't counted up front, that would read the archive twice
+        def progress(member):
+            bar.text(member)
             bar()
 
-    return matches, re_errors
+        for archive in archives:
+            print(Fore.LIGHTWHITE_EX + f'{archive.name}' + Fore.LIGHTGREEN_EX)
+            try:
+                for member, idx, detail in search_archive(archive, ruleset, workers, password, sevenzip, progress):
+                    key, val = ruleset.rules[idx]
+                    emit([f'{archive.name}/{member}', key, val, *detail])
+            except Exception as e:  # damaged archive or wrong password. the other archives carry on
+                errors.append((archive, str(e)))
+    return errors
+
+
+def stream_archive_hits(archives, dict1, dict2, out_path, workers=1, password=None, summary=False, sevenzip=None):
+    """
+    Search the text members (CSV, JSON, logs...) of zip, tar(.gz) and 7z archives for regex/strings
+    without extracting them, and write each hit to the SearchResults CSV as it is found
+    :param archives: list of archive files
+    :param dict1: dictionary with regex
+    :param dict2: dictionary with strings
+    :param out_path: path to write CSV
+    :param workers: number of worker processes testing member contents while the archive is read
+    :param password: zip/7z password
+    :param summary: also write SearchSummary_<timestamp>.csv, with one row per distinct matched line
+    :param sevenzip: 7-Zip executable for .7z. Default is 7za.exe in the tools folder, or 7za on the PATH
+    :return: number of hits, re compile errors, list of (archive, error message) for unreadable archives
+    """
+    ruleset = RuleSet(dict1, dict2)
+    errors = []
+    hits = _stream(out_path, HEADER, summary,
+                   lambda emit: errors.extend(_search_archives(archives, ruleset, workers, emit, password, sevenzip)))
+    return hits, ruleset.errors, errors
+
+
+def _stream(out_path, header, summary, search, root=None):
+    """
+    call search(emit) and write each hit row it passes to emit to the SearchResults CSV
+    :param root: folder the searched files are under. the SearchSummary names files relative to it
+    :return: number of hits
+    """
+    aggregator = HitAggregator(root=root) if summary else None
+    try:
+        with HitWriter(out_path, header) as writer:
+            def emit(row, file=None):
+                writer.put(row)
+                if aggregator is not None:
+                    aggregator.add(row, file)
+            search(emit)
+
+        if writer.count > 0:
+            print(Fore.LIGHTRED_EX + f'\nFound {writer.count} hits ' + Fore.LIGHTWHITE_EX +
+                  f'Check {writer.out_file.name} for details.')
+            if aggregator is not None:
+                summary_file = writer.out_file.with_name(writer.out_file.name.replace('SearchResults', 'SearchSummary'))
+                lines = aggregator.write(summary_file)
+                print(Fore.LIGHTWHITE_EX + f'{lines} distinct matched lines. Check {summary_file.name} for the summary.')
+    finally:
+        if aggregator is not None:
+            aggregator.close()
+    return writer.count
+
+
+def _common_root(file_list):
+    """:return: deepest folder holding every file in file_list, None if they don't share one"""
+    try:
+        return Path(os.path.commonpath([str(Path(file).parent) for file in file_list]))
+    except ValueError:  # no files, or a mix of drives or of relative and absolute paths
+        return None
 
 
 def write_csv(hit_list, out_path):
@@ -74,11 +236,9 @@ def write_csv(hit_list, out_path):
         outdir.mkdir(parents=True, exist_ok=True)
 
     out_file = outdir / f'SearchResults_{dt.strftime("%Y%m%d%H%M%S")}.csv'
-    header = ['Source File', 'Match', 'Description', 'Found in Line']
-
     with out_file.open('w', newline='', errors='replace') as fh:
         csv_writer = csv.writer(fh)
-        csv_writer.writerow(header)
+        csv_writer.writerow(HEADER)
 
         for hit in hit_list:
             csv_writer.writerow(hit)
@@ -87,37 +247,73 @@ def write_csv(hit_list, out_path):
         Fore.LIGHTRED_EX + f'\nFound {len(hit_list)} hits ' + Fore.LIGHTWHITE_EX + f'Check {out_file.name} for details.')
 
 
+def main_archives():
+    archives = archive_files(args.source)
+    if not archives:
+        sys.exit(Fore.LIGHTRED_EX + f'No archives found in {args.source}')
+
+    print(Fore.LIGHTWHITE_EX + f'\nBeginning search. Using {args.search} as input file.')
+    hits, rgx_errors, archive_errors = stream_archive_hits(archives, rgx_dict, str_dict, args.out, args.workers,
+                                                           args.password, args.hit_summary, args.sevenzip)
+    for i in set(rgx_errors):
+        print(Fore.LIGHTRED_EX + f'[x] ERROR compiling regex: {i}')
+    for archive, error in archive_errors:
+        print(Fore.LIGHTRED_EX + f'[x] ERROR reading {archive.name}: {error}')
+    if hits == 0:
+        print(Fore.YELLOW + '\nNo matches found.')
+
+
 def main():
+    if args.archives:
+        return main_archives()
     search_path = Path(args.source)
     # get all CSV files in path, sort on file name.
-    files = [i for i in sorted(search_path.rglob('*.csv'), key=lambda j: j.name) if 'SearchResults' not in i.name]
+    files = [i for i in sorted(csv_files(search_path), key=lambda j: j.name) if not is_report(i)]
+    if args.structured:  # read Parquet copies (PackageParser --parquet) where they are up to date
+        files = prefer_parquet(files, search_path)
 
     if len(files) > 0:
         print(Fore.LIGHTWHITE_EX + f'\nBeginning search. Using {args.search} as input file.')
-        hit_list, rgx_errors = find_hits(files, rgx_dict, str_dict)
+        hits, rgx_errors = stream_hits(files, rgx_dict, str_dict, args.out, args.workers, col_dict, args.structured,
+                                       search_path if args.index else None, args.hit_summary)
         rgx_errors = list(set(rgx_errors))
 
         if len(rgx_errors) > 0:
             for i in rgx_errors:
                 print(Fore.LIGHTRED_EX + f'[x] ERROR compiling regex: {i}')
 
-        if len(hit_list) > 0:
-            write_csv(hit_list, args.out)
-
-        else:
+        if hits == 0:
             print(Fore.YELLOW + '\nNo matches found.')
     else:
         print(Fore.LIGHTRED_EX + f'No CSV files found in {search_path}')
 
 
 if __name__ == '__main__':
+    init(autoreset=True)
     parser = argparse.ArgumentParser(description='IOC finder', epilog=examples,
                                      formatter_class=argparse.RawDescriptionHelpFormatter)
     parser.add_argument('-s', '--source', type=str, required=True,
-                        help='Full path to directory containing csv/text files')
+                        help='Full path to directory containing csv/text files (or archive(s), with --archives)')
     parser.add_argument('-o', '--out', type=str, required=True, help='Output directory for CSV with IOC hits')
     parser.add_argument('--search', type=str, action='store', nargs='?', required=True, const='regex.txt',
                         help=' file to use. must be placed in cwd. Default is regex.txt')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of processes to search with. Large CSVs are split between them. Default is 1')
+    parser.add_argument('--structured', action='store_true',
+                        help='parse CSVs and search column values. Rules can target columns with a 4th field')
+    parser.add_argument('--hit-summary', action='store_true',
+                        help='also write SearchSummary CSV: one row per distinct matched line with the rules that '
+                             'matched it, hit counts and first/last source file')
+    parser.add_argument('--index', action='store_true',
+                        help=f'keep a search index ({INDEX}) in the source folder and search through it. '
+                             f'Repeated searches only read lines that can match')
+    parser.add_argument('--archives', action='store_true',
+                        help='-s is a zip, tar(.gz) or 7z archive, or a folder of them. Search the text files in '
+                             'them without extracting. Not used with --structured or --index')
+    parser.add_argument('-p', '--password', type=str, help='archive password, with --archives')
+    parser.add_argument('--sevenzip', type=str,
+                        help='7-Zip executable for .7z archives. Default is 7za.exe in the tools folder, '
+                             'or 7za on the PATH')
     args = parser.parse_args()
     if args.search:
         rgx_file = Path.cwd() / args.search
@@ -133,6 +329,8 @@ if __name__ == '__main__':
                                 rgx_dict[row[1]] = row[2]
                             elif row[0] == '0':  # simple string
                                 str_dict[row[1]] = row[2]
+                            if len(row) > 3 and row[3] and row[0] in ('0', '1'):  # columns to search
+                                col_dict[('regex' if row[0] == '1' else 'string', row[1])] = row[3]
                 except Exception as e:
                     # print(f'\n[x] Formatting issue with regex.txt {e}. Please inspect: {row}')
                     print(Fore.YELLOW + '\nFormatting issue with row in regex.txt: ' + Fore.LIGHTWHITE_EX + f'{e}')
@@ -0,0 +1,143 @@
+import csv
+from pathlib import Path
+
+if __package__:
+    from .compressed import is_compressed, open_text
+else:  # run as a script from the search folder
+    from compressed import is_compressed, open_text
+
+# Parquet rows read at a time. bounds memory on large EvtxECmd/MFTECmd output
+CHUNK_ROWS = 50000
+
+HEADER = ['Source File', 'Match', 'Description', 'Column', 'Row', 'Found in Value']
+# folder convert.parquet writes Parquet copies of the output CSVs to, see PackageParser --parquet
+PARQUET_DIR = 'Parquet'
+
+
+def column_plan(file, columns, ruleset):
+    """
+    Work out which rules apply to which columns of a CSV. A rule with column targets
+    only applies to matching columns (and artifact, taken from the output folder name,
+    e.g. Prefetch or Amcache). Rules without targets apply to every column.
+    :param file: path of CSV file
+    :param columns: CSV header
+    :param ruleset: RuleSet
+    :return: {column: (RuleSet for the column, list mapping its rule indexes to ruleset's)}
+    """
+    artifact = file.parent.name.lower()
+    subsets = {}
+    plan = {}
+
+    for column in columns:
+        name = column.lower()
+        indexes = tuple(idx for idx in range(len(ruleset)) if idx not in ruleset.columns or
+                        any(c == name and a in (None, artifact) for a, c in ruleset.columns[idx]))
+        if not indexes:
+            continue  # nothing targets this column, don't even test it
+        if indexes not in subsets:
+            subsets[indexes] = ruleset.subset(indexes)
+        plan[column] = (subsets[indexes], indexes)
+    return plan
+
+
+def scan_columns(file, ruleset, history=False, chunk_rows=CHUNK_ROWS):
+    """
+    Parse a CSV a record at a time and test each needed column value against its rules.
+    Row numbers count every record after the header as the reader returns it, blank and
+    malformed (more fields than the header, skipped) ones included, so they don't drift
+    :param file: path of CSV file
+    :param ruleset: RuleSet
+    :param history: True if the source is a history file (skips the base64 rule)
+    :param chunk_rows: rows read at a time from Parquet files
+    :return: generator of (rule index, (column, row number, value)) in row order
+    """
+    if str(file).endswith('.parquet'):
+        yield from scan_parquet(file, ruleset, history, chunk_rows)
+        return
+    csv.field_size_limit(2 ** 31 - 1)
+    with open_text(file, newline='') as fh:
+        reader = csv.reader(fh)
+        columns = next(reader, [])
+        if not columns:
+            return
+        columns[0] = columns[0].lstrip('\ufeff')
+        plan = column_plan(file, columns, ruleset)
+        if not plan:
+            return
+
+        # by position, so each copy of a repeated column name is searched
+        targets = [(n, column, *plan[column]) for n, column in enumerate(columns) if column in plan]
+        width = len(columns)
+        for row, record in enumerate(reader, 1):
+            if len(record) > width:
+                continue
+            hits = []
+            for n, column, rules, indexes in targets:
+                value = record[n] if n < len(record) else ''
+                if value:
+                    for local in rules.match(value, history):
+                        hits.append((n, indexes[local], column, value))
+            hits.sort(key=lambda h: h[:2])
+            for _, idx, column, value in hits:
+                yield idx, (column, row, value)
+
+
+def scan_parquet(file, ruleset, history=False, chunk_rows=CHUNK_ROWS):
+    """
+    scan_columns for a Parquet copy of a CSV. Only the columns a rule needs are read.
+    Values of typed columns (numbers, timestamps) are matched as pyarrow formats them
+    :return: generator of (rule index, (column, row number, value)) in row order
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('searching Parquet files needs pyarrow. pip install pyarrow')
+    parquet_file = pyarrow.parquet.ParquetFile(file)
+    columns = parquet_file.schema_arrow.names
+    plan = column_plan(file, columns, ruleset)
+    if not plan:
+        return
+
+    # a batch has every column with a requested name, in request order, so repeated names line up too
+    wanted = [column for column in dict.fromkeys(columns) if column in plan]
+    positions = [n for column in wanted for n, name in enumerate(columns) if name == column]
+    start = 0
+    for batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=wanted):
+        hits = []
+        for n, position in enumerate(positions):
+            column = columns[position]
+            rules, indexes = plan[column]
+            values = batch.column(n).cast(pyarrow.string()).to_pylist()
+            for row, value in enumerate(values, start):
+                if value:
+                    for local in rules.match(value, history):
+                        hits.append((row, position, indexes[local], column, value))
+        start += batch.num_rows
+        hits.sort(key=lambda h: h[:3])
+        for row, _, idx, column, value in hits:
+            yield idx, (column, row + 1, value)
+
+
+def prefer_parquet(files, root):
+    """
+    Swap CSVs for their Parquet copies in root/Parquet, where one exists and is at
+    least as new as the CSV
+    :param files: list of CSV files under root
+    :param root: folder the Parquet copies were made from (the package output folder)
+    :return: list of files to search
+    """
+    root = Path(root)
+    chosen = []
+    for file in files:
+        try:
+            relative = Path(file).relative_to(root)
+            if is_compressed(relative):
+                relative = relative.with_suffix('')
+            twin = root / PARQUET_DIR / relative.with_suffix('.parquet')
+            if twin.stat().st_mtime_ns >= Path(file).stat().st_mtime_ns:
+                file = twin
+        except (ValueError, OSError):
+            pass
+        chosen.append(file)
+    return chosen
@@ -0,0 +1,95 @@
+import csv
+import queue
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+HEADER = ['Source File', 'Match', 'Description', 'Found in Line']
+# CSVs written about a run rather than parsed from the package. never searched, converted or compressed
+REPORTS = ('SearchResults', 'SearchSummary', 'RunMetrics', 'BatchSummary', 'WatchSummary')
+
+_DONE = object()
+
+
+def is_report(file):
+    """:return: True for a SearchResults/SearchSummary CSV, anything in a SearchResults folder, or a run summary"""
+    file = Path(file)
+    return file.name.startswith(REPORTS) or file.parent.name == 'SearchResults'
+
+
+class HitWriter:
+    """
+    Write SearchResults CSV rows as they are found.
+
+    Rows go through a bounded queue to a writer thread, so a noisy rule can't hold
+    more than queue_size hits in memory; the producer simply waits when the queue is
+    full. The CSV is created on the first hit and flushed every flush_rows rows or
+    flush_secs seconds, so a crash only loses the last few hits.
+    """
+
+    def __init__(self, out_path, header=HEADER, queue_size=10000, flush_rows=1000, flush_secs=5):
+        self.header = header
+        self.outdir = Path(out_path).joinpath('SearchResults')
+        self.out_file = self.outdir / f'SearchResults_{datetime.now().strftime("%Y%m%d%H%M%S")}.csv'
+        self.count = 0
+        self.flush_rows = flush_rows
+        self.flush_secs = flush_secs
+        self.error = None
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name='HitWriter', daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def put(self, row):
+        """queue a [file, key, description, line] row. blocks while the queue is full"""
+        if self.error is not None:
+            raise self.error
+        self._queue.put(row)
+
+    def close(self):
+        """write the remaining rows and close the CSV"""
+        if self._thread.is_alive():
+            self._queue.put(_DONE)
+            self._thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def _run(self):
+        fh = None
+        try:
+            last_flush = time.monotonic()
+            while True:
+                try:
+                    row = self._queue.get(timeout=self.flush_secs)
+                except queue.Empty:
+                    row = None
+                if row is _DONE:
+                    break
+
+                if row is not None:
+                    if fh is None:
+                        self.outdir.mkdir(parents=True, exist_ok=True)
+                        fh = self.out_file.open('w', newline='', errors='replace')
+                        csv_writer = csv.writer(fh)
+                        csv_writer.writerow(self.header)
+                    csv_writer.writerow(row)
+                    self.count += 1
+
+                if fh is not None and (self.count % self.flush_rows == 0 or
+                                       time.monotonic() - last_flush >= self.flush_secs):
+                    fh.flush()
+                    last_flush = time.monotonic()
+        except Exception as e:
+            self.error = e
+            # keep draining so the producer never blocks on a full queue
+            while self._queue.get() is not _DONE:
+                pass
+        finally:
+            if fh is not None:
+                fh.close()
@@ -0,0 +1,67 @@
+from pathlib import Path
+import argparse
+import csv
+import sys
+from colorama import init, Fore
+
+from stack.store import SOURCES, STORE, StackStore
+
+examples = '''
+python -m stack.stack -o \\path\\to\\out --update (adds every processed package in the output directory)
+python -m stack.stack -o \\path\\to\\out --least 50 --kind amcache --max-hosts 2
+python -m stack.stack -o \\path\\to\\out --least 500 --csv rare.csv
+
+'''
+HEADER = ['Kind', 'Hosts', 'Count', 'Path', 'Name', 'Hash', 'Host Names']
+
+
+def main():
+    out_dir = Path(args.out)
+    if not out_dir.is_dir():
+        sys.exit(Fore.LIGHTRED_EX + f'Invalid path {out_dir}')
+
+    with StackStore(out_dir / STORE) as store:
+        if args.update:
+            print(Fore.LIGHTWHITE_EX + f'\nUpdating {STORE} from packages in {out_dir}\n')
+
+            def progress(package_dir, result):
+                files, items = result
+                print(Fore.LIGHTWHITE_EX + f'{package_dir.name}: ' + Fore.LIGHTGREEN_EX +
+                      (f'{files} changed CSV(s), {items} items' if files else 'up to date'))
+
+            store.update(out_dir, progress)
+
+        hosts = store.host_count()
+        if not hosts:
+            sys.exit(Fore.YELLOW + f'\nNo packages in {STORE}. Run with --update, or PackageParser with --stack')
+        results = store.least_frequent(args.least, args.kind, args.max_hosts)
+
+    print(Fore.LIGHTWHITE_EX + f'\n{len(results)} least frequent items across {hosts} hosts\n')
+    rows = [[r['kind'], r['hosts'], r['count'], r['path'], r['name'], r['hash'], '; '.join(r['host_names'])]
+            for r in results]
+    if args.csv:
+        with Path(args.csv).open('w', newline='', encoding='utf-8') as fh:
+            writer = csv.writer(fh)
+            writer.writerow(HEADER)
+            writer.writerows(rows)
+        print(Fore.LIGHTWHITE_EX + f'Written to {args.csv}')
+    else:
+        for kind, n, count, path, name, digest, names in rows:
+            print(Fore.LIGHTRED_EX + f'{n:>5} ' + Fore.LIGHTCYAN_EX + f'{kind:<9} ' + Fore.LIGHTWHITE_EX +
+                  f'{path or name}' + (f' {digest}' if digest else '') + Fore.YELLOW + f'  [{names}]')
+
+
+if __name__ == '__main__':
+    init(autoreset=True)
+    parser = argparse.ArgumentParser(description='Stack execution artifacts across processed packages',
+                                     epilog=examples, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-o', '--out', type=str, required=True,
+                        help='PackageParser output directory. The store is kept in it as ' + STORE)
+    parser.add_argument('--update', action='store_true',
+                        help='add packages in the output directory that are new or changed, and drop removed ones')
+    parser.add_argument('--least', type=int, default=50, help='number of least frequent items to list. Default is 50')
+    parser.add_argument('--kind', choices=list(SOURCES), help='only list items from one artifact')
+    parser.add_argument('--max-hosts', type=int, help='only list items seen on at most this many hosts')
+    parser.add_argument('--csv', type=str, help='write the list to a CSV file instead of the console')
+    args = parser.parse_args()
+    main()
@@ -0,0 +1,241 @@
+"""
+Fleet-wide frequency stacking of execution artifacts across processed packages.
+
+Every package processed into the same output folder adds its Amcache, Shimcache,
+Prefetch and RegEXEsFoundOrRun output to one SQLite store, FleetStack.db. Each
+distinct item (artifact kind, path, name, hash) is stored once. Hosts only hold
+integer item ids with a count, and every item keeps the number of hosts it was seen
+on, so "least frequent across the fleet" is an index lookup rather than a pass over
+every host's CSVs. A package's CSVs are only read again when they change.
+"""
+import csv
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+
+from search.compressed import SUFFIXES, open_text
+
+STORE = 'FleetStack.db'
+# kind: (output folder in the package output, CSV name pattern, path column, name column, hash column)
+SOURCES = {
+    'amcache': ('ProgramExecution/Amcache', '*FileEntries.csv', 'FullPath', 'Name', 'SHA1'),
+    'shimcache': ('ProgramExecution/Shimcache', '*.csv', 'Path', None, None),
+    'prefetch': ('ProgramExecution/Prefetch', '*PECmd_Output.csv', None, 'ExecutableName', 'Hash'),
+    'regexes': ('Registry/RegEXEsFoundOrRun', '*.csv', 'ValueData', None, None),
+}
+# hosts listed with each result
+MAX_HOST_NAMES = 10
+BATCH = 5000
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS hosts (id INTEGER PRIMARY KEY, name TEXT UNIQUE, updated TEXT);
+CREATE TABLE IF NOT EXISTS sources (id INTEGER PRIMARY KEY, host INTEGER, kind TEXT, path TEXT, size INTEGER,
+                                    mtime_ns INTEGER, UNIQUE (host, path));
+CREATE TABLE IF NOT EXISTS items (id INTEGER PRIMARY KEY, kind TEXT, path TEXT, name TEXT, hash TEXT,
+                                  hosts INTEGER DEFAULT 0, UNIQUE (kind, path, name, hash));
+CREATE INDEX IF NOT EXISTS items_hosts ON items (hosts, kind);
+CREATE TABLE IF NOT EXISTS seen (item INTEGER, host INTEGER, source INTEGER, count INTEGER,
+                                 PRIMARY KEY (item, host, source)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS seen_source ON seen (source);
+'''
+
+
+def package_dirs(root):
+    """:return: package output folders in an output directory (the ones with a RunManifest.json)"""
+    return sorted(d for d in Path(root).iterdir() if (d / 'RunManifest.json').is_file())
+
+
+def source_files(package_dir):
+    """:return: list of (kind, CSV file) in a package output folder"""
+    files = []
+    for kind, (folder, pattern, *_) in SOURCES.items():
+        for suffix in ('', *SUFFIXES):  # compressed by PackageParser --compress
+            files.extend((kind, path) for path in sorted((Path(package_dir) / folder).glob(pattern + suffix)))
+    return files
+
+
+def read_items(kind, path):
+    """
+    :return: {(path, name, hash): rows} for a CSV, lowercased. Names default to the file name of the path.
+    Empty if the CSV doesn't have the columns for its kind
+    """
+    _, _, path_col, name_col, hash_col = SOURCES[kind]
+    csv.field_size_limit(2 ** 31 - 1)
+    counts = {}
+    with open_text(path, newline='') as fh:
+        reader = csv.reader(fh)
+        header = next(reader, [])
+        if header:
+            header[0] = header[0].lstrip('\ufeff')
+        try:
+            cols = [header.index(c) if c else None for c in (path_col, name_col, hash_col)]
+        except ValueError:
+            return counts
+        width = max(c for c in cols if c is not None)
+        for row in reader:
+            if len(row) <= width:
+                continue
+            item_path, name, digest = (row[c].strip().lower() if c is not None else '' for c in cols)
+            if not name:
+                name = item_path.replace('/', '\\').rsplit('\\', 1)[-1]
+            if not (item_path or name):
+                continue
+            key = (item_path, name, digest)
+            counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+class StackStore:
+    """FleetStack.db in an output directory, shared by every package processed into it"""
+
+    def __init__(self, path, timeout=600):
+        """
+        :param path: store file
+        :param timeout: seconds to wait for another process writing the store (packages run with --jobs)
+        """
+        self.path = Path(path)
+        self.db = sqlite3.connect(str(self.path), timeout=timeout, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def _host(self, name):
+        self.db.execute('INSERT OR IGNORE INTO hosts (name) VALUES (?)', (name,))
+        return self.db.execute('SELECT id FROM hosts WHERE name = ?', (name,)).fetchone()[0]
+
+    def _remove_source(self, source, host):
+        db = self.db
+        db.execute('CREATE TEMP TABLE IF NOT EXISTS gone (item INTEGER PRIMARY KEY)')
+        db.execute('DELETE FROM gone')
+        db.execute('INSERT INTO gone SELECT item FROM seen WHERE source = ?', (source,))
+        db.execute('DELETE FROM seen WHERE source = ?', (source,))
+        db.execute('UPDATE items SET hosts = hosts - 1 WHERE id IN gone AND NOT EXISTS '
+                   '(SELECT 1 FROM seen WHERE seen.item = items.id AND seen.host = ?)', (host,))
+        db.execute('DELETE FROM items WHERE hosts <= 0 AND id IN gone')
+        db.execute('DELETE FROM sources WHERE id = ?', (source,))
+
+    def _add_source(self, host, kind, path, key, stat):
+        db = self.db
+        counts = read_items(kind, path)
+        source = db.execute('INSERT INTO sources (host, kind, path, size, mtime_ns) VALUES (?, ?, ?, ?, ?)',
+                            (host, kind, key, stat.st_size, stat.st_mtime_ns)).lastrowid
+        db.execute('CREATE TEMP TABLE IF NOT EXISTS incoming (path TEXT, name TEXT, hash TEXT, count INTEGER)')
+        db.execute('DELETE FROM incoming')
+        rows = [(p, n, h, c) for (p, n, h), c in counts.items()]
+        for start in range(0, len(rows), BATCH):
+            db.executemany('INSERT INTO incoming VALUES (?, ?, ?, ?)', rows[start:start + BATCH])
+        db.execute('INSERT OR IGNORE INTO items (kind, path, name, hash) SELECT ?, path, name, hash FROM incoming',
+                   (kind,))
+        db.execute('CREATE TEMP TABLE IF NOT EXISTS found (item INTEGER PRIMARY KEY, count INTEGER)')
+        db.execute('DELETE FROM found')
+        db.execute('INSERT INTO found SELECT items.id, incoming.count FROM incoming JOIN items ON items.kind = ? AND '
+                   'items.path = incoming.path AND items.name = incoming.name AND items.hash = incoming.hash', (kind,))
+        # hosts is counted once per host, however many of its sources have the item
+        db.execute('UPDATE items SET hosts = hosts + 1 WHERE id IN (SELECT item FROM found) AND NOT EXISTS '
+                   '(SELECT 1 FROM seen WHERE seen.item = items.id AND seen.host = ?)', (host,))
+        db.execute('INSERT INTO seen SELECT item, ?, ?, count FROM found', (host, source))
+        return len(rows)
+
+    def update_host(self, package_dir):
+        """
+        Bring a package's entries up to date with its output CSVs. Unchanged CSVs are skipped,
+        changed ones replace what they added before, and removed ones are taken out
+        :param package_dir: package output folder. its name is the host name
+        :return: (CSV files read, distinct items in them)
+        """
+        package_dir = Path(package_dir)
+        files = source_files(package_dir)
+        read = items = 0
+        self.db.execute('BEGIN IMMEDIATE')  # one package at a time when several processes update the store
+        try:
+            host = self._host(package_dir.name)
+            known = {path: (source, size, mtime) for source, path, size, mtime in
+                     self.db.execute('SELECT id, path, size, mtime_ns FROM sources WHERE host = ?', (host,))}
+            for kind, path in files:
+                key = path.relative_to(package_dir).as_posix()
+                stat = path.stat()
+                entry = known.pop(key, None)
+                if entry is not None:
+                    if entry[1:] == (stat.st_size, stat.st_mtime_ns):
+                        continue
+                    self._remove_source(entry[0], host)
+                items += self._add_source(host, kind, path, key, stat)
+                read += 1
+            for source, _, _ in known.values():
+                self._remove_source(source, host)
+            self.db.execute('UPDATE hosts SET updated = ? WHERE id = ?',
+                            (str(datetime.now().replace(microsecond=0)), host))
+            self.db.execute('COMMIT')
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            raise
+        return read, items
+
+    def remove_host(self, name):
+        """take a host and everything only it had out of the store"""
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            row = self.db.execute('SELECT id FROM hosts WHERE name = ?', (name,)).fetchone()
+            if row is not None:
+                for (source,) in self.db.execute('SELECT id FROM sources WHERE host = ?', row).fetchall():
+                    self._remove_source(source, row[0])
+                self.db.execute('DELETE FROM hosts WHERE id = ?', row)
+            self.db.execute('COMMIT')
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            raise
+
+    def update(self, root, progress=None):
+        """
+        Update every package output folder in an output directory, and drop hosts whose folder is gone
+        :param root: output directory (-o)
+        :param progress: optional callable(package folder, (files read, items)), called as each is done
+        """
+        dirs = package_dirs(root)
+        names = {d.name for d in dirs}
+        for (name,) in self.db.execute('SELECT name FROM hosts').fetchall():
+            if name not in names:
+                self.remove_host(name)
+        for package_dir in dirs:
+            result = self.update_host(package_dir)
+            if progress is not None:
+                progress(package_dir, result)
+
+    def host_count(self):
+        return self.db.execute('SELECT COUNT(*) FROM hosts').fetchone()[0]
+
+    def least_frequent(self, limit=50, kind=None, max_hosts=None):
+        """
+        :param limit: items returned
+        :param kind: only items of this kind (see SOURCES)
+        :param max_hosts: only items seen on at most this many hosts
+        :return: list of dicts, rarest first: kind, path, name, hash, hosts, count (rows across hosts)
+        and host_names (up to MAX_HOST_NAMES)
+        """
+        where = ['hosts > 0']
+        params = []
+        if kind is not None:
+            where.append('kind = ?')
+            params.append(kind)
+        if max_hosts is not None:
+            where.append('hosts <= ?')
+            params.append(max_hosts)
+        rows = self.db.execute(f'SELECT id, kind, path, name, hash, hosts FROM items WHERE {" AND ".join(where)} '
+                               f'ORDER BY hosts, id LIMIT ?', params + [limit]).fetchall()
+        results = []
+        for item, kind, path, name, digest, hosts in rows:
+            seen = self.db.execute('SELECT hosts.name, SUM(count) FROM seen JOIN hosts ON hosts.id = seen.host '
+                                   'WHERE seen.item = ? GROUP BY hosts.name ORDER BY hosts.name', (item,)).fetchall()
+            results.append({'kind': kind, 'path': path, 'name': name, 'hash': digest, 'hosts': hosts,
+                            'count': sum(c for _, c in seen),
+                            'host_names': [n for n, _ in seen[:MAX_HOST_NAMES]]})
+        return results
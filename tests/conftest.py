@@ -0,0 +1,66 @@
+"""
+Fixtures shared by the tests that run whole packages: stand-in EZ tools and small
+zip packages.
+"""
+import json
+import stat
+import sys
+from zipfile import ZipFile
+
+import pytest
+
+from bench.fake_tools import BATCH_FILES, TOOLS
+
+# stand-in tool. appends its name and arguments to $STUB_EVENTS and writes a one row CSV naming its input and a
+# match for the search rules to its --csv folder. exits 1 instead if $STUB_FAIL lists its name, or name:text
+# with text in its input path
+STUB = '''#!{python}
+import json, os, sys, time
+from pathlib import Path
+name = Path(sys.argv[0]).stem
+args = [a.strip('"') for a in sys.argv[1:]]
+with open(os.environ['STUB_EVENTS'], 'a') as fh:
+    fh.write(json.dumps({{'tool': name, 'args': args}}) + '\\n')
+out = Path(args[args.index('--csv') + 1])
+source = args[args.index('-f') + 1] if '-f' in args else args[args.index('-d') + 1]
+for fail in os.environ.get('STUB_FAIL', '').split(','):
+    if fail == name or (fail.startswith(name + ':') and fail[len(name) + 1:] in source):
+        sys.exit(1)
+out.mkdir(parents=True, exist_ok=True)
+with (out / (time.strftime('%Y%m%d%H%M%S') + '_' + name + '_Output.csv')).open('w') as fh:
+    fh.write('SourceFile,ExecutableName\\n' + source + ',mimikatz.exe\\n')
+'''
+
+
+@pytest.fixture
+def stub_tools(tmp_path, monkeypatch):
+    """
+    :return: (tools folder, function returning the tool runs recorded so far as dicts of tool and args)
+    """
+    tools = tmp_path / 'tools'
+    for tool in TOOLS:
+        path = tools / tool
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(STUB.format(python=sys.executable))
+        path.chmod(path.stat().st_mode | stat.S_IXUSR)
+    for batch in BATCH_FILES:
+        (tools / batch).write_text('batch')
+    events = tmp_path / 'events.jsonl'
+    events.touch()
+    monkeypatch.setenv('STUB_EVENTS', str(events))
+
+    def runs():
+        return [json.loads(line) for line in events.read_text().splitlines()]
+    return tools, runs
+
+
+@pytest.fixture
+def make_package(tmp_path):
+    """:return: function(name, member names, folder) writing a zip package of 4 KB members, returning its path"""
+    def make(name, members, folder=tmp_path / 'src'):
+        folder.mkdir(parents=True, exist_ok=True)
+        with ZipFile(folder / f'{name}.zip', 'w') as zf:
+            for member in members:
+                zf.writestr(member, b'\0' * 4096)
+        return folder / f'{name}.zip'
+    return make
@@ -0,0 +1,71 @@
+import csv
+import os
+
+import pytest
+
+from search import aggregate
+from search.aggregate import HitAggregator
+from search import search
+
+LINE = '1,True,C:\\ProgramData\\mimikatz\\x.dll,x.dll\n'
+
+
+def summary(tmp_path):
+    files = list((tmp_path / 'out' / 'SearchResults').glob('SearchSummary_*.csv'))
+    assert len(files) == 1
+    with files[0].open(newline='') as fh:
+        return list(csv.DictReader(fh))
+
+
+def test_same_named_files_in_different_folders_count_apart(tmp_path):
+    for host in ('HOST1', 'HOST2'):
+        out = tmp_path / 'hosts' / host / 'Amcache'
+        out.mkdir(parents=True)
+        (out / 'Amcache.csv').write_text('Line,Flag,Path,Name\n' + LINE)
+    files = sorted((tmp_path / 'hosts').rglob('*.csv'))
+
+    hits, _ = search.stream_hits(files, {}, {'mimikatz': 'tool'}, tmp_path / 'out', summary=True)
+    assert hits == 2
+    rows = summary(tmp_path)
+    assert len(rows) == 1
+    assert rows[0]['Files'] == '2'
+    assert rows[0]['First Source File'] == os.path.join('HOST1', 'Amcache', 'Amcache.csv')
+    assert rows[0]['Last Source File'] == os.path.join('HOST2', 'Amcache', 'Amcache.csv')
+
+
+def test_spilled_groups_merge_in_first_found_order(tmp_path):
+    with HitAggregator(max_groups=2, partitions=3) as aggregator:
+        for file in ('a.csv', 'b.csv'):  # hits come in file order
+            for n in range(10):
+                aggregator.add([file, 'rule', 'desc', f'line {n % 5}'], tmp_path / file)
+        assert aggregator._spill_dir is not None
+        rows = list(aggregator.rows())
+    assert [row[-1] for row in rows] == [f'line {n}' for n in range(5)]
+    assert all(row[1] == 4 and row[5] == 2 for row in rows)
+
+
+def test_spill_files_removed_when_the_search_fails(tmp_path, monkeypatch):
+    spill_dirs = []
+    mkdtemp = aggregate.tempfile.mkdtemp
+
+    def tracked(**kwargs):
+        spill_dirs.append(mkdtemp(dir=tmp_path, **kwargs))
+        return spill_dirs[-1]
+
+    def to_row(file, ruleset, idx, detail):
+        if file.name == '4.csv':
+            raise OSError('disk gone')
+        return real_to_row(file, ruleset, idx, detail)
+
+    real_to_row = search.to_row
+    monkeypatch.setattr(aggregate.tempfile, 'mkdtemp', tracked)
+    monkeypatch.setattr(search, 'HitAggregator', lambda root: HitAggregator(max_groups=2, root=root))
+    monkeypatch.setattr(search, 'to_row', to_row)
+    (tmp_path / 'in').mkdir()
+    for n in range(5):
+        (tmp_path / 'in' / f'{n}.csv').write_text(f'Line,Path\n1,mimikatz {n}\n')
+
+    with pytest.raises(OSError):
+        search.stream_hits(sorted((tmp_path / 'in').glob('*.csv')), {}, {'mimikatz': 'tool'}, tmp_path / 'out',
+                           summary=True)
+    assert spill_dirs and not any(os.path.exists(d) for d in spill_dirs)
@@ -0,0 +1,72 @@
+import codecs
+import csv
+import io
+import tarfile
+from zipfile import ZipFile
+
+import pytest
+
+import search.search
+from search.archive import archive_files, line_blocks, search_archive
+from search.engine import RuleSet
+
+RULES = {r'(?i)\\Users\\Public(\\|,)[\w-]+\.(exe|ps1|bat|vbs|hta)': 'Suspicious in C:\\Users\\Public'}
+STRINGS = {'mimikatz': 'Mimikatz'}
+MEMBERS = {
+    'host1/Amcache.csv': 'Path,Name\nC:\\Windows\\notepad.exe,notepad.exe\nC:\\Users\\Public\\run.exe,run.exe\n',
+    'host1/QueryResults/processes.json': '[{"name": "mimikatz.exe"}]\n',
+    'host1/notes.log': b'\xff\xfe' + 'started mimikatz\r\n'.encode('utf-16-le'),
+    'host1/tools/mimikatz.exe': b'MZ\0\0mimikatz',  # not a text member
+    'host1/dump.bin.csv': b'\0\0mimikatz\0',  # binary content
+}
+EXPECTED = [('host1/Amcache.csv', 'C:\\Users\\Public\\run.exe,run.exe\n'),
+            ('host1/QueryResults/processes.json', '[{"name": "mimikatz.exe"}]\n'),
+            ('host1/notes.log', 'started mimikatz\n')]
+
+
+def data(value):
+    return value if isinstance(value, bytes) else value.encode('utf-8')
+
+
+@pytest.fixture
+def archives(tmp_path):
+    with ZipFile(tmp_path / 'host1.zip', 'w') as zf:
+        for name, value in MEMBERS.items():
+            zf.writestr(name, data(value))
+    with tarfile.open(tmp_path / 'host1.tar.gz', 'w:gz') as tf:
+        for name, value in MEMBERS.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data(value))
+            tf.addfile(info, io.BytesIO(data(value)))
+    (tmp_path / 'readme.txt').write_text('not an archive')
+    return tmp_path
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_text_members_searched_in_place(archives, workers):
+    assert [i.name for i in archive_files(archives)] == ['host1.tar.gz', 'host1.zip']
+    ruleset = RuleSet(RULES, STRINGS)
+    for archive in archive_files(archives):
+        hits = [(member, detail[0]) for member, _, detail in search_archive(archive, ruleset, workers)]
+        assert hits == EXPECTED
+
+
+def test_lines_kept_whole_across_blocks():
+    text = b''.join(b'line %d\n' % n for n in range(100)) + b'last'
+    blocks = list(line_blocks(io.BytesIO(text), block_size=16))
+    assert b''.join(blocks) == text and len(blocks) > 1
+    assert all(block.endswith(b'\n') for block in blocks[:-1])
+    utf16 = codecs.BOM_UTF16_LE + 'a\nb\n'.encode('utf-16-le')
+    assert b''.join(line_blocks(io.BytesIO(utf16), block_size=3)) == b'a\nb\n'
+
+
+def test_stream_archive_hits(archives, tmp_path):
+    (archives / 'broken.zip').write_bytes(b'PK not a zip')
+    hits, compile_errors, errors = search.search.stream_archive_hits(archive_files(archives), RULES, STRINGS,
+                                                                     tmp_path / 'out')
+    assert hits == 6 and not compile_errors
+    assert [(archive.name, bool(error)) for archive, error in errors] == [('broken.zip', True)]
+    with next((tmp_path / 'out' / 'SearchResults').glob('*.csv')).open(encoding='utf-8', newline='') as fh:
+        rows = list(csv.reader(fh))[1:]
+    assert [(row[0], row[3]) for row in rows] == \
+        [(f'{archive}/{member}', line) for archive in ('host1.tar.gz', 'host1.zip') for member, line in EXPECTED]
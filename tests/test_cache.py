@@ -0,0 +1,95 @@
+import os
+import time
+
+from PackageParser import parse_package
+from runner.cache import ToolCache
+
+
+def setup(tmp_path, package='pkg1'):
+    tools = tmp_path / 'tools'
+    tools.mkdir(exist_ok=True)
+    (tools / 'PECmd.exe').write_bytes(b'tool')
+    package = tmp_path / package
+    (package / 'Prefetch').mkdir(parents=True, exist_ok=True)
+    (package / 'Prefetch' / 'APP.EXE-1234.pf').write_bytes(b'prefetch')
+    out = tmp_path / 'out' / package.name / 'Prefetch'
+    command = [str(tools / 'PECmd.exe'), '-d', str(package / 'Prefetch'), '--csv', str(out)]
+    return tools, package, out, command
+
+
+def run_tool(out, package):
+    out.mkdir(parents=True, exist_ok=True)
+    csv_file = out / 'PECmd_Output.csv'
+    csv_file.write_text(f'SourceFilename,ExecutableName\n{package}\\Prefetch\\APP.EXE-1234.pf,APP.EXE\n')
+    return [csv_file]
+
+
+def test_hit_restores_a_copy(tmp_path):
+    cache = ToolCache(tmp_path / 'cache')
+    tools, package, out, command = setup(tmp_path)
+    inputs = [package / 'Prefetch' / 'APP.EXE-1234.pf']
+    key = cache.key(command, inputs, package, out, tools)
+    assert cache.restore(key, out, package) is None
+    files = run_tool(out, package)
+    cache.store(key, files, out, package, 12.5)
+    original = files[0].read_text()
+
+    files[0].unlink()
+    assert cache.restore(key, out, package) == files
+    assert files[0].read_text() == original
+    # changing the restored output in place leaves the cache alone
+    files[0].write_text('changed')
+    assert cache.restore(key, out, package) == files
+    assert files[0].read_text() == original
+    assert (cache.hits, cache.misses, cache.saved) == (2, 1, 25.0)
+
+
+def test_same_artifacts_in_another_package(tmp_path):
+    cache = ToolCache(tmp_path / 'cache')
+    tools, package, out, command = setup(tmp_path)
+    key = cache.key(command, [package / 'Prefetch' / 'APP.EXE-1234.pf'], package, out, tools)
+    cache.store(key, run_tool(out, package), out, package, 1)
+
+    tools, other, other_out, command = setup(tmp_path, 'pkg2')
+    assert cache.key(command, [other / 'Prefetch' / 'APP.EXE-1234.pf'], other, other_out, tools) == key
+    restored = cache.restore(key, other_out, other)
+    assert f'{other}\\Prefetch' in restored[0].read_text()
+    assert str(package) + '\\' not in restored[0].read_text()
+
+    # different content is a different key
+    (other / 'Prefetch' / 'APP.EXE-1234.pf').write_bytes(b'other prefetch')
+    assert cache.key(command, [other / 'Prefetch' / 'APP.EXE-1234.pf'], other, other_out, tools) != key
+
+
+def test_least_recently_used_entries_evicted(tmp_path):
+    tools, package, out, command = setup(tmp_path)
+    cache = ToolCache(tmp_path / 'cache', max_bytes=2 * len(run_tool(out, package)[0].read_bytes()))
+    keys = []
+    for n in range(3):
+        key = cache.key(command + [f'--n{n}'], [package / 'Prefetch' / 'APP.EXE-1234.pf'], package, out, tools)
+        cache.store(key, run_tool(out, package), out, package, 1)
+        keys.append(key)
+        # entry.json mtimes order the entries. make sure they differ on coarse file systems
+        entry = cache.root / key[:2] / key / 'entry.json'
+        os.utime(entry, (time.time() - 100 + n * 10,) * 2)
+        if n == 1:
+            assert cache.restore(keys[0], out, package) is not None  # keys[0] is now the most recently used
+            os.utime(cache.root / keys[0][:2] / keys[0] / 'entry.json', (time.time() - 50,) * 2)
+
+    assert cache.restore(keys[1], out, package) is None
+    assert cache.restore(keys[0], out, package) is not None
+    assert cache.restore(keys[2], out, package) is not None
+
+
+def test_second_package_with_the_same_artifacts_runs_no_tools(tmp_path, stub_tools, make_package):
+    tools, runs = stub_tools
+    members = ['C/Windows/Prefetch/APP.EXE-12345678.pf', 'C/Windows/AppCompat/Programs/Amcache.hve']
+    first = parse_package(make_package('host1', members), tmp_path / 'out', tool_path=tools, cache=tmp_path / 'cache')
+    ran = len(runs())
+    assert ran and first.cache.misses == ran and first.cache.hits == 0
+
+    second = parse_package(make_package('host2', members), tmp_path / 'out', tool_path=tools, cache=tmp_path / 'cache')
+    assert len(runs()) == ran
+    assert second.cache.hits == ran
+    csv_file = next((second.out_dir / 'ProgramExecution' / 'Prefetch').glob('*.csv'))
+    assert str(second.package) in csv_file.read_text() and str(first.package) + os.sep not in csv_file.read_text()
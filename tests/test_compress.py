@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+import search.search
+from convert.compress import compress_file, compress_files
+from search.compressed import csv_files, csv_name, open_text
+
+CSV = 'Path,Size\n' + ''.join(f'C:\\Windows\\System32\\file{n}.dll,{n}\n' for n in range(2000)) + \
+      'C:\\Users\\Public\\run.exe,1\n'
+RULES = {r'(?i)\\Users\\Public(\\|,)[\w-]+\.(exe|ps1|bat|vbs|hta)': 'Suspicious in C:\\Users\\Public'}
+
+
+def write_csv(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(CSV, encoding='utf-8')
+    os.utime(path, (1_600_000_000, 1_600_000_000))
+    return path
+
+
+@pytest.mark.parametrize('method, suffix', [('gzip', '.gz'), ('zstd', '.zst')])
+def test_round_trip(tmp_path, method, suffix):
+    if method == 'zstd':
+        pytest.importorskip('zstandard')
+    path = write_csv(tmp_path / 'out' / 'MFTECmd_Output.csv')
+    before, after = compress_file(path, method)
+    compressed = path.with_name(path.name + suffix)
+    assert not path.exists() and before == len(CSV) and after == compressed.stat().st_size < before
+    assert compressed.stat().st_mtime == 1_600_000_000
+    assert csv_files(tmp_path) == [compressed] and csv_name(compressed) == path.name
+    with open_text(compressed, newline='') as fh:
+        assert fh.read() == CSV
+
+
+def test_compress_files_reports_errors(tmp_path):
+    good = write_csv(tmp_path / 'a.csv')
+    results = sorted(compress_files([good, tmp_path / 'missing.csv'], workers=2))
+    assert [(path.name, error is None) for path, _, _, error in results] == [('a.csv', True), ('missing.csv', False)]
+    with pytest.raises(ValueError):
+        list(compress_files([good], 'lzma'))
+
+
+def test_search_hits_match_plain_csv(tmp_path):
+    plain = write_csv(tmp_path / 'plain' / 'MFTECmd_Output.csv')
+    packed = write_csv(tmp_path / 'packed' / 'MFTECmd_Output.csv')
+    compress_file(packed)
+    expected, _ = search.search.find_hits([plain], RULES, {})
+    assert len(expected) == 1
+    for workers in (1, 2):
+        matches, _ = search.search.find_hits(csv_files(tmp_path / 'packed'), RULES, {}, workers=workers)
+        # hits name the file that was read
+        assert [['MFTECmd_Output.csv.gz'] + row[1:] for row in expected] == matches
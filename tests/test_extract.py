@@ -0,0 +1,50 @@
+import io
+import tarfile
+from zipfile import ZipFile
+
+from artifacts.extract import _windows_name, extract_tar, extract_zip, select_names
+
+CONFIG = 'C/Windows/System32/config/'
+
+
+def test_hive_logs_are_selected_with_their_hives():
+    names = [CONFIG + 'SYSTEM', CONFIG + 'SYSTEM.LOG1', CONFIG + 'SYSTEM.LOG2', CONFIG + 'SOFTWARE.LOG',
+             'C/Users/a/NTUSER.DAT', 'C/Users/a/ntuser.dat.LOG1', 'C/Users/a/ntuser.dat.LOG2',
+             'C/Windows/AppCompat/Programs/Amcache.hve', 'C/Windows/AppCompat/Programs/Amcache.hve.LOG1']
+    assert select_names(names) == names
+
+
+def test_other_logs_are_not_selected():
+    names = ['C/Windows/setupact.log', 'C/Windows/Logs/CBS/CBS.log', 'C/Users/a/notes.txt.LOG1',
+             'C/Windows/System32/winevt/Logs/Security.evtx.LOG1']
+    assert select_names(names) == []
+
+
+def test_tar_keeps_logs_read_before_their_hive(tmp_path):
+    source = tmp_path / 'pkg.tar.gz'
+    with tarfile.open(source, 'w:gz') as tf:
+        for name in ('SYSTEM.LOG1', 'SYSTEM.LOG2', 'SYSTEM', 'setupapi.dev.log'):
+            info = tarfile.TarInfo(CONFIG + name)
+            info.size = 4
+            tf.addfile(info, io.BytesIO(b'regf'))
+
+    assert extract_tar(source, tmp_path / 'out') == (3, 4)
+    assert sorted(p.name for p in (tmp_path / 'out' / CONFIG).iterdir()) == ['SYSTEM', 'SYSTEM.LOG1', 'SYSTEM.LOG2']
+
+
+def test_zip_threads_share_folders(tmp_path):
+    source = tmp_path / 'pkg.zip'
+    names = [f'C/Windows/Prefetch/APP{n:03d}.EXE-0000{n:04d}.pf' for n in range(40)]
+    names += [f'C/Users/user{n:02d}/NTUSER.DAT' for n in range(8)] + ['C/Program Files/app.dll']
+    with ZipFile(source, 'w') as zf:
+        for name in names:
+            zf.writestr(name, b'x' * 100)
+
+    assert extract_zip(source, tmp_path / 'out', threads=8) == (48, 49)
+    assert len(list((tmp_path / 'out' / 'C/Windows/Prefetch').iterdir())) == 40
+    assert not (tmp_path / 'out' / 'C/Program Files').exists()
+
+
+def test_windows_member_names_cleaned_like_zipfile():
+    assert _windows_name('C\\Users\\a:b<c>?\\dir. \\file.txt.') == 'C\\Users\\a_b_c__\\dir\\file.txt'
+    assert _windows_name('C\\...\\x') == 'C\\x'
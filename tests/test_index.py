@@ -0,0 +1,13 @@
+import search.search
+from search.index import INDEX
+
+
+def test_index_falls_back_to_a_plain_scan_without_trigram_support(tmp_path, monkeypatch):
+    (tmp_path / 'a.csv').write_text('Path\nC:\\Users\\Public\\run.exe\nC:\\Windows\\notepad.exe\n')
+    rules = {r'(?i)\\Users\\Public(\\|,)[\w-]+\.(exe|ps1|bat|vbs|hta)': 'Suspicious in C:\\Users\\Public'}
+    expected, _ = search.search.find_hits([tmp_path / 'a.csv'], rules, {})
+
+    monkeypatch.setattr(search.search, 'trigram_support', lambda: False)
+    matches, _ = search.search.find_hits([tmp_path / 'a.csv'], rules, {}, index=tmp_path)
+    assert matches == expected and len(matches) == 1
+    assert not (tmp_path / INDEX).exists()
@@ -0,0 +1,52 @@
+import csv
+import json
+
+from PackageParser import INSTANCES, parse_package
+from convert.merge import INSTANCE_COLUMN
+from runner.manifest import MANIFEST
+
+PACKAGE = ['C/$MFT', 'VSS1/C/$MFT', 'C/Windows/Prefetch/APP.EXE-12345678.pf',
+           'VSS1/C/Windows/Prefetch/OLD.EXE-87654321.pf', 'C/Windows/AppCompat/Programs/Amcache.hve']
+
+
+def merged(out_dir, folder):
+    files = list((out_dir / folder).glob('*.csv'))
+    assert len(files) == 1
+    with files[0].open(encoding='utf-8', newline='') as fh:
+        return list(csv.DictReader(fh))
+
+
+def test_each_instance_parsed_and_merged(tmp_path, stub_tools, make_package):
+    tools, runs = stub_tools
+    package = parse_package(make_package('host1', PACKAGE), tmp_path / 'out', tool_path=tools, tool_workers=2)
+    assert package.errors == 0
+
+    stages = json.loads((package.out_dir / MANIFEST).read_text())['stages']
+    assert {name for name in stages if name.startswith('mft_parse:')} == {'mft_parse:MFT/C', 'mft_parse:MFT/VSS1_C'}
+    assert len([r for r in runs() if r['tool'] == 'MFTECmd']) == 2
+    assert len([r for r in runs() if r['tool'] == 'AmcacheParser']) == 1
+
+    rows = merged(package.out_dir, 'Filesystem/MFT')
+    assert sorted(row[INSTANCE_COLUMN] for row in rows) == ['C', 'VSS1_C']
+    assert sorted(row[INSTANCE_COLUMN] for row in merged(package.out_dir, 'ProgramExecution/Prefetch')) == \
+        ['C_Windows_Prefetch', 'VSS1_C_Windows_Prefetch']
+    # single instance output is as before
+    assert INSTANCE_COLUMN not in merged(package.out_dir, 'ProgramExecution/Amcache')[0]
+    assert not (package.out_dir / INSTANCES).exists()
+
+
+def test_failed_instance_kept_for_resume(tmp_path, stub_tools, make_package, monkeypatch):
+    tools, runs = stub_tools
+    archive = make_package('host1', PACKAGE)
+    monkeypatch.setenv('STUB_FAIL', 'MFTECmd:VSS1')
+    package = parse_package(archive, tmp_path / 'out', tool_path=tools)
+    assert package.errors
+    assert [row[INSTANCE_COLUMN] for row in merged(package.out_dir, 'Filesystem/MFT')] == ['C']
+    assert (package.out_dir / INSTANCES).is_dir()
+
+    monkeypatch.delenv('STUB_FAIL')
+    before = len(runs())
+    package = parse_package(archive, tmp_path / 'out', tool_path=tools, resume=True)
+    assert [(r['tool'], 'VSS1' in r['args'][1]) for r in runs()[before:]] == [('MFTECmd', True)]
+    assert sorted(row[INSTANCE_COLUMN] for row in merged(package.out_dir, 'Filesystem/MFT')) == ['C', 'VSS1_C']
+    assert not (package.out_dir / INSTANCES).exists()
@@ -0,0 +1,73 @@
+"""
+Stream JSON files with convert.json2csv, including records split across reads and
+corrupt records in large files.
+"""
+import json
+from pathlib import Path
+
+import pytest
+
+from convert import json2csv
+from convert.json2csv import ConvertError, iter_records
+
+RECORD = {'Name': 'value', 'Flag': True, 'Empty': None, 'Size': -12345.5e3, 'Path': 'C:\\Windows\\u00e9'}
+
+
+class CountingFile:
+    """text file wrapper that counts the characters read"""
+
+    def __init__(self, fh, counter):
+        self.fh = fh
+        self.counter = counter
+
+    def read(self, size=-1):
+        data = self.fh.read(size)
+        self.counter.append(len(data))
+        return data
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fh.close()
+
+
+def count_reads(monkeypatch):
+    """:return: list that gets the number of characters of each read by json2csv"""
+    counter = []
+    real_open = Path.open
+    monkeypatch.setattr(json2csv.Path, 'open', lambda self, *a, **kw: CountingFile(real_open(self, *a, **kw), counter))
+    return counter
+
+
+@pytest.mark.parametrize('read_size', [1, 7, 64, 2 ** 20])
+def test_records_split_across_reads(tmp_path, read_size):
+    records = [dict(RECORD, Row=n) for n in range(50)]
+    array = tmp_path / 'array.json'
+    array.write_text(json.dumps(records, ensure_ascii=False), encoding='utf-8')
+    ndjson = tmp_path / 'records.json'
+    ndjson.write_text('\n'.join(json.dumps(r) for r in records) + '\n', encoding='utf-8')
+
+    assert list(iter_records(array, read_size)) == records
+    assert list(iter_records(ndjson, read_size)) == records
+
+
+@pytest.mark.parametrize('ndjson', [False, True])
+def test_corrupt_record_fails_without_reading_rest(tmp_path, monkeypatch, ndjson):
+    good = json.dumps(RECORD)
+    lines = [good] * 10 + ['{"Name": "value", "Flag": tru, "Size": 1}'] + [good] * 100000
+    path = tmp_path / 'large.json'
+    path.write_text('\n'.join(lines) if ndjson else '[' + ',\n'.join(lines) + ']', encoding='utf-8')
+    size = path.stat().st_size
+
+    reads = count_reads(monkeypatch)
+    with pytest.raises(ConvertError, match='record 11'):
+        list(iter_records(path, read_size=4096))
+    assert sum(reads) < 4 * 4096 < size
+
+
+def test_unclosed_array(tmp_path):
+    path = tmp_path / 'unclosed.json'
+    path.write_text('[' + json.dumps(RECORD), encoding='utf-8')
+    with pytest.raises(ConvertError):
+        list(iter_records(path))
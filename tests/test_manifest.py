@@ -0,0 +1,34 @@
+import json
+from pathlib import Path
+
+from PackageParser import parse_package
+from runner.manifest import MANIFEST, unfinished
+
+PACKAGE = ['C/Windows/Prefetch/APP.EXE-12345678.pf', 'C/Windows/AppCompat/Programs/Amcache.hve',
+           'C/Users/user01/AppData/Roaming/Microsoft/Windows/Recent/doc.lnk']
+
+
+def test_resume_reruns_only_unfinished_stages(tmp_path, stub_tools, make_package, monkeypatch):
+    tools, runs = stub_tools
+    archive = make_package('host1', PACKAGE)
+    monkeypatch.setenv('STUB_FAIL', 'PECmd')
+    package = parse_package(archive, tmp_path / 'out', tool_path=tools)
+
+    manifest = json.loads((package.out_dir / MANIFEST).read_text())
+    assert manifest['finished'] and not archive.exists()
+    assert manifest['stages']['prefetch_parse']['status'] == 'failed'
+    assert manifest['stages']['amcache_parse']['status'] == 'done'
+    assert manifest['stages']['amcache_parse']['inputs'] == [str(Path(PACKAGE[1]))]
+    assert manifest['stages']['lnk_parse']['outputs']
+
+    # an interrupted run: the archive is gone, the extracted package is still there
+    (package.out_dir / MANIFEST).write_text(json.dumps(dict(manifest, finished=None)))
+    assert unfinished(tmp_path / 'out', archive.parent) == [archive.resolve()]
+
+    monkeypatch.delenv('STUB_FAIL')
+    before = len(runs())
+    package = parse_package(archive, tmp_path / 'out', tool_path=tools, resume=True)
+    assert [r['tool'] for r in runs()[before:]] == ['PECmd']
+    manifest = json.loads((package.out_dir / MANIFEST).read_text())
+    assert all(stage['status'] == 'done' for stage in manifest['stages'].values())
+    assert list((package.out_dir / 'ProgramExecution' / 'Prefetch').glob('*PECmd_Output.csv'))
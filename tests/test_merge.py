@@ -0,0 +1,31 @@
+import csv
+
+from convert.merge import INSTANCE_COLUMN, merge_csvs, merge_outputs, output_kind
+
+
+def read(path):
+    with path.open(encoding='utf-8', newline='') as fh:
+        return list(csv.reader(fh))
+
+
+def test_outputs_merged_by_kind_with_instance_column(tmp_path):
+    (tmp_path / 'C').mkdir()
+    (tmp_path / 'VSS1').mkdir()
+    (tmp_path / 'C' / '20200101120000_MFTECmd_$MFT_Output.csv').write_text('Name,Size\na.exe,1\nb.exe,2\n')
+    (tmp_path / 'VSS1' / '20200101120105_MFTECmd_$MFT_Output.csv').write_text('Size,Name,Extra\n3,c.exe,x\n')
+
+    merged = merge_outputs({'C': tmp_path / 'C', 'VSS1': tmp_path / 'VSS1'}, tmp_path / 'out')
+    assert merged == [(tmp_path / 'out' / 'MFTECmd_$MFT_Output.csv', 3)]
+    # columns lined up by name
+    assert read(merged[0][0]) == [['Name', 'Size', 'Extra', INSTANCE_COLUMN], ['a.exe', '1', '', 'C'],
+                                  ['b.exe', '2', '', 'C'], ['c.exe', '3', 'x', 'VSS1']]
+    assert output_kind('20200101120000_PECmd_Output.csv') == 'PECmd_Output.csv'
+
+
+def test_ragged_rows_keep_instance_in_its_column(tmp_path):
+    part = tmp_path / 'part.csv'
+    part.write_text('A,B,C\n1,2,3\n1\n1,2,3,4,5\n\n')
+    assert merge_csvs([('C', part)], tmp_path / 'merged.csv') == 3
+    assert read(tmp_path / 'merged.csv') == [['A', 'B', 'C', INSTANCE_COLUMN], ['1', '2', '3', 'C'],
+                                             ['1', '', '', 'C'], ['1', '2', '3', 'C']]
+    assert not (tmp_path / 'merged.csv.tmp').exists()
@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+from PackageParser import parse_package
+from convert.parquet import PARQUET_DIR, convert_file, convert_files, infer_schema, parquet_path
+from search.structured import prefer_parquet
+from search.writer import is_report
+
+pyarrow = pytest.importorskip('pyarrow')
+parquet = pytest.importorskip('pyarrow.parquet')
+
+CSV = ('Id,Size,Ratio,Created,InUse,Code,Serial,Name,Empty\n'
+       '1,4096,0.5,2020-01-01 12:00:00.1234567,True,0012,12345678901234567,a.exe,\n'
+       '2,,1.25,2020-01-02 00:00:00,False,0345,98765432109876543,"b, c.exe",\n'
+       '3,10,2,,True,1000,1,d.exe,\n')
+
+
+def test_column_types_from_every_value(tmp_path):
+    csv_file = tmp_path / 'out.csv'
+    csv_file.write_text(CSV, encoding='utf-8')
+    schema = infer_schema(csv_file, block_size=100)  # several blocks
+    types = {field.name: field.type for field in schema}
+    assert types['Id'] == pyarrow.int64() and types['Size'] == pyarrow.int64()
+    assert types['Ratio'] == pyarrow.float64()
+    assert types['Created'] == pyarrow.timestamp('ns')
+    assert types['InUse'] == pyarrow.bool_()
+    # leading zeros and long whole numbers stay text, as do columns with no values
+    assert types['Code'] == pyarrow.string() and types['Serial'] == pyarrow.string()
+    assert types['Name'] == pyarrow.string() and types['Empty'] == pyarrow.string()
+
+
+def test_convert_keeps_every_value(tmp_path):
+    csv_file = tmp_path / 'out.csv'
+    csv_file.write_text(CSV, encoding='utf-8')
+    assert convert_file(csv_file, tmp_path / 'out.parquet', block_size=100) == 3
+    assert not (tmp_path / 'out.parquet.tmp').exists()
+    table = parquet.read_table(tmp_path / 'out.parquet')
+    assert table.column('Size').to_pylist() == [4096, None, 10]
+    assert table.column('Code').to_pylist() == ['0012', '0345', '1000']
+    assert table.column('Serial').to_pylist()[0] == '12345678901234567'
+    assert table.column('Name').to_pylist() == ['a.exe', 'b, c.exe', 'd.exe']
+    assert table.column('Empty').to_pylist() == [None, None, None]
+
+
+def test_output_tree_mirrored_and_preferred_when_current(tmp_path):
+    root = tmp_path / 'host1'
+    files = []
+    for folder in ('ProgramExecution/Prefetch', 'EventLogs'):
+        (root / folder).mkdir(parents=True)
+        (root / folder / 'Output.csv').write_text(CSV, encoding='utf-8')
+        files.append(root / folder / 'Output.csv')
+
+    results = list(convert_files(files, root))
+    assert sorted((path, rows, error) for path, rows, error in results) == sorted((f, 3, None) for f in files)
+    assert parquet_path(files[0], root) == root / PARQUET_DIR / 'ProgramExecution' / 'Prefetch' / 'Output.parquet'
+    assert prefer_parquet(files, root) == [parquet_path(f, root) for f in files]
+
+    # a CSV written after its Parquet copy (a rerun stage) is searched instead of the stale copy
+    stat = files[1].stat()
+    os.utime(files[1], ns=(stat.st_atime_ns, parquet_path(files[1], root).stat().st_mtime_ns + 10 ** 9))
+    assert prefer_parquet(files, root) == [parquet_path(files[0], root), files[1]]
+
+
+def test_parquet_export_stage(tmp_path, stub_tools, make_package):
+    tools, _ = stub_tools
+    archive = make_package('host1', ['C/Windows/Prefetch/APP.EXE-12345678.pf',
+                                     'C/Windows/AppCompat/Programs/Amcache.hve'])
+    package = parse_package(archive, tmp_path / 'out', tool_path=tools, parquet=True)
+    assert package.errors == 0
+    csv_files = sorted(p for p in package.out_dir.rglob('*.csv') if PARQUET_DIR not in p.parts and not is_report(p))
+    assert csv_files
+    for csv_file in csv_files:
+        table = parquet.read_table(parquet_path(csv_file, package.out_dir))
+        assert table.column('ExecutableName').to_pylist() == ['mimikatz.exe']
@@ -0,0 +1,162 @@
+"""
+Run the parse stages of a small package with stand-in EZ tools that record when they
+run, and check the Scheduler's guarantees.
+"""
+import json
+import re
+import stat
+import sys
+import threading
+import time
+from zipfile import ZipFile
+
+import pytest
+
+import PackageParser
+from runner.scheduler import Scheduler, Stage
+
+TOOL_WORKERS = 3
+# tool paths in the tools folder
+TOOLS = ['MFTECmd.exe', 'AppCompatCacheParser.exe', 'AmcacheParser.exe', 'RecentFileCacheParser.exe', 'PECmd.exe',
+         'RECmd/RECmd.exe', 'EvtxECmd/EvtxECmd.exe', 'SBECmd.exe', 'LECmd.exe', 'JLECmd.exe']
+# stand-in tool: sleeps, then appends one JSON line with its name, arguments, start and end to EVENTS
+STUB = '''#!{python}
+import json, sys, time
+from pathlib import Path
+start = time.time()
+time.sleep({sleep})
+with open({events!r}, 'a') as fh:
+    fh.write(json.dumps({{'tool': Path(sys.argv[0]).stem, 'args': sys.argv[1:], 'start': start,
+                         'end': time.time()}}) + '\\n')
+'''
+PACKAGE = ['C/$MFT', 'C/$Extend/$J', 'VSS1/C/$MFT', 'C/Windows/System32/config/SYSTEM',
+           'C/Windows/System32/config/SOFTWARE', 'C/Windows/AppCompat/Programs/Amcache.hve',
+           'C/Windows/Prefetch/APP.EXE-12345678.pf', 'C/Windows/System32/winevt/Logs/Security.evtx',
+           'VSS1/C/Windows/System32/winevt/Logs/Security.evtx', 'C/Users/user01/NTUSER.DAT',
+           'C/Users/user01/AppData/Roaming/Microsoft/Windows/Recent/doc.lnk']
+# stage each tool runs in, for the log check
+TOOL_STAGES = {'MFTECmd.exe': 'mft_parse', 'AppCompatCacheParser.exe': 'shim_parse',
+               'AmcacheParser.exe': 'amcache_parse', 'PECmd.exe': 'prefetch_parse', 'EvtxECmd.exe': 'winevt_parse',
+               'SBECmd.exe': 'shellbags_parse', 'LECmd.exe': 'lnk_parse'}
+
+
+@pytest.fixture(scope='module')
+def run(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp('run')
+    events = tmp / 'events.jsonl'
+    tools = tmp / 'tools'
+    for tool in TOOLS:
+        path = tools / tool
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(STUB.format(python=sys.executable, sleep=0.3, events=str(events)))
+        path.chmod(path.stat().st_mode | stat.S_IXUSR)
+
+    (tmp / 'src').mkdir()
+    with ZipFile(tmp / 'src' / 'package.zip', 'w') as zf:
+        for name in PACKAGE:
+            zf.writestr(name, b'\0' * 4096)
+
+    PackageParser.PackageParser.toolPath = tools
+    package = PackageParser.PackageParser(tmp / 'src' / 'package.zip', tmp / 'out', tool_workers=TOOL_WORKERS)
+    package.run_all()
+    runs = [json.loads(line) for line in events.read_text().splitlines()]
+    log = (package.out_dir / 'PackageParser.log').read_text(encoding='utf-8').splitlines()
+    return package, runs, log
+
+
+def overlap(a, b):
+    return a['start'] < b['end'] and b['start'] < a['end']
+
+
+def test_every_stage_ran(run):
+    _, runs, log = run
+    assert not [line for line in log if 'ERROR: ' in line]
+    assert {r['tool'] for r in runs} == {'MFTECmd', 'AppCompatCacheParser', 'AmcacheParser', 'PECmd', 'RECmd',
+                                         'EvtxECmd', 'SBECmd', 'LECmd'}
+
+
+def test_tool_workers_cap(run):
+    _, runs, _ = run
+    edges = sorted([(r['start'], 1) for r in runs] + [(r['end'], -1) for r in runs])
+    running = peak = 0
+    for _, step in edges:
+        running += step
+        peak = max(peak, running)
+    assert 1 < peak <= TOOL_WORKERS
+
+
+def test_heavy_stages_never_overlap(run):
+    _, runs, _ = run
+    heavy = [r for r in runs if r['tool'] == 'EvtxECmd' or
+             (r['tool'] == 'MFTECmd' and r['args'][1].strip('"').endswith('$MFT'))]
+    assert {r['tool'] for r in heavy} == {'MFTECmd', 'EvtxECmd'}
+    assert not [(a, b) for n, a in enumerate(heavy) for b in heavy[n + 1:] if overlap(a, b)]
+
+
+def test_needs_order(run):
+    _, runs, _ = run
+
+    def tool(name):
+        return [r for r in runs if r['tool'] == name]
+
+    assert max(r['end'] for r in tool('AppCompatCacheParser')) <= min(r['start'] for r in tool('RECmd'))
+    assert max(r['end'] for r in tool('RECmd')) <= min(r['start'] for r in tool('SBECmd'))
+
+
+def test_stage_log_blocks(run):
+    package, _, log = run
+    blocks = []  # (stage, lines) in log order. a stage's lines end with its "finished in" line
+    lines = []
+    for line in log:
+        lines.append(line)
+        finished = re.search(r'INFO: (\S+) finished in', line)
+        if finished:
+            blocks.append((finished.group(1), lines))
+            lines = []
+
+    declared = [stage.name for stage in package.stages()]
+    assert [name for name, _ in blocks if ':' not in name] == declared
+    found = set()
+    for name, lines in blocks:
+        stage = name.split(':')[0]
+        for line in lines:
+            tool = re.search(r'Running (\S+)$', line)
+            if tool:
+                assert TOOL_STAGES[tool.group(1)] == stage, line
+                found.add(tool.group(1))
+            if 'Parsing Registry Hives' in line:
+                assert stage == 'reg_parse', line
+    assert found == set(TOOL_STAGES)
+
+
+def test_scheduler_limits_without_tools():
+    lock = threading.Lock()
+    running = []
+    spans = {}
+
+    def work(name):
+        def func():
+            with lock:
+                running.append(name)
+                spans[name] = [time.monotonic(), len(running), [n for n in running if n.startswith('heavy')]]
+            time.sleep(0.05)
+            with lock:
+                running.remove(name)
+                spans[name].append(time.monotonic())
+        return func
+
+    stages = [Stage(f'heavy{n}', work(f'heavy{n}'), resource='heavy') for n in range(3)]
+    stages += [Stage(f'light{n}', work(f'light{n}')) for n in range(6)]
+    stages.append(Stage('last', work('last'), needs=tuple(s.name for s in stages)))
+    results = list(Scheduler(4, {'heavy': 1}).run(stages))
+
+    assert [r.stage.name for r in results] == [s.name for s in stages]
+    assert all(r.error is None for r in results)
+    assert max(count for _, count, _, _ in spans.values()) <= 4
+    assert all(len(heavy) <= 1 for _, _, heavy, _ in spans.values())
+    assert spans['last'][0] >= max(end for name, (_, _, _, end) in spans.items() if name != 'last')
+
+
+def test_scheduler_rejects_unknown_needs():
+    with pytest.raises(ValueError):
+        list(Scheduler().run([Stage('a', lambda: None, needs=('missing',))]))
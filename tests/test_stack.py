@@ -0,0 +1,73 @@
+import gzip
+import os
+
+from PackageParser import parse_package
+from stack.store import STORE, StackStore
+
+AMCACHE = 'FullPath,Name,SHA1\n'
+PREFETCH = 'ExecutableName,Hash,RunCount\n'
+
+
+def package(root, host, amcache, prefetch=None):
+    out = root / host
+    (out / 'ProgramExecution/Amcache').mkdir(parents=True, exist_ok=True)
+    (out / 'RunManifest.json').write_text('{}')
+    (out / 'ProgramExecution/Amcache/20200101_Amcache_UnassociatedFileEntries.csv').write_text(AMCACHE + amcache)
+    if prefetch is not None:
+        (out / 'ProgramExecution/Prefetch').mkdir(parents=True, exist_ok=True)
+        with gzip.open(out / 'ProgramExecution/Prefetch/20200101_PECmd_Output.csv.gz', 'wt') as fh:
+            fh.write(PREFETCH + prefetch)
+    return out
+
+
+def rarest(store, **kwargs):
+    return [(r['kind'], r['path'] or r['name'], r['hosts'], r['count'], r['host_names'])
+            for r in store.least_frequent(**kwargs)]
+
+
+def test_items_counted_once_per_host(tmp_path):
+    common = 'C:\\Windows\\explorer.exe,explorer.exe,aa\n'
+    package(tmp_path, 'host1', common + 'C:\\Temp\\EVIL.exe,evil.exe,bb\nc:\\temp\\evil.exe,EVIL.EXE,BB\n',
+            'EVIL.EXE,1234ABCD,3\n')
+    package(tmp_path, 'host2', common)
+    package(tmp_path, 'host3', common)
+    (tmp_path / 'not_a_package').mkdir()
+
+    with StackStore(tmp_path / STORE) as store:
+        store.update(tmp_path)
+        assert store.host_count() == 3
+        # lowercased, so both evil.exe rows are one item, and the compressed Prefetch CSV is read
+        assert rarest(store, max_hosts=1) == [('amcache', 'c:\\temp\\evil.exe', 1, 2, ['host1']),
+                                              ('prefetch', 'evil.exe', 1, 1, ['host1'])]
+        assert rarest(store, kind='amcache', limit=5)[-1] == \
+            ('amcache', 'c:\\windows\\explorer.exe', 3, 3, ['host1', 'host2', 'host3'])
+
+
+def test_changed_and_removed_output(tmp_path):
+    host1 = package(tmp_path, 'host1', 'C:\\a.exe,a.exe,\nC:\\b.exe,b.exe,\n')
+    package(tmp_path, 'host2', 'C:\\a.exe,a.exe,\n')
+    with StackStore(tmp_path / STORE) as store:
+        store.update(tmp_path)
+        # unchanged CSVs aren't read again
+        assert store.update_host(host1) == (0, 0)
+
+        amcache = next((host1 / 'ProgramExecution/Amcache').iterdir())
+        amcache.write_text(AMCACHE + 'C:\\a.exe,a.exe,\nC:\\c.exe,c.exe,\n')
+        os.utime(amcache, ns=(1, 1))
+        assert store.update_host(host1) == (1, 2)
+        assert rarest(store) == [('amcache', 'c:\\c.exe', 1, 1, ['host1']),
+                                 ('amcache', 'c:\\a.exe', 2, 2, ['host1', 'host2'])]
+
+        store.remove_host('host1')
+        assert store.host_count() == 1
+        assert rarest(store) == [('amcache', 'c:\\a.exe', 1, 1, ['host2'])]
+
+
+def test_package_added_by_stack_stage(tmp_path, stub_tools, make_package):
+    tools, _ = stub_tools
+    package = parse_package(make_package('host1', ['C/Windows/Prefetch/APP.EXE-12345678.pf']), tmp_path / 'out',
+                            tool_path=tools, stack=True)
+    assert package.errors == 0
+    with StackStore(tmp_path / 'out' / STORE) as store:
+        assert store.host_count() == 1
+        assert store.update_host(package.out_dir) == (0, 0)
@@ -0,0 +1,61 @@
+import pytest
+
+from search.engine import RuleSet
+from search.structured import scan_columns
+
+
+def test_row_numbers_count_skipped_records(tmp_path):
+    csv_file = tmp_path / 'Prefetch' / 'PECmd_Output.csv'
+    csv_file.parent.mkdir()
+    csv_file.write_text('Name,Path\n'
+                        'a.exe,C:\\a.exe\n'
+                        'bad,row,with,too,many,fields\n'
+                        '\n'
+                        'mimikatz.exe,"C:\\Temp\n\\mimikatz.exe"\n'
+                        'b.exe,C:\\mimikatz.exe\n', encoding='utf-8')
+    ruleset = RuleSet({'(?i)mimikatz': 'Credential harvesting'}, {})
+    assert [detail[:2] for _, detail in scan_columns(csv_file, ruleset)] == [('Name', 4), ('Path', 4), ('Path', 5)]
+
+
+def test_regex_and_string_with_the_same_text_keep_their_own_columns(tmp_path):
+    csv_file = tmp_path / 'Amcache' / 'FileEntries.csv'
+    csv_file.parent.mkdir()
+    csv_file.write_text('Name,Path\npsexec,psexec\n', encoding='utf-8')
+    ruleset = RuleSet({'psexec': 'regex'}, {'psexec': 'string'},
+                      {('regex', 'psexec'): 'Name', ('string', 'psexec'): 'Path'})
+    hits = [(ruleset.rules[idx][1], detail[0]) for idx, detail in scan_columns(csv_file, ruleset)]
+    assert hits == [('regex', 'Name'), ('string', 'Path')]
+
+
+def test_every_copy_of_a_repeated_column_is_searched(tmp_path):
+    csv_file = tmp_path / 'EventLogs' / 'EvtxECmd_Output.csv'
+    csv_file.parent.mkdir()
+    csv_file.write_text('PayloadData,Computer,PayloadData\nmimikatz.exe,host,x\nx,host,mimikatz.exe\n', encoding='utf-8')
+    ruleset = RuleSet({}, {'mimikatz': 'Credential harvesting'}, {('string', 'mimikatz'): 'PayloadData'})
+    assert [detail[:3] for _, detail in scan_columns(csv_file, ruleset)] == [
+        ('PayloadData', 1, 'mimikatz.exe'), ('PayloadData', 2, 'mimikatz.exe')]
+
+
+def test_parquet_matches_csv(tmp_path):
+    pyarrow = pytest.importorskip('pyarrow')
+    import pyarrow.parquet
+
+    folder = tmp_path / 'EventLogs'
+    folder.mkdir()
+    table = pyarrow.table([pyarrow.array(['mimikatz.exe', 'x', None]), pyarrow.array([4624, 4688, 1]),
+                           pyarrow.array(['x', 'C:\\mimikatz.exe', 'mimikatz'])],
+                          names=['PayloadData', 'EventId', 'PayloadData'])
+    pyarrow.parquet.write_table(table, folder / 'EvtxECmd_Output.parquet')
+    (folder / 'EvtxECmd_Output.csv').write_text('PayloadData,EventId,PayloadData\nmimikatz.exe,4624,x\n'
+                                               'x,4688,C:\\mimikatz.exe\n,1,mimikatz\n', encoding='utf-8')
+    ruleset = RuleSet({'^46': 'logon'}, {'mimikatz': 'Credential harvesting'},
+                      {('string', 'mimikatz'): 'PayloadData', ('regex', '^46'): 'EventId'})
+
+    def hits(file, **kwargs):
+        return [(ruleset.rules[idx][1], detail) for idx, detail in scan_columns(file, ruleset, **kwargs)]
+
+    expected = hits(folder / 'EvtxECmd_Output.csv')
+    assert [detail[:2] for _, detail in expected] == [('PayloadData', 1), ('EventId', 1), ('EventId', 2),
+                                                      ('PayloadData', 2), ('PayloadData', 3)]
+    assert hits(folder / 'EvtxECmd_Output.parquet') == expected
+    assert hits(folder / 'EvtxECmd_Output.parquet', chunk_rows=1) == expected
@@ -0,0 +1,80 @@
+import subprocess
+import sys
+import time
+
+import pytest
+
+from runner import tools
+from runner.tools import MAX_TIMEOUT, MB, MIN_TIMEOUT, SLACK, ToolTimeouts, run_streamed
+
+
+def test_fixed_timeout_until_a_tool_has_history(tmp_path):
+    timeouts = ToolTimeouts(tmp_path / 'ToolRates.json')
+    assert timeouts.timeout('RECmd.exe', 5 * MB, 300) == 300
+    assert timeouts.timeout('RECmd.exe', None, 300) == 300
+
+
+def test_small_finished_runs_are_not_recorded(tmp_path):
+    timeouts = ToolTimeouts(tmp_path / 'ToolRates.json')
+    timeouts.record('SBECmd.exe', MB // 2, 30)
+    assert timeouts.timeout('SBECmd.exe', MB // 2, 1200) == 1200
+
+
+def test_timeout_uses_the_median_rate(tmp_path):
+    timeouts = ToolTimeouts(tmp_path / 'ToolRates.json')
+    for seconds in (10, 10, 10, 10000):  # 10 MB/s, and one run that stalled
+        timeouts.record('MFTECmd.exe', 100 * MB, seconds)
+    assert timeouts.timeout('MFTECmd.exe', 1000 * MB, 1200) == MIN_TIMEOUT + SLACK * 100
+
+
+def test_timeouts_escalate_until_the_tool_finishes(tmp_path):
+    timeouts = ToolTimeouts(tmp_path / 'ToolRates.json')
+    timeouts.record('MFTECmd.exe', 100 * MB, 10)
+    normal = timeouts.timeout('MFTECmd.exe', 100 * MB, 1200)
+
+    # a timeout on a tiny input doesn't leave a near zero rate behind
+    timeouts.timed_out('MFTECmd.exe')
+    assert timeouts.rates['MFTECmd.exe'] == [10.0]
+    assert timeouts.timeout('MFTECmd.exe', 100 * MB, 1200) == 2 * normal
+    # remembered for other packages written to the same folder
+    assert ToolTimeouts(tmp_path / 'ToolRates.json').timeout('MFTECmd.exe', 100 * MB, 1200) == 2 * normal
+    for _ in range(10):
+        timeouts.timed_out('MFTECmd.exe')
+    assert timeouts.timeout('MFTECmd.exe', 100 * MB, 1200) == tools.MAX_ESCALATION * normal
+    assert timeouts.timeout('MFTECmd.exe', 10 ** 6 * MB, 1200) == MAX_TIMEOUT
+
+    # the fixed timeout escalates too, and a finished run, even a small one, resets it
+    timeouts.timed_out('RECmd.exe')
+    assert timeouts.timeout('RECmd.exe', None, 300) == 600
+    timeouts.record('RECmd.exe', MB // 2, 30)
+    timeouts.record('MFTECmd.exe', 100 * MB, 10)
+    assert timeouts.timeout('RECmd.exe', None, 300) == 300
+    assert timeouts.timeout('MFTECmd.exe', 100 * MB, 1200) == normal
+
+
+def test_rates_written_before_escalation_still_load(tmp_path):
+    path = tmp_path / 'ToolRates.json'
+    path.write_text('{"MFTECmd.exe": [10.0]}')
+    assert ToolTimeouts(path).timeout('MFTECmd.exe', 100 * MB, 1200) == MIN_TIMEOUT + SLACK * 10
+
+
+def test_output_held_open_by_a_child_doesnt_hang(monkeypatch):
+    monkeypatch.setattr(tools, 'READ_GRACE', 0.5)
+    # the tool exits at once, leaving a child that keeps its stdout open for a while
+    child = 'import time; time.sleep(5)'
+    command = [sys.executable, '-c', f'import subprocess, sys; subprocess.Popen([sys.executable, "-c", {child!r}]); '
+                                     f'print("done")']
+    lines = []
+    start = time.monotonic()
+    spr, _ = run_streamed(command, 60, lines.append)
+    assert time.monotonic() - start < 4
+    assert spr.returncode == 0
+    assert lines[0] == 'done'
+    assert 'stopped reading' in lines[-1]
+
+
+def test_timeout_kills_the_tool():
+    start = time.monotonic()
+    with pytest.raises(subprocess.TimeoutExpired):
+        run_streamed([sys.executable, '-c', 'import time; time.sleep(30)'], 0.5, lambda line: None)
+    assert time.monotonic() - start < 10
@@ -0,0 +1,66 @@
+import csv
+import json
+import time
+
+from runner.watch import STATUS, SUMMARY, IntakeWatcher
+
+
+def process(archive):
+    """stand-in for run_package. packages named bad* fail"""
+    status = 'FAILED' if archive.name.startswith('bad') else 'OK'
+    return {'Package': archive.name, 'Status': status, 'Duration': '0:00:00', 'Errors': 0, 'Output': '',
+            'Message': ''}
+
+
+def test_archives_queued_once_they_stop_changing(tmp_path):
+    intake = tmp_path / 'intake'
+    intake.mkdir()
+    watcher = IntakeWatcher(intake, tmp_path / 'out', process, settle=0.3)
+    (intake / 'notes.txt').write_text('not a package')
+    archive = intake / 'host1.zip'
+    archive.write_bytes(b'PK' * 100)
+
+    watcher.scan()
+    assert list(watcher.settling) == [archive]
+    with archive.open('ab') as fh:  # still being copied
+        fh.write(b'more')
+    time.sleep(0.35)
+    watcher.scan()
+    assert not watcher.queue
+    time.sleep(0.35)
+    watcher.scan()
+    assert [path for path, _ in watcher.queue] == [archive]
+    assert not watcher.settling
+
+
+def test_packages_processed_and_reported(tmp_path):
+    intake = tmp_path / 'intake'
+    intake.mkdir()
+    for name in ('good1.zip', 'bad1.7z', 'good2.tar.gz'):
+        (intake / name).write_bytes(b'archive')
+    out = tmp_path / 'out'
+    done = []
+    watcher = IntakeWatcher(intake, out, process, jobs=2, settle=0.1, poll=0.05, on_done=done.append)
+    start = time.monotonic()
+    watcher.run(stop=lambda: len(done) == 3 or time.monotonic() - start > 30)
+
+    assert sorted(s['Package'] for s in done) == ['bad1.7z', 'good1.zip', 'good2.tar.gz']
+    assert watcher.counts == {'done': 2, 'failed': 1}
+    with (out / SUMMARY).open(newline='', encoding='utf-8') as fh:
+        assert sorted((row['Package'], row['Status']) for row in csv.DictReader(fh)) == [
+            ('bad1.7z', 'FAILED'), ('good1.zip', 'OK'), ('good2.tar.gz', 'OK')]
+    status = json.loads((out / STATUS).read_text())
+    assert (status['state'], status['done'], status['failed'], status['queue_depth']) == ('stopped', 2, 1, 0)
+    assert len(status['recent']) == 3
+
+    # the failed package stays in the intake folder, but isn't processed again until it changes
+    time.sleep(0.2)
+    watcher.scan()
+    time.sleep(0.2)
+    watcher.scan()
+    assert not watcher.queue and not watcher.settling
+    (intake / 'bad1.7z').write_bytes(b'fixed archive')
+    watcher.scan()
+    time.sleep(0.2)
+    watcher.scan()
+    assert [path.name for path, _ in watcher.queue] == ['bad1.7z']
@@ -0,0 +1,13 @@
+from pathlib import Path
+
+from search.writer import is_report
+
+
+def test_search_output_and_run_reports_are_not_searched():
+    out = Path('out/host')
+    assert is_report(out / 'SearchResults' / 'SearchResults_20240101000000.csv')
+    assert is_report(out / 'SearchResults' / 'SearchSummary_20240101000000.csv')
+    assert is_report(out / 'SearchResults' / 'renamed.csv')
+    assert is_report(out / 'RunMetrics.csv')
+    assert is_report(Path('out') / 'BatchSummary_20240101000000.csv.gz')
+    assert not is_report(out / 'ProgramExecution' / 'Amcache' / '20240101000000_Amcache_FileEntries.csv')